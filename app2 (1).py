@@ -4,13 +4,30 @@ import math
 import time
 import datetime
 import os
+import sys
+import argparse
 import threading
 import csv
+import hashlib
+import sqlite3
+import json
+import re
+import collections
+import queue
+import atexit
+import subprocess
+import multiprocessing
+import multiprocessing.connection
+from multiprocessing import shared_memory
 try:
     import requests
 except Exception:
     requests = None
-from flask import Flask, Response, jsonify, render_template_string, request
+try:
+    import onnxruntime
+except Exception:
+    onnxruntime = None
+from flask import Flask, Response, abort, jsonify, render_template_string, request
 
 # ==========================================
 # 1. PROFESSIONAL SURVEILLANCE DASHBOARD
@@ -119,7 +136,9 @@ HTML_TEMPLATE = """
         <!-- Top Toolbar -->
         <header class="h-16 bg-zinc-900 border-b border-zinc-800 flex items-center justify-between px-6">
             <div class="flex items-center gap-4">
-                <h2 class="text-sm font-semibold text-white">CAM-01: Device Feed</h2>
+                <select id="camera-select" onchange="selectCamera(this.value)" class="bg-zinc-800 text-sm font-semibold text-white px-2 py-1 rounded border border-zinc-700">
+                    <option value="">CAM-01: Device Feed</option>
+                </select>
                 <span class="bg-zinc-800 text-zinc-400 text-xs px-2 py-1 rounded border border-zinc-700">1280x720 • 30FPS • HD+</span>
             </div>
             
@@ -182,7 +201,7 @@ HTML_TEMPLATE = """
                     <div class="panel rounded-lg p-4 flex flex-col gap-3">
                         <div class="flex items-center justify-between">
                             <h3 class="text-sm font-semibold text-zinc-300">Live Controls</h3>
-                            <div class="text-xs text-zinc-500 font-mono">CAM-01</div>
+                            <div class="text-xs text-zinc-500 font-mono" id="camera-label">CAM-01</div>
                         </div>
 
                         <div class="flex gap-2">
@@ -192,7 +211,7 @@ HTML_TEMPLATE = """
 
                         <div class="flex gap-2">
                             <button id="audio-btn" onclick="toggleAudio()" class="flex-1 px-3 py-2 bg-zinc-800 text-zinc-300 rounded">Toggle Audio</button>
-                            <button id="snapshot-btn" onclick="fetch('/api/trigger_manual', {method:'POST'})" class="px-3 py-2 bg-zinc-700 text-white rounded">Snapshot</button>
+                            <button id="snapshot-btn" onclick="triggerManualAlert()" class="px-3 py-2 bg-zinc-700 text-white rounded">Snapshot</button>
                         </div>
                     </div>
 
@@ -264,6 +283,11 @@ HTML_TEMPLATE = """
                             <!-- Rows injected via JS -->
                         </tbody>
                     </table>
+                    <div class="p-4 text-center">
+                        <button id="reports-more" onclick="loadMoreReports()" class="hidden text-xs bg-zinc-800 hover:bg-zinc-700 text-zinc-300 px-4 py-2 rounded border border-zinc-600 transition">
+                            Load older incidents
+                        </button>
+                    </div>
                 </div>
             </div>
         </div>
@@ -384,46 +408,70 @@ HTML_TEMPLATE = """
         }
 
         // --- REPORTS TABLE LOGIC ---
-        function renderReportsTable() {
-            const tbody = document.getElementById('reports-body');
-            tbody.innerHTML = "";
+        // Pages through /api/incidents (full history, newest first) by cursor
+        let reportsCursor = null;
+
+        function buildReportRow(log) {
+            let levelClass = "text-zinc-300";
+            let bgClass = "";
+            let icon = "";
+            
+            if(log.level === "WARNING") { 
+                levelClass = "text-amber-400 font-bold"; 
+                bgClass="bg-amber-900/10"; 
+                icon = "<i class='fas fa-exclamation-triangle mr-2'></i>";
+            }
+            if(log.level === "CRITICAL") { 
+                levelClass = "text-red-500 font-bold"; 
+                bgClass="bg-red-900/10"; 
+                icon = "<i class='fas fa-radiation mr-2'></i>";
+            }
             
-            fetch('/api/stats')
+            const row = document.createElement('tr');
+            row.className = `hover:bg-zinc-800/50 transition border-b border-zinc-800 last:border-0 ${bgClass}`;
+            row.innerHTML = `
+                <td class="p-4 font-mono text-zinc-400 text-xs"></td>
+                <td class="p-4 ${levelClass}">${icon}<span></span></td>
+                <td class="p-4 text-zinc-200"></td>
+                <td class="p-4 text-zinc-500 text-xs"></td>
+            `;
+            const cells = row.querySelectorAll('td');
+            cells[0].innerText = log.timestamp;
+            cells[1].querySelector('span').innerText = log.level;
+            cells[2].innerText = log.msg;
+            cells[3].innerText = log.location || 'Sector 4';
+            return row;
+        }
+
+        function fetchReports(append) {
+            const tbody = document.getElementById('reports-body');
+            const more = document.getElementById('reports-more');
+            const params = new URLSearchParams({ limit: 50 });
+            if (append && reportsCursor) params.set('cursor', reportsCursor);
+
+            fetch(`/api/incidents?${params}`)
                 .then(r => r.json())
                 .then(data => {
-                    const logs = data.logs;
-                    if(logs.length === 0) {
-                        tbody.innerHTML = '<tr><td colspan="4" class="p-8 text-center text-zinc-500">No security incidents recorded in current session.</td></tr>';
-                        return;
+                    if (!append) tbody.innerHTML = "";
+                    if(!append && data.incidents.length === 0) {
+                        tbody.innerHTML = '<tr><td colspan="4" class="p-8 text-center text-zinc-500">No security incidents recorded.</td></tr>';
                     }
-                    
-                    logs.forEach(log => {
-                        let levelClass = "text-zinc-300";
-                        let bgClass = "";
-                        let icon = "";
-                        
-                        if(log.level === "WARNING") { 
-                            levelClass = "text-amber-400 font-bold"; 
-                            bgClass="bg-amber-900/10"; 
-                            icon = "<i class='fas fa-exclamation-triangle mr-2'></i>";
-                        }
-                        if(log.level === "CRITICAL") { 
-                            levelClass = "text-red-500 font-bold"; 
-                            bgClass="bg-red-900/10"; 
-                            icon = "<i class='fas fa-radiation mr-2'></i>";
-                        }
-                        
-                        const row = `
-                            <tr class="hover:bg-zinc-800/50 transition border-b border-zinc-800 last:border-0 ${bgClass}">
-                                <td class="p-4 font-mono text-zinc-400 text-xs">${log.time}</td>
-                                <td class="p-4 ${levelClass}">${icon}${log.level}</td>
-                                <td class="p-4 text-zinc-200">${log.msg}</td>
-                                <td class="p-4 text-zinc-500 text-xs">${log.location || 'Sector 4'}</td>
-                            </tr>
-                        `;
-                        tbody.innerHTML += row;
-                    });
-                });
+                    const rows = document.createDocumentFragment();
+                    data.incidents.forEach(log => rows.appendChild(buildReportRow(log)));
+                    tbody.appendChild(rows);
+                    reportsCursor = data.next_cursor;
+                    more.classList.toggle('hidden', !reportsCursor);
+                })
+                .catch(e => console.error(e));
+        }
+
+        function renderReportsTable() {
+            reportsCursor = null;
+            fetchReports(false);
+        }
+
+        function loadMoreReports() {
+            fetchReports(true);
         }
         
         function refreshReports() {
@@ -433,6 +481,39 @@ HTML_TEMPLATE = """
             setTimeout(() => btn.classList.remove('fa-spin'), 500);
         }
 
+        // --- CAMERA SELECTION ---
+        let currentCamera = null;
+
+        function cameraUrl(base) {
+            return currentCamera ? `${base}/${encodeURIComponent(currentCamera)}` : base;
+        }
+
+        function selectCamera(camId) {
+            currentCamera = camId || null;
+            document.getElementById('camera-img').src = cameraUrl('/video_feed');
+            document.getElementById('camera-label').innerText = currentCamera || 'CAM-01';
+            connectEvents();
+        }
+
+        fetch('/api/cameras')
+            .then(r => r.json())
+            .then(data => {
+                const select = document.getElementById('camera-select');
+                select.innerHTML = "";
+                data.cameras.forEach(cam => {
+                    const opt = document.createElement('option');
+                    opt.value = cam.id;
+                    opt.innerText = `${cam.id.toUpperCase()}: ${cam.location}`;
+                    select.appendChild(opt);
+                });
+                if (data.cameras.length > 0) {
+                    currentCamera = data.cameras[0].id;
+                    document.getElementById('camera-label').innerText = currentCamera;
+                    connectEvents();
+                }
+            })
+            .catch(e => console.error(e));
+
         // --- STATE MANAGEMENT ---
         let isNightMode = true;
         let audioEnabled = false;
@@ -442,7 +523,7 @@ HTML_TEMPLATE = """
         // --- MANUAL TRIGGER ---
         async function triggerManualAlert() {
             try {
-                await fetch('/api/trigger_manual', { method: 'POST' });
+                await fetch(cameraUrl('/api/trigger_manual'), { method: 'POST' });
             } catch (e) { console.error(e); }
         }
 
@@ -518,73 +599,129 @@ HTML_TEMPLATE = """
             lastBeepTime = now;
         }
 
-        // --- DATA FETCHING ---
-        setInterval(async () => {
-            try {
-                const response = await fetch('/api/stats');
-                const data = await response.json();
-                updateDashboard(data);
-            } catch (e) { console.error(e); }
-        }, 500);
+        // --- DATA PUSH (Server-Sent Events) ---
+        // The server sends a snapshot once, then only deltas. EventSource
+        // reconnects by itself and resumes from the last event id it saw.
+        let eventSource = null;
+        let pollTimer = null;
+        let currentStatus = "SAFE";
+        const MAX_LOGS = 20;
+
+        function connectEvents() {
+            // Switching cameras reconnects: drop the previous camera's stream or poller first
+            if (eventSource) eventSource.close();
+            eventSource = null;
+            clearInterval(pollTimer);
+            pollTimer = null;
+            if (!window.EventSource) {
+                // Very old browsers: fall back to polling the full state
+                pollTimer = setInterval(async () => {
+                    try {
+                        const response = await fetch(cameraUrl('/api/stats'));
+                        updateDashboard(await response.json());
+                    } catch (e) { console.error(e); }
+                }, 500);
+                return;
+            }
+            eventSource = new EventSource(cameraUrl('/api/events'));
+            eventSource.addEventListener('snapshot', e => updateDashboard(JSON.parse(e.data)));
+            eventSource.addEventListener('status', e => {
+                const data = JSON.parse(e.data);
+                renderStatus(data.status, data.message);
+            });
+            eventSource.addEventListener('counts', e => {
+                const data = JSON.parse(e.data);
+                renderCounts(data.men_count, data.women_count);
+            });
+            eventSource.addEventListener('log', e => prependLog(JSON.parse(e.data)));
+        }
+        connectEvents();
+
+        // Keep the siren going for as long as the camera stays CRITICAL
+        setInterval(() => { if (currentStatus === "CRITICAL") playSiren(); }, 500);
 
         function updateDashboard(data) {
-            document.getElementById('count-men').innerText = data.men_count;
-            document.getElementById('count-women').innerText = data.women_count;
+            renderCounts(data.men_count, data.women_count);
+            renderStatus(data.status, data.message);
+            renderLogs(data.logs);
+        }
+
+        function renderCounts(men, women) {
+            document.getElementById('count-men').innerText = men;
+            document.getElementById('count-women').innerText = women;
+        }
 
+        function renderStatus(status, message) {
             const riskDisplay = document.getElementById('risk-display');
             const msgDisplay = document.getElementById('msg-display');
             const vidContainer = document.getElementById('video-container');
+            currentStatus = status;
             
-            riskDisplay.innerText = data.status;
-            msgDisplay.innerText = data.message;
+            riskDisplay.innerText = status;
+            msgDisplay.innerText = message;
 
             // Reset Styles
             riskDisplay.className = "text-4xl font-bold tracking-tight transition-colors duration-300";
             vidContainer.classList.remove('alert-active');
 
-            if (data.status === "SAFE") {
+            if (status === "SAFE") {
                 riskDisplay.classList.add("text-emerald-500");
                 msgDisplay.className = "text-lg font-medium text-emerald-100";
-            } else if (data.status === "WARNING") {
+            } else if (status === "WARNING") {
                 riskDisplay.classList.add("text-amber-500");
                 msgDisplay.className = "text-lg font-medium text-amber-100";
-            } else if (data.status === "CRITICAL") {
+            } else if (status === "CRITICAL") {
                 riskDisplay.classList.add("text-red-500");
                 msgDisplay.className = "text-lg font-medium text-red-100";
                 vidContainer.classList.add('alert-active');
                 playSiren();
             }
+        }
 
-            // Logs in Sidebar
-            const logContainer = document.getElementById('log-container');
-            const logCount = document.getElementById('log-count');
+        function buildLogItem(log) {
+            let borderClass = "border-zinc-700";
+            let icon = "fa-info-circle text-blue-500";
             
-            if (data.logs.length > 0) {
-                logContainer.innerHTML = "";
-                logCount.innerText = data.logs.length;
-                
-                data.logs.forEach(log => {
-                    let borderClass = "border-zinc-700";
-                    let icon = "fa-info-circle text-blue-500";
-                    
-                    if(log.level === "WARNING") { borderClass = "border-amber-500"; icon = "fa-exclamation-triangle text-amber-500"; }
-                    if(log.level === "CRITICAL") { borderClass = "border-red-500"; icon = "fa-bell text-red-500"; }
-
-                    const logItem = `
-                        <div class="bg-zinc-800/50 p-2.5 rounded border-l-2 ${borderClass} flex gap-2 items-start text-xs">
-                            <div class="mt-0.5"><i class="fas ${icon}"></i></div>
-                            <div class="flex-1">
-                                <div class="flex justify-between">
-                                    <span class="font-medium text-zinc-200">${log.msg}</span>
-                                    <span class="text-zinc-500 font-mono">${log.time}</span>
-                                </div>
-                                <div class="text-[10px] text-zinc-500 mt-0.5">Loc: ${log.location || 'Unknown'}</div>
-                            </div>
-                        </div>
-                    `;
-                    logContainer.innerHTML += logItem;
-                });
+            if(log.level === "WARNING") { borderClass = "border-amber-500"; icon = "fa-exclamation-triangle text-amber-500"; }
+            if(log.level === "CRITICAL") { borderClass = "border-red-500"; icon = "fa-bell text-red-500"; }
+
+            const item = document.createElement('div');
+            item.className = `log-item bg-zinc-800/50 p-2.5 rounded border-l-2 ${borderClass} flex gap-2 items-start text-xs`;
+            item.innerHTML = `
+                <div class="mt-0.5"><i class="fas ${icon}"></i></div>
+                <div class="flex-1">
+                    <div class="flex justify-between">
+                        <span class="font-medium text-zinc-200"></span>
+                        <span class="text-zinc-500 font-mono"></span>
+                    </div>
+                    <div class="log-loc text-[10px] text-zinc-500 mt-0.5"></div>
+                </div>
+            `;
+            const spans = item.querySelectorAll('span');
+            spans[0].innerText = log.msg;
+            spans[1].innerText = log.time;
+            item.querySelector('.log-loc').innerText = `Loc: ${log.location || 'Unknown'}`;
+            return item;
+        }
+
+        // Logs in Sidebar: full render on snapshot, one node per new entry afterwards
+        function renderLogs(logs) {
+            const logContainer = document.getElementById('log-container');
+            logContainer.innerHTML = "";
+            if (logs.length === 0) {
+                logContainer.innerHTML = '<div class="text-center text-zinc-600 text-xs mt-10">No events recorded.</div>';
             }
+            logs.forEach(log => logContainer.appendChild(buildLogItem(log)));
+            document.getElementById('log-count').innerText = logs.length;
+        }
+
+        function prependLog(log) {
+            const logContainer = document.getElementById('log-container');
+            if (!logContainer.querySelector('.log-item')) logContainer.innerHTML = "";
+            logContainer.insertBefore(buildLogItem(log), logContainer.firstChild);
+            const items = logContainer.querySelectorAll('.log-item');
+            for (let i = MAX_LOGS; i < items.length; i++) items[i].remove();
+            document.getElementById('log-count').innerText = Math.min(items.length, MAX_LOGS);
         }
     </script>
 </body>
@@ -599,22 +736,27 @@ app = Flask(__name__)
 # System Settings
 CAMERA_LOCATION_NAME = "Sector 4 Entrance"
 IS_NIGHT_SIMULATION = True 
-MANUAL_ALERT_ACTIVE = False
 CSV_LOG_FILE = "security_events.csv"
 
-# Ensure CSV Log exists
-if not os.path.exists(CSV_LOG_FILE):
-    with open(CSV_LOG_FILE, mode='w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(["Timestamp", "Level", "Message", "Location"])
-
-dashboard_state = {
-    "status": "SAFE",
-    "message": "System Active",
-    "men_count": 0,
-    "women_count": 0,
-    "logs": []
-}
+# Audit log writer: group commit thresholds, fsync policy ("always", "critical", "never"), rotation size
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "50"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+AUDIT_FSYNC = os.getenv("AUDIT_FSYNC", "critical")
+AUDIT_ROTATE_BYTES = int(os.getenv("AUDIT_ROTATE_BYTES", str(50 * 1024 * 1024)))
+AUDIT_QUEUE_MAX = 10000
+
+# Queryable copy of the audit trail behind /api/incidents
+INCIDENT_DB_FILE = os.getenv("INCIDENT_DB", "incidents.db")
+INCIDENT_PAGE_MAX = 500
+
+def new_dashboard_state():
+    return {
+        "status": "SAFE",
+        "message": "System Active",
+        "men_count": 0,
+        "women_count": 0,
+        "logs": []
+    }
 
 # --- Twilio SOS Configuration (use environment variables) ---
 # Set these in your environment: TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN,
@@ -623,8 +765,15 @@ TWILIO_ACCOUNT_SID = "**********"
 TWILIO_AUTH_TOKEN = "***********"
 TWILIO_FROM_NUMBER = "+122*****15"
 SOS_TO_NUMBER = "+**********"
+# Per-camera: at most one SOS per SOS_THROTTLE_SECONDS, later alerts are summarised in the next one
 SOS_THROTTLE_SECONDS = int(os.getenv("SOS_THROTTLE_SECONDS", "60"))
-last_sos_time = 0
+# SOS delivery: transport ("twilio" or "http" to post to SOS_HTTP_URL), outbox and retry backoff
+SOS_TRANSPORT = os.getenv("SOS_TRANSPORT", "twilio")
+SOS_HTTP_URL = os.getenv("SOS_HTTP_URL", "http://127.0.0.1:8080/sms")
+SOS_OUTBOX_DIR = os.getenv("SOS_OUTBOX_DIR", "sos_outbox")
+SOS_MAX_ATTEMPTS = int(os.getenv("SOS_MAX_ATTEMPTS", "8"))
+SOS_RETRY_BASE_SECONDS = 2
+SOS_RETRY_MAX_SECONDS = 300
 
 # Config
 faceModel = "opencv_face_detector_uint8.pb"
@@ -634,6 +783,30 @@ genderProto = "gender_deploy.prototxt"
 
 MODEL_MEAN_VALUES = (78.4263377603, 87.7689143744, 114.895847746)
 GENDER_LIST = ['Male', 'Female']
+
+# Model engines: "opencv" for both models, "onnx" / "onnx-int8" for the gender model, or
+# "auto" to benchmark the available engines at startup and keep the fastest. The ONNX
+# gender model is written by --export-gender-onnx and quantized by --quantize-gender.
+FACE_ENGINE = os.getenv("FACE_ENGINE", "auto")
+GENDER_ENGINE = os.getenv("GENDER_ENGINE", "auto")
+GENDER_ONNX_MODEL = os.getenv("GENDER_ONNX_MODEL", "gender_net.onnx")
+GENDER_INT8_MODEL = os.getenv("GENDER_INT8_MODEL", "gender_net_int8.onnx")
+# Threads per engine, 0 = the runtime's default. OpenCV's setting is process-wide and
+# applied once at startup; ONNX Runtime's is per session.
+ENGINE_THREADS = {
+    "opencv": int(os.getenv("OPENCV_THREADS", "0")),
+    "onnx": int(os.getenv("ONNX_THREADS", "0")),
+    "onnx-int8": int(os.getenv("ONNX_INT8_THREADS", "0")),
+}
+ENGINE_AUTOSELECT_RUNS = 10
+# Gender parity: where --gender-parity records its results, and how much accuracy an
+# engine may lose against the Caffe gender_net before "auto" refuses to pick it
+GENDER_PARITY_FILE = os.getenv("GENDER_PARITY_FILE", "model_parity.json")
+GENDER_PARITY_TOLERANCE = 0.02
+# Optional cache of ONNX Runtime-optimized graphs and of the "auto" engine choice, so a
+# restart skips graph optimisation and engine timing; empty disables it
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
 padding = 30  # Increased padding for better face extraction at higher resolution
 
 PROXIMITY_THRESHOLD = 180
@@ -641,56 +814,525 @@ RISK_MALE_COUNT = 3
 PANIC_SPEED_THRESHOLD = 50
 SOS_MIN_AREA = 3000
 SOS_FRAME_THRESHOLD = 10
+MANUAL_ALERT_SECONDS = 5  # a manual alarm clears itself after this long
+
+# SOS gesture: skin range and opening kernel, built once; mask scale < 1 trades accuracy for speed
+SOS_SKIN_LOWER = np.array([0, 40, 80], dtype=np.uint8)
+SOS_SKIN_UPPER = np.array([20, 255, 255], dtype=np.uint8)
+SOS_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+SOS_KERNEL_SMALL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+SOS_MASK_SCALE = float(os.getenv("SOS_MASK_SCALE", "1.0"))
+SOS_PREFILTER_RATIO = 0.4
 
-# Create Evidence Directory
+# Proximity: above this many woman x man pairs use a uniform grid instead of a full distance matrix
+PROXIMITY_GRID_MIN_PAIRS = 4000000
+PROXIMITY_TREND_FRAMES = 15  # frames of history behind the per-woman distance trend
+
+# Risk rules: loaded from RULES_FILE when it exists (checked for changes every RULES_RELOAD_SECONDS).
+# String values such as "panic_speed" refer to the camera's thresholds in cameras.json.
+RULES_FILE = os.getenv("RULES_FILE", "rules.json")
+RULES_RELOAD_SECONDS = 1.0
+RISK_LEVELS = {"SAFE": 0, "WARNING": 1, "CRITICAL": 2}
+DEFAULT_RULES = [
+    {
+        "name": "harassment", "level": "CRITICAL", "message": "Harassment Risk",
+        "log": "Woman surrounded by group", "sos": True,
+        "when": [
+            {"metric": "scene.num_women", "op": ">=", "value": 1},
+            {"metric": "scene.num_men", "op": ">=", "value": "risk_male_count"},
+            {"metric": "scene.close_pairs", "op": ">=", "value": 2},
+        ],
+        "window": {"frames": 5}, "on_ratio": 0.6, "off_ratio": 0.2,
+    },
+    {
+        "name": "panic", "scope": "woman", "level": "CRITICAL", "message": "Panic: Erratic Motion",
+        "log": "Rapid/Panic Movement", "label": "PANIC!",
+        "when": [{"metric": "speed", "op": ">", "value": "panic_speed"}],
+    },
+    {
+        "name": "sos_gesture", "scope": "woman", "level": "CRITICAL", "message": "SOS GESTURE DETECTED",
+        "log": "SOS Gesture Confirmed", "label": "SOS!",
+        "when": [{"metric": "sos_gesture", "op": "==", "value": True}],
+        "window": {"frames": "sos_frames"},
+    },
+    {
+        "name": "lone_woman_night", "level": "WARNING", "message": "Lone Woman (Night)",
+        "log": "Lone woman detected at night",
+        "when": [
+            {"metric": "scene.num_women", "op": "==", "value": 1},
+            {"metric": "scene.num_men", "op": "==", "value": 0},
+            {"metric": "scene.night", "op": "==", "value": True},
+        ],
+        "window": {"frames": 5}, "on_ratio": 0.6, "off_ratio": 0.2,
+    },
+    {
+        "name": "lone_woman_day", "level": "SAFE", "message": "Environment Safe (Day)",
+        "when": [
+            {"metric": "scene.num_women", "op": "==", "value": 1},
+            {"metric": "scene.num_men", "op": "==", "value": 0},
+            {"metric": "scene.night", "op": "==", "value": False},
+        ],
+    },
+]
+
+# Detection cadence: run the SSD every N frames, propagate boxes with optical flow between runs
+DETECT_EVERY_N_FRAMES = int(os.getenv("DETECT_EVERY_N_FRAMES", "3"))
+DETECT_MOTION_THRESHOLD = 25  # px/frame of box motion that forces an early detection
+FLOW_SCALE = 0.5
+FLOW_POINTS_PER_BOX = 20
+
+# Detection zones (per camera, see README): include zones are searched once at zone scale and
+# again in overlapping square tiles closer to the SSD's native 300x300 input. The tile size is
+# the smallest whose detection pass is expected to fit the budget, from measured pass times.
+DETECT_BUDGET_MS = float(os.getenv("DETECT_BUDGET_MS", "80"))
+ZONE_TILE_MIN = 300
+ZONE_TILE_OVERLAP = 0.25
+ZONE_TILE_MIN_COVERAGE = 0.05  # tiles with less of their area inside the zones are skipped
+ZONE_MERGE_OVERLAP = 0.6  # a box covering this much of a smaller one is the same face
+ZONE_TILE_STEP = 1.25  # ratio between the tile sizes tried
+ZONE_ADAPT_PASSES = 5  # detection passes between tile size decisions
+
+# Motion gate: skip detection on static scenes, but force a full pass after an idle timeout
+MOTION_GATE_ENABLED = os.getenv("MOTION_GATE_ENABLED", "1") == "1"
+MOTION_GATE_THRESHOLD = 0.002  # fraction of foreground pixels that counts as motion
+MOTION_GATE_IDLE_TIMEOUT = float(os.getenv("MOTION_GATE_IDLE_TIMEOUT", "5"))
+MOTION_GATE_SIZE = (160, 90)
+MOTION_GATE_HISTORY = 300
+
+# Tracking: faces keep a stable ID and a cached gender vote across frames
+TRACK_IOU_THRESHOLD = 0.3
+TRACK_MAX_CENTROID_DISTANCE = 120
+TRACK_MAX_MISSES = 5
+GENDER_RECLASSIFY_EVERY = int(os.getenv("GENDER_RECLASSIFY_EVERY", "15"))
+GENDER_RECLASSIFY_CONF = 0.75
+GENDER_VOTE_ALPHA = 0.3
+
+# Multi-camera: JSON list of cameras. Without the file a single camera is
+# built from USB_CAMERA_INDEX / DROIDCAM_URL / CAMERA_PRIORITY (see README).
+CAMERAS_CONFIG_FILE = os.getenv("CAMERAS_CONFIG", "cameras.json")
+MODEL_POOL_SIZE = int(os.getenv("MODEL_POOL_SIZE", "2"))
+
+# Inference backend: "thread" (shared model pool in this process) or "process"
+# (worker processes fed through shared memory, to use more cores than the GIL allows)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 2)))
+INFERENCE_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_TIMEOUT_SECONDS", "15"))  # a worker silent this long is restarted
+MAX_FRAME_BYTES = 1920 * 1080 * 3
+
+# Dashboard push channel (/api/events): events kept for reconnect replay, keep-alive interval
+STATE_FEED_HISTORY = 500
+SSE_HEARTBEAT_SECONDS = 15
+
+# MJPEG quality tiers viewers can pick with /video_feed?tier=...: (size or None for full, JPEG quality)
+STREAM_TIERS = {
+    "full": (None, 90),
+    "thumb": ((640, 360), 70),
+}
+
+# Frame ring: preallocated analysis-size slots shared by every pipeline stage.
+# Shared memory lets process-pool workers read the slots without a copy.
+ANALYSIS_FRAME_SHAPE = (720, 1280, 3)
+FRAME_RING_SLOTS = int(os.getenv("FRAME_RING_SLOTS", "12"))
+FRAME_RING_SHARED = os.getenv("FRAME_RING_SHARED", "1" if INFERENCE_BACKEND == "process" else "0") == "1"
+
+# Camera sources: reconnect backoff, parallel probing of USB indices, timeouts for stream URLs,
+# and how long viewers wait for a frame before they are shown a "no signal" frame instead
+CAMERA_RECONNECT_BASE_SECONDS = 0.5
+CAMERA_RECONNECT_MAX_SECONDS = 30
+CAMERA_PROBE_INDICES = range(10)
+CAMERA_PROBE_TIMEOUT = float(os.getenv("CAMERA_PROBE_TIMEOUT", "3"))
+CAMERA_PROBE_SCRIPT = ("import sys, cv2; cap = cv2.VideoCapture(int(sys.argv[1])); "
+                       "sys.exit(0 if cap.isOpened() and cap.read()[0] else 1)")
+CAMERA_STREAM_TIMEOUT_MS = int(os.getenv("CAMERA_STREAM_TIMEOUT_MS", "5000"))
+CAMERA_STALL_SECONDS = 2.0
+
+# Pipeline: max frames waiting between stages before the oldest is dropped
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
+
+# Evidence directory, created by the evidence store at startup
 EVIDENCE_DIR = "evidence"
-if not os.path.exists(EVIDENCE_DIR):
-    os.makedirs(EVIDENCE_DIR)
+
+# Evidence: writer pool size and queue bound, seconds of video kept before/after an incident
+EVIDENCE_WORKERS = int(os.getenv("EVIDENCE_WORKERS", "2"))
+EVIDENCE_QUEUE_SIZE = int(os.getenv("EVIDENCE_QUEUE_SIZE", "32"))
+EVIDENCE_PREROLL_SECONDS = float(os.getenv("EVIDENCE_PREROLL_SECONDS", "5"))
+EVIDENCE_POSTROLL_SECONDS = float(os.getenv("EVIDENCE_POSTROLL_SECONDS", "5"))
+# Evidence store: disk quota, age limit, and dHash bit distance below which keyframes count as duplicates
+EVIDENCE_QUOTA_MB = int(os.getenv("EVIDENCE_QUOTA_MB", "2048"))
+EVIDENCE_RETENTION_DAYS = float(os.getenv("EVIDENCE_RETENTION_DAYS", "30"))
+EVIDENCE_PHASH_DISTANCE = int(os.getenv("EVIDENCE_PHASH_DISTANCE", "6"))
+EVIDENCE_MANIFEST_INTERVAL = float(os.getenv("EVIDENCE_MANIFEST_INTERVAL", "2"))
+# Evidence store: seconds between retention sweeps that run even when nothing new is written
+EVIDENCE_SWEEP_INTERVAL = float(os.getenv("EVIDENCE_SWEEP_INTERVAL", "3600"))
+
+# Model Engines
+# faceNet and genderNet are ModelEngine instances: forward(blob) returns the
+# network output whichever runtime runs it, so face detection and the gender
+# step do not depend on the engine that was selected.
+MODEL_FILES = {
+    "face": {"opencv": faceModel},
+    "gender": {"opencv": genderModel, "onnx": GENDER_ONNX_MODEL, "onnx-int8": GENDER_INT8_MODEL},
+}
+MODEL_CONFIGS = {"face": faceProto, "gender": genderProto}
+
+
+class ModelEngine:
+    """A loaded network; subclasses wrap one inference runtime."""
+
+    engine = None
+
+    def __init__(self, role, path, threads=0):
+        self.role = role
+        self.path = path
+        self.threads = threads
+
+    def forward(self, blob):
+        raise NotImplementedError
+
+    def describe(self):
+        return {"engine": self.engine, "model": self.path, "threads": self.threads or "default"}
+
+
+class OpenCVEngine(ModelEngine):
+    """cv2.dnn on the CPU, reading the original Caffe/TensorFlow files."""
+
+    engine = "opencv"
+
+    def __init__(self, role, path, config, threads=0):
+        super().__init__(role, path, threads)
+        self.net = cv2.dnn.readNet(path, config)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def forward(self, blob):
+        self.net.setInput(blob)
+        return self.net.forward()
+
+
+class OnnxEngine(ModelEngine):
+    """ONNX Runtime on the CPU. Thread counts are per session; the model returns one softmax row per face."""
+
+    engine = "onnx"
+
+    def __init__(self, role, path, threads=0, engine="onnx"):
+        super().__init__(role, path, threads)
+        self.engine = engine
+        if onnxruntime is None:
+            raise RuntimeError("onnxruntime is not installed")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found")
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        cached = model_cache_path(path, f".ort{onnxruntime.__version__}.onnx")
+        source = path
+        if cached and os.path.exists(cached):
+            # Already optimised for this host; loading it skips graph optimisation
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+            source = cached
+        elif cached:
+            os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+            options.optimized_model_filepath = cached + ".tmp"
+        self.session = onnxruntime.InferenceSession(source, sess_options=options, providers=["CPUExecutionProvider"])
+        if cached and source == path and os.path.exists(cached + ".tmp"):
+            os.replace(cached + ".tmp", cached)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Exports with a fixed batch of 1 are run one face at a time
+        self.fixed_batch = model_input.shape[0] == 1
+
+    def forward(self, blob):
+        blob = blob.astype(np.float32, copy=False)
+        if self.fixed_batch and blob.shape[0] > 1:
+            return np.concatenate([self.session.run(None, {self.input_name: blob[i:i + 1]})[0]
+                                   for i in range(blob.shape[0])])
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+def create_engine(role, name):
+    if name not in MODEL_FILES[role]:
+        raise ValueError(f"unknown {role} engine {name!r}; choose from auto, {', '.join(MODEL_FILES[role])}")
+    path = MODEL_FILES[role][name]
+    if name == "opencv":
+        return OpenCVEngine(role, path, MODEL_CONFIGS[role], ENGINE_THREADS[name])
+    return OnnxEngine(role, path, ENGINE_THREADS[name], engine=name)
+
+
+def model_signature(path):
+    """Size and mtime of a model file, so a parity result is dropped when the file changes."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, int(st.st_mtime)]
+
+
+def model_cache_path(path, suffix):
+    """Where an optimised copy of model file path is cached (keyed by its size and mtime), or None."""
+    signature = model_signature(path)
+    if not MODEL_CACHE_DIR or signature is None:
+        return None
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(MODEL_CACHE_DIR, f"{stem}-{signature[0]}-{signature[1]}{suffix}")
+
+
+engine_selection_lock = threading.Lock()
+
+
+def cached_engine_selection(role, key):
+    """The engine "auto" picked last time for the same candidates on this host, if cached."""
+    if not MODEL_CACHE_DIR:
+        return None
+    try:
+        with open(os.path.join(MODEL_CACHE_DIR, "engine_selection.json")) as f:
+            entry = json.load(f).get(role)
+    except (OSError, ValueError):
+        return None
+    return entry["engine"] if entry and entry.get("key") == key else None
+
+
+def save_engine_selection(role, key, engine):
+    if not MODEL_CACHE_DIR:
+        return
+    path = os.path.join(MODEL_CACHE_DIR, "engine_selection.json")
+    with engine_selection_lock:
+        try:
+            with open(path) as f:
+                selections = json.load(f)
+        except (OSError, ValueError):
+            selections = {}
+        selections[role] = {"engine": engine, "key": key}
+        os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(selections, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+
+def load_parity_record():
+    try:
+        with open(GENDER_PARITY_FILE) as f:
+            return json.load(f).get("engines", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def engine_candidates(role):
+    """Engines "auto" may pick: runtime installed, model file present and, for gender
+    engines other than the reference Caffe net, a passing --gender-parity result."""
+    parity = load_parity_record() if role == "gender" else {}
+    names = []
+    for name, path in MODEL_FILES[role].items():
+        if name != "opencv":
+            if onnxruntime is None or not os.path.exists(path):
+                continue
+            if role == "gender":
+                result = parity.get(name)
+                if not result or not result.get("passed") or result.get("signature") != model_signature(path):
+                    continue
+        names.append(name)
+    return names
+
+
+def face_blob(frame):
+    return cv2.dnn.blobFromImage(frame, 1.0, (300, 300), [104, 117, 123], True, False)
+
+
+def gender_blob(faces):
+    return cv2.dnn.blobFromImages(faces, 1.0, (227, 227), MODEL_MEAN_VALUES, swapRB=False)
+
+
+def sample_blob(role):
+    """Synthetic network input shaped like the real one: a 720p frame, or a batch of 4 face crops."""
+    rng = np.random.default_rng(0)
+    if role == "face":
+        return face_blob(rng.integers(0, 256, size=(720, 1280, 3), dtype=np.uint8))
+    return gender_blob([rng.integers(0, 256, size=(160, 130, 3), dtype=np.uint8) for _ in range(4)])
+
+
+def time_engine(engine, runs=ENGINE_AUTOSELECT_RUNS):
+    """Median forward() time in ms on a synthetic input shaped like the real one."""
+    blob = sample_blob(engine.role)
+    engine.forward(blob)  # warm-up: first runs allocate and optimise the graph
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        engine.forward(blob)
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return float(np.median(timings))
+
+
+def select_engine(role, configured):
+    """Load the configured engine for role; "auto" times every candidate and keeps the fastest."""
+    if configured != "auto":
+        return create_engine(role, configured)
+    candidates = engine_candidates(role)
+    if len(candidates) == 1:
+        return create_engine(role, candidates[0])
+    key = {"candidates": {name: model_signature(MODEL_FILES[role][name]) for name in candidates},
+           "threads": ENGINE_THREADS, "cpus": os.cpu_count()}
+    cached = cached_engine_selection(role, key)
+    if cached is not None:
+        print(f"[INFO] {role} engine: {cached} (cached choice)")
+        os.environ[f"{role.upper()}_ENGINE"] = cached
+        return create_engine(role, cached)
+    # One candidate is loaded at a time and a slower one is released before the next loads
+    best = None
+    timings = {}
+    for name in candidates:
+        try:
+            engine = create_engine(role, name)
+            timings[name] = time_engine(engine)
+        except Exception as e:
+            print(f"[WARNING] {role} engine {name} unavailable: {e}")
+            continue
+        if best is None or timings[name] < timings[best.engine]:
+            best = engine
+        del engine
+    if best is None:
+        raise RuntimeError(f"no {role} engine could be loaded")
+    summary = ", ".join(f"{name} {ms:.1f} ms" for name, ms in timings.items())
+    print(f"[INFO] {role} engine: {best.engine} ({summary})")
+    # Spawned workers inherit the environment and load the winner without timing again
+    os.environ[f"{role.upper()}_ENGINE"] = best.engine
+    save_engine_selection(role, key, best.engine)
+    return best
+
+
+def model_stats():
+    nets = (("face", faceNet), ("gender", genderNet))
+    return {role: net.describe() for role, net in nets if net is not None}
+
 
 # Load Models
-try:
-    faceNet = cv2.dnn.readNet(faceModel, faceProto)
-    genderNet = cv2.dnn.readNet(genderModel, genderProto)
-    print("[INFO] Models loaded successfully.")
-except Exception as e:
-    print(f"[CRITICAL] Models not found. Please download them.\nError: {e}")
+# Nothing is loaded at import: the HTTP server comes up first while a
+# ModelLoader loads both networks in parallel; camera pipelines start once
+# they are warm (see /readyz).
+faceNet = None
+genderNet = None
+
+
+def load_models():
+    """Another faceNet/genderNet pair on the engines already selected."""
+    return create_engine("face", faceNet.engine), create_engine("gender", genderNet.engine)
+
+
+class ModelLoader:
+    """Loads faceNet and genderNet on background threads, in parallel, and warms each one up."""
+
+    def __init__(self):
+        self.status = {role: {"state": "pending"} for role in MODEL_FILES}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._done = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [threading.Thread(target=self._load, args=(role, configured),
+                                              name=f"load-{role}-model", daemon=True)
+                             for role, configured in (("face", FACE_ENGINE), ("gender", GENDER_ENGINE))]
+            for t in self._threads:
+                t.start()
+        threading.Thread(target=self._join, name="model-loader", daemon=True).start()
+
+    def _join(self):
+        for t in self._threads:
+            t.join()
+        if self.ready:
+            print("[INFO] Models loaded successfully.")
+        self._done.set()
+
+    def _load(self, role, configured):
+        global faceNet, genderNet
+        status = self.status[role]
+        status["state"] = "loading"
+        started = time.perf_counter()
+        try:
+            engine = select_engine(role, configured)
+            # A first forward pass allocates and optimises, so the first real frame is not slow
+            warm_started = time.perf_counter()
+            engine.forward(sample_blob(role))
+            status["warmup_ms"] = round((time.perf_counter() - warm_started) * 1000.0, 1)
+        except Exception as e:
+            status.update(state="failed", error=str(e))
+            print(f"[CRITICAL] Could not load the {role} model. Please download it.\nError: {e}")
+            return
+        if role == "face":
+            faceNet = engine
+        else:
+            genderNet = engine
+        status.update(state="ready", engine=engine.engine,
+                      load_ms=round((time.perf_counter() - started) * 1000.0, 1))
+
+    @property
+    def ready(self):
+        return all(status["state"] == "ready" for status in self.status.values())
+
+    def wait(self, timeout=None):
+        """Start loading if needed and block until done; True when both models are ready."""
+        self.start()
+        self._done.wait(timeout)
+        return self.ready
+
+    def stats(self):
+        return {role: dict(status) for role, status in self.status.items()}
+
+
+model_loader = None
+model_loader_lock = threading.Lock()
+
+
+def get_model_loader():
+    global model_loader
+    with model_loader_lock:
+        if model_loader is None:
+            model_loader = ModelLoader()
+        return model_loader
 
 # Helpers
-def log_alert_to_state(level, message):
+def path_safe(text):
+    """text with anything but letters, digits, '-' and '_' replaced, for use in file names."""
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(text))
+
+def log_alert_to_state(level, message, camera=None):
+    if camera is None:
+        camera = get_camera_engine()
+    state = camera.state
+    location = camera.config.location
     timestamp = datetime.datetime.now().strftime("%H:%M:%S")
     full_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
     # 1. Update In-Memory State (Dashboard)
-    if dashboard_state["logs"] and dashboard_state["logs"][0]["msg"] == message:
-        # Prevent spamming the same message instantly in UI
-        return
+    with camera.log_lock:
+        if state["logs"] and state["logs"][0]["msg"] == message:
+            # Prevent spamming the same message instantly in UI
+            return
 
-    dashboard_state["logs"].insert(0, {
-        "time": timestamp, 
-        "level": level, 
-        "msg": message,
-        "location": CAMERA_LOCATION_NAME
-    })
-    if len(dashboard_state["logs"]) > 20:
-        dashboard_state["logs"] = dashboard_state["logs"][:20]
+        entry = {
+            "time": timestamp, 
+            "level": level, 
+            "msg": message,
+            "location": location,
+            "camera": camera.cam_id
+        }
+        state["logs"].insert(0, entry)
+        if len(state["logs"]) > 20:
+            state["logs"] = state["logs"][:20]
+        camera.events.publish("log", entry)
 
-    # 2. Write to Permanent CSV Log (Audit Trail)
-    try:
-        with open(CSV_LOG_FILE, mode='a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([full_timestamp, level, message, CAMERA_LOCATION_NAME])
-    except Exception as e:
-        print(f"[ERROR] Logging to CSV failed: {e}")
+    # 2. Queue for the Permanent CSV Log (Audit Trail); written in the background
+    get_audit_log().write([full_timestamp, level, message, location], level, camera.cam_id)
 
-def get_faces(net, frame, conf_threshold=0.7):
-    frameOpencvDnn = frame.copy()
-    frameHeight = frameOpencvDnn.shape[0]
-    frameWidth = frameOpencvDnn.shape[1]
+def detect_face_boxes(net, frame, conf_threshold=0.7):
+    """Face boxes above conf_threshold; the frame is only read, never copied."""
+    frameHeight = frame.shape[0]
+    frameWidth = frame.shape[1]
     
     # Optimized blob creation for better detection
-    blob = cv2.dnn.blobFromImage(frameOpencvDnn, 1.0, (300, 300), [104, 117, 123], True, False)
-    net.setInput(blob)
-    detections = net.forward()
+    detections = net.forward(face_blob(frame))
     bboxes = []
     
     for i in range(detections.shape[2]):
@@ -708,367 +1350,4576 @@ def get_faces(net, frame, conf_threshold=0.7):
             y2 = min(frameHeight, y2)
             
             bboxes.append([x1, y1, x2, y2])
-    return frameOpencvDnn, bboxes
+    return bboxes
 
-def detect_sos_gesture(frame, face_box):
+def crop_face(frame, box):
+    x1, y1, x2, y2 = box
+    return frame[max(0,y1-padding):min(y2+padding,frame.shape[0]-1),
+                 max(0,x1-padding):min(x2+padding, frame.shape[1]-1)]
+
+def crop_faces(frame, bboxes):
+    """Padded face crops for bboxes, skipping empty ones; returns (faces, box indices)."""
+    faces = []
+    indices = []
+    for i, box in enumerate(bboxes):
+        face = crop_face(frame, box)
+        if face.size == 0: continue
+        faces.append(face)
+        indices.append(i)
+    return faces, indices
+
+def predict_genders(net, faces):
+    """One batched genderNet forward pass; returns (gender, confidence) per face."""
+    if not faces:
+        return []
+    # Higher quality face preprocessing for gender detection
+    genderPreds = net.forward(gender_blob(faces))
+    return [(GENDER_LIST[preds.argmax()], float(preds.max())) for preds in genderPreds]
+
+def classify_genders(net, frame, bboxes):
+    """Classify every face in a frame with one batched genderNet forward pass.
+
+    Returns a list aligned with bboxes holding (gender, confidence), or None
+    for boxes whose padded crop is empty.
+    """
+    results = [None] * len(bboxes)
+    faces, indices = crop_faces(frame, bboxes)
+    for i, prediction in zip(indices, predict_genders(net, faces)):
+        results[i] = prediction
+    return results
+
+def sos_roi(face_box, frame_shape):
+    """Region above and around a face where a raised hand is looked for (top, bottom, left, right)."""
     x1, y1, x2, y2 = face_box
     roi_top = max(0, y1 - 250)
-    roi_bottom = min(frame.shape[0], y2 + 50)  # Bottom of face + margin
-    roi_left = max(0, x1 - 30) 
-    roi_right = min(frame.shape[1], x2 + 30)
+    roi_bottom = min(frame_shape[0], y2 + 50)  # Bottom of face + margin
+    roi_left = max(0, x1 - 30)
+    roi_right = min(frame_shape[1], x2 + 30)
+    return roi_top, roi_bottom, roi_left, roi_right
 
-    # Ensure valid ROI bounds
-    if roi_top >= roi_bottom or roi_left >= roi_right:
-        return False
-    
-    roi = frame[roi_top:roi_bottom, roi_left:roi_right]
-    if roi.size == 0: return False
+def detect_sos_gestures(frame, bboxes, scale=SOS_MASK_SCALE):
+    """SOS flags for all faces in one frame.
 
-    hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-    lower_skin = np.array([0, 40, 80], dtype=np.uint8)
-    upper_skin = np.array([20, 255, 255], dtype=np.uint8)
-    mask = cv2.inRange(hsv, lower_skin, upper_skin)
-    
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-    mask = cv2.erode(mask, kernel, iterations=2) 
-    mask = cv2.dilate(mask, kernel, iterations=2) 
-    
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        if area > 3000:
-            x, y, w, h = cv2.boundingRect(cnt)
-            aspect_ratio = float(w) / h
-            if aspect_ratio < 1.5: return True
-    return False
+    The skin mask is computed once over the union of every face's ROI (so
+    overlapping ROIs are converted once), and an integral image of it
+    rejects ROIs without enough skin before any morphology or contour
+    work (when there is more than one ROI to share it). Per-ROI results
+    match the original single-face check; scale < 1
+    builds the mask at reduced resolution for speed at some accuracy cost.
+    """
+    rois = [sos_roi(box, frame.shape) for box in bboxes]
+    valid = [r for r in rois if r[0] < r[1] and r[2] < r[3]]
+    if not valid:
+        return [False] * len(bboxes)
+    top = min(r[0] for r in valid)
+    bottom = max(r[1] for r in valid)
+    left = min(r[2] for r in valid)
+    right = max(r[3] for r in valid)
+
+    region = frame[top:bottom, left:right]
+    if scale != 1.0:
+        region = cv2.resize(region, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    mask = cv2.inRange(cv2.cvtColor(region, cv2.COLOR_BGR2HSV), SOS_SKIN_LOWER, SOS_SKIN_UPPER)
+    # With a single ROI there is no shared mask to amortise the integral over; it measured slower
+    integral = cv2.integral(mask, sdepth=cv2.CV_32S) if len(valid) > 1 else None
+    min_area = SOS_MIN_AREA * scale * scale
+    kernel = SOS_KERNEL if scale == 1.0 else SOS_KERNEL_SMALL
+
+    flags = []
+    for roi_top, roi_bottom, roi_left, roi_right in rois:
+        if roi_top >= roi_bottom or roi_left >= roi_right:
+            flags.append(False)
+            continue
+        t = int((roi_top - top) * scale)
+        b = int((roi_bottom - top) * scale)
+        l = int((roi_left - left) * scale)
+        r = int((roi_right - left) * scale)
+        if integral is not None:
+            skin = (integral[b, r] - integral[t, r] - integral[b, l] + integral[t, l]) // 255
+            # Opening only removes pixels, and a blob that survives it with a contour area
+            # above SOS_MIN_AREA (even a ring) still has more than SOS_PREFILTER_RATIO of that in pixels
+            if skin < min_area * SOS_PREFILTER_RATIO:
+                flags.append(False)
+                continue
+        roi_mask = cv2.erode(mask[t:b, l:r], kernel, iterations=2)
+        roi_mask = cv2.dilate(roi_mask, kernel, iterations=2)
+        contours, _ = cv2.findContours(roi_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        found = False
+        for cnt in contours:
+            if cv2.contourArea(cnt) > min_area:
+                x, y, w, h = cv2.boundingRect(cnt)
+                if float(w) / h < 1.5:
+                    found = True
+                    break
+        flags.append(found)
+    return flags
 
 def calculate_distance(pt1, pt2):
     return math.sqrt((pt1[0] - pt2[0])**2 + (pt1[1] - pt2[1])**2)
 
+def pairs_within_radius(women, men, radius, grid_min_pairs=PROXIMITY_GRID_MIN_PAIRS):
+    """(woman index, man index, distance) arrays for every pair closer than radius.
 
-def send_sos_via_twilio(body):
-    """Send an SMS via Twilio REST API. Returns True on success."""
-    if not (TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_FROM_NUMBER and SOS_TO_NUMBER):
-        print("[WARN] Twilio credentials not configured; skipping SOS send.")
-        return False
-    if requests is None:
-        print("[WARN] 'requests' library not available; cannot send SOS.")
-        return False
+    Small scenes use one broadcast distance matrix; above grid_min_pairs
+    pairs the men are bucketed into a uniform grid of radius-sized cells so
+    each group of women is only compared with the 3x3 cells around it.
+    """
+    women = np.asarray(women, dtype=np.float32).reshape(-1, 2)
+    men = np.asarray(men, dtype=np.float32).reshape(-1, 2)
+    if len(women) == 0 or len(men) == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, np.empty(0, dtype=np.float32)
 
-    url = f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
-    data = {
-        'From': TWILIO_FROM_NUMBER,
-        'To': SOS_TO_NUMBER,
-        'Body': body
-    }
-    try:
-        resp = requests.post(url, data=data, auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN), timeout=10)
-        if 200 <= resp.status_code < 300:
-            print(f"[INFO] SOS sent via Twilio to {SOS_TO_NUMBER}")
-            return True
-        else:
-            print(f"[ERROR] Twilio send failed: {resp.status_code} {resp.text}")
-            return False
-    except Exception as e:
-        print(f"[ERROR] Exception while sending Twilio SMS: {e}")
-        return False
+    if len(women) * len(men) <= grid_min_pairs:
+        dist = np.hypot(women[:, None, 0] - men[None, :, 0], women[:, None, 1] - men[None, :, 1])
+        w_idx, m_idx = np.nonzero(dist < radius)
+        return w_idx, m_idx, dist[w_idx, m_idx]
 
-# Video Gen
-def generate_frames():
-    cap = cv2.VideoCapture(0)
-    camera_index = 0
-    
-    # Check if camera opened successfully
-    if not cap.isOpened():
-        print("[WARNING] Camera 0 not available, trying alternative indices...")
-        for i in range(1, 10):
-            cap = cv2.VideoCapture(i)
-            if cap.isOpened():
-                print(f"[SUCCESS] Camera opened at index {i}")
-                camera_index = i
-                break
-        else:
-            print("[CRITICAL] No camera found on system!")
-            print("[INFO] Serving error frame to frontend...")
-            # Generate static error frame instead of crashing
-            while True:
-                error_img = np.zeros((720, 1280, 3), dtype=np.uint8)
-                cv2.putText(error_img, "NO CAMERA DETECTED", (380, 300), cv2.FONT_HERSHEY_DUPLEX, 2, (0, 0, 255), 3)
-                ret, buffer = cv2.imencode('.jpg', error_img, [cv2.IMWRITE_JPEG_QUALITY, 90])
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                time.sleep(1)
-            return
-    
-    # Optimize camera settings for best quality
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
-    cap.set(cv2.CAP_PROP_FPS, 30)
-    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Minimize buffer for low latency
-    
-    time.sleep(1.0)
-    previous_centroids = {}
-    sos_persistence = 0
-    last_evidence_time = 0
-    frame_count = 0
-    
-    global MANUAL_ALERT_ACTIVE, last_sos_time
-    
-    print("[INFO] System Active. Layout: Professional.") 
-    print(f"[INFO] Camera Resolution: {int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}")
+    # Cell keys packed into one int64 so lookups are a sorted search
+    def cell_keys(cells):
+        return (cells[:, 0] << 32) + cells[:, 1]
 
-    try:
-        while True:
-            success, frame = cap.read()
-            if not success: 
-                print("[ERROR] Camera disconnected or frame read failed.")
-                # Try to reconnect
-                cap.release()
-                cap = cv2.VideoCapture(0)
-                if not cap.isOpened():
-                    print("[CRITICAL] Cannot reconnect to camera")
-                    break
-                continue
-            
-            frame_count += 1
-            
-            # Adaptive resolution - maintain 16:9, optimize for display
-            height, width = frame.shape[:2]
-            target_width = 1280
-            target_height = int(target_width * 9 / 16)
-            
-            # Only process if resolution changed significantly
-            if (width != target_width or height != target_height):
-                frame = cv2.resize(frame, (target_width, target_height), interpolation=cv2.INTER_LINEAR)
-            resultImg, bboxes = get_faces(faceNet, frame)
-            
-            women_centroids = []
-            men_centroids = []
-            current_centroids = {}
-            sos_detected_in_frame = False
-            
-            frame_status = "SAFE"
-            frame_msg = "All Systems Nominal"
-
-            for i, box in enumerate(bboxes):
-                x1, y1, x2, y2 = box
-                face = frame[max(0,y1-padding):min(y2+padding,frame.shape[0]-1),
-                             max(0,x1-padding):min(x2+padding, frame.shape[1]-1)]
-                if face.size == 0: continue
-
-                # Higher quality face preprocessing for gender detection
-                blob = cv2.dnn.blobFromImage(face, 1.0, (227, 227), MODEL_MEAN_VALUES, swapRB=False)
-                genderNet.setInput(blob)
-                genderPreds = genderNet.forward()
-                gender = GENDER_LIST[genderPreds[0].argmax()]
-                gender_conf = genderPreds[0].max()
-                
-                centroid = ((x1 + x2) // 2, (y1 + y2) // 2)
-                current_centroids[i] = centroid
-                
-                speed = 0
-                if i in previous_centroids:
-                    speed = calculate_distance(centroid, previous_centroids[i])
-
-                color = (200, 200, 200) # Neutral Gray default
-                if gender == 'Female':
-                    color = (255, 105, 180) # Pink for visibility in UI
-                    women_centroids.append(centroid)
-                    
-                    # SOS
-                    if detect_sos_gesture(frame, box):
-                        sos_detected_in_frame = True
-                        cv2.rectangle(resultImg, (x1, y1-200), (x2, y1), (0, 255, 255), 1)
-
-                    if sos_detected_in_frame and sos_persistence > SOS_FRAME_THRESHOLD:
-                        frame_status = "CRITICAL"
-                        frame_msg = "SOS GESTURE DETECTED"
-                        cv2.putText(resultImg, "SOS!", (x1, y1 - 50), cv2.FONT_HERSHEY_DUPLEX, 1.2, (0, 0, 255), 3)
-                        cv2.rectangle(resultImg, (x1, y1-200), (x2, y1), (0,0,255), 3)
-                        log_alert_to_state("CRITICAL", "SOS Gesture Confirmed")
-
-                    # Panic
-                    if speed > PANIC_SPEED_THRESHOLD:
-                        frame_status = "CRITICAL"
-                        frame_msg = "Panic: Erratic Motion"
-                        cv2.putText(resultImg, "PANIC!", (x1, y1 - 80), cv2.FONT_HERSHEY_DUPLEX, 1.0, (0, 0, 255), 3)
-                        log_alert_to_state("CRITICAL", "Rapid/Panic Movement")
-                else:
-                    color = (235, 206, 135) # Light Blue
-                    men_centroids.append(centroid)
-
-                # Draw clean bounding boxes with better quality
-                cv2.rectangle(resultImg, (x1, y1), (x2, y2), color, 3)
-                cv2.putText(resultImg, gender, (x1, y1-10), cv2.FONT_HERSHEY_DUPLEX, 0.8, color, 2)
-
-            if sos_detected_in_frame: sos_persistence += 1
-            else: sos_persistence = 0
-            previous_centroids = current_centroids
-
-            # Scenarios
-            num_men = len(men_centroids)
-            num_women = len(women_centroids)
-
-            # Contextual Logic (Day vs Night)
-            if num_women == 1 and num_men == 0 and frame_status != "CRITICAL":
-                if IS_NIGHT_SIMULATION:
-                    frame_status = "WARNING"
-                    frame_msg = "Lone Woman (Night)"
-                    log_alert_to_state("WARNING", "Lone woman detected at night")
-                else:
-                    frame_msg = "Environment Safe (Day)"
-
-            if num_women >= 1 and num_men >= RISK_MALE_COUNT:
-                close_men = 0
-                for w_cen in women_centroids:
-                    for m_cen in men_centroids:
-                        if calculate_distance(w_cen, m_cen) < PROXIMITY_THRESHOLD:
-                            close_men += 1
-                            cv2.line(resultImg, w_cen, m_cen, (0, 0, 255), 2)
-                if close_men >= 2:
-                    frame_status = "CRITICAL"
-                    frame_msg = "Harassment Risk"
-                    log_alert_to_state("CRITICAL", "Woman surrounded by group")
-
-                    # Automatic SOS via Twilio when harassment pattern detected
-                    try:
-                        now = time.time()
-                        if now - last_sos_time > SOS_THROTTLE_SECONDS:
-                            sos_msg = (
-                                f"SOS: Harassment risk detected at {CAMERA_LOCATION_NAME} on "
-                                f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}. "
-                                f"Counts: {num_women} women, {num_men} men."
-                            )
-
-                            def _send_sos(msg):
-                                ok = send_sos_via_twilio(msg)
-                                if ok:
-                                    log_alert_to_state("INFO", "SOS SMS sent via Twilio")
-                                else:
-                                    log_alert_to_state("WARNING", "SOS SMS failed")
-
-                            threading.Thread(target=_send_sos, args=(sos_msg,), daemon=True).start()
-                            last_sos_time = now
-                    except Exception as e:
-                        print(f"[ERROR] Failed to start SOS thread: {e}")
-
-            # Manual Alert Override
-            if MANUAL_ALERT_ACTIVE:
-                frame_status = "CRITICAL"
-                frame_msg = "MANUAL OVERRIDE: ALARM"
-                cv2.putText(resultImg, "MANUAL ALARM", (400, 300), cv2.FONT_HERSHEY_DUPLEX, 2.0, (0, 0, 255), 4)
-                
-                # Auto-reset manual alert after 5 seconds to prevent stuck state
-                if int(time.time()) % 10 == 0:
-                    MANUAL_ALERT_ACTIVE = False
-
-            # --- EVIDENCE CAPTURE (Auto-Save) ---
-            if frame_status == "CRITICAL":
-                current_time = time.time()
-                if current_time - last_evidence_time > 3.0: 
-                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"{EVIDENCE_DIR}/evidence_{timestamp}.jpg"
-                    
-                    # Threaded save to prevent "stutter"
-                    threading.Thread(target=cv2.imwrite, args=(filename, frame)).start()
-                    
-                    log_alert_to_state("INFO", f"Evidence Saved: {filename}")
-                    last_evidence_time = current_time
-                    cv2.rectangle(resultImg, (0,0), (1280,720), (0,255,255), 10)
-                    frame_msg = "DISPATCHING ALERT... EVID SAVED"
-
-            # Update State
-            dashboard_state["status"] = frame_status
-            dashboard_state["message"] = frame_msg
-            dashboard_state["men_count"] = num_men
-            dashboard_state["women_count"] = num_women
-
-            ret, buffer = cv2.imencode('.jpg', resultImg, [cv2.IMWRITE_JPEG_QUALITY, 90])
-            frame_bytes = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-    finally:
-        cap.release()
+    man_cells = np.floor(men / radius).astype(np.int64)
+    man_order = np.argsort(cell_keys(man_cells), kind="stable")
+    man_keys = cell_keys(man_cells)[man_order]
+    woman_cells = np.floor(women / radius).astype(np.int64)
+    offsets = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)], dtype=np.int64)
 
-# Routes
-@app.route('/')
-def index():
-    return render_template_string(HTML_TEMPLATE)
+    w_parts, m_parts, d_parts = [], [], []
+    cells, inverse = np.unique(woman_cells, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    for c, cell in enumerate(cells):
+        keys = cell_keys(cell + offsets)
+        lo = np.searchsorted(man_keys, keys, side="left")
+        hi = np.searchsorted(man_keys, keys, side="right")
+        candidates = np.concatenate([man_order[a:b] for a, b in zip(lo, hi)])
+        if len(candidates) == 0:
+            continue
+        in_cell = np.nonzero(inverse == c)[0]
+        delta = women[in_cell, None, :] - men[None, candidates, :]
+        dist = np.hypot(delta[..., 0], delta[..., 1])
+        wi, mi = np.nonzero(dist < radius)
+        w_parts.append(in_cell[wi])
+        m_parts.append(candidates[mi])
+        d_parts.append(dist[wi, mi])
+    if not w_parts:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, np.empty(0, dtype=np.float32)
+    return np.concatenate(w_parts), np.concatenate(m_parts), np.concatenate(d_parts)
 
-@app.route('/video_feed')
-def video_feed():
-    try:
-        return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
-    except Exception as e:
-        print(f"[ERROR] Video feed error: {e}")
-        # Return error frame
-        return Response(generate_error_frame(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
-def generate_error_frame():
-    """Generate a placeholder frame when camera unavailable"""
-    # Create a simple error image
-    error_img = np.zeros((720, 1280, 3), dtype=np.uint8)
-    cv2.putText(error_img, "CAMERA NOT AVAILABLE", (350, 200), cv2.FONT_HERSHEY_DUPLEX, 2, (0, 0, 255), 3)
-    cv2.putText(error_img, "Troubleshooting:", (100, 350), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-    cv2.putText(error_img, "1. Ensure camera is connected", (120, 400), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (200, 200, 200), 1)
-    cv2.putText(error_img, "2. Check no other app is using camera", (120, 450), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (200, 200, 200), 1)
-    cv2.putText(error_img, "3. Run as Administrator if needed", (120, 500), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (200, 200, 200), 1)
-    cv2.putText(error_img, "4. Restart the application", (120, 550), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (200, 200, 200), 1)
-    
-    while True:
-        ret, buffer = cv2.imencode('.jpg', error_img, [cv2.IMWRITE_JPEG_QUALITY, 90])
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        time.sleep(1)  # Update once per second
+def encirclement(center, points):
+    """Fraction of the full circle around center spanned by points (0 = none/one side, 1 = surrounded)."""
+    if len(points) < 2:
+        return 0.0
+    points = np.asarray(points, dtype=np.float32)
+    angles = np.sort(np.arctan2(points[:, 1] - center[1], points[:, 0] - center[0]))
+    gaps = np.diff(np.append(angles, angles[0] + 2 * np.pi))
+    return float(1.0 - gaps.max() / (2 * np.pi))
 
-@app.route('/api/stats')
-def get_stats():
-    return jsonify(dashboard_state)
 
-@app.route('/api/toggle_mode', methods=['POST'])
-def toggle_mode():
-    global IS_NIGHT_SIMULATION
-    IS_NIGHT_SIMULATION = not IS_NIGHT_SIMULATION
-    return jsonify({"is_night": IS_NIGHT_SIMULATION})
+class ProximityAnalyzer:
+    """Group metrics around each tracked woman for the harassment rule.
 
-@app.route('/api/trigger_manual', methods=['POST'])
-def trigger_manual():
-    global MANUAL_ALERT_ACTIVE, last_sos_time
-    MANUAL_ALERT_ACTIVE = True
+    For every woman: how many men are within the proximity radius, how much
+    of the circle around her they cover, and how fast their mean distance is
+    changing (px/s, negative = closing in) over the last PROXIMITY_TREND_FRAMES.
+    """
 
-    def _send_manual_sos():
-        global last_sos_time
-        try:
-            now = time.time()
-            if now - last_sos_time > SOS_THROTTLE_SECONDS:
-                sos_msg = (
-                    f"SOS: Manual alert triggered at {CAMERA_LOCATION_NAME} on "
-                    f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}."
-                )
-                ok = send_sos_via_twilio(sos_msg)
-                if ok:
-                    log_alert_to_state("INFO", "Manual SOS SMS sent via Twilio")
-                else:
-                    log_alert_to_state("WARNING", "Manual SOS SMS failed")
-                last_sos_time = now
-            else:
-                log_alert_to_state("INFO", "Manual SOS suppressed (throttle)")
-        except Exception as e:
-            print(f"[ERROR] Manual SOS thread exception: {e}")
+    def __init__(self, history=PROXIMITY_TREND_FRAMES):
+        self.history = history
+        self._distances = {}
 
-    threading.Thread(target=_send_manual_sos, daemon=True).start()
-    return jsonify({"status": "triggered"})
+    def update(self, women, men, radius, now=None):
+        """women: [(track_id, centroid)], men: [centroid]. Returns (pairs, metrics per woman)."""
+        now = time.time() if now is None else now
+        w_idx, m_idx, dist = pairs_within_radius([c for _, c in women], men, radius)
+        men = np.asarray(men, dtype=np.float32).reshape(-1, 2)
+        close_counts = np.bincount(w_idx, minlength=len(women))
+        mean_dist = np.bincount(w_idx, weights=dist, minlength=len(women)) / np.maximum(close_counts, 1)
+        # Pairs grouped by woman so each one's men are a contiguous slice
+        order = np.argsort(w_idx, kind="stable")
+        bounds = np.concatenate(([0], np.cumsum(close_counts)))
+
+        metrics = []
+        for i, (track_id, centroid) in enumerate(women):
+            close = int(close_counts[i])
+            trend = 0.0
+            coverage = 0.0
+            if close:
+                samples = self._distances.setdefault(track_id, collections.deque(maxlen=self.history))
+                samples.append((now, float(mean_dist[i])))
+                (t0, d0), (t1, d1) = samples[0], samples[-1]
+                if t1 > t0:
+                    trend = (d1 - d0) / (t1 - t0)
+                if close >= 2:
+                    coverage = encirclement(centroid, men[m_idx[order[bounds[i]:bounds[i + 1]]]])
+            metrics.append({
+                "track": track_id,
+                "men_within_radius": close,
+                "encirclement": round(coverage, 2),
+                "distance_trend": round(trend, 1),
+            })
+
+        # Forget women who are no longer tracked
+        live = {track_id for track_id, _ in women}
+        for track_id in list(self._distances):
+            if track_id not in live:
+                del self._distances[track_id]
+        return list(zip(w_idx.tolist(), m_idx.tolist())), metrics
+
+
+# Risk Rules
+class RuleWindow:
+    """Ring buffer of one rule's recent true/false samples for one subject.
+
+    Each sample stands for the video frames since the previous one (more
+    than one when batch analysis skips frames), so a frame window covers
+    the same stretch of video at any --stride. Keeps running counts so the
+    ratio is O(1) per frame, and the rule's on/off state for hysteresis.
+    """
+
+    def __init__(self, seconds=None, frames=None, now=0.0):
+        self.seconds = seconds
+        self.frames = frames
+        self.samples = collections.deque()  # (time, value, video frames)
+        self.trues = 0
+        self.total = 0
+        self.started = now
+        self.active = False
+
+    def add(self, now, value, frames=1):
+        self.samples.append((now, value, frames))
+        self.trues += value * frames
+        self.total += frames
+        if self.frames is not None:
+            while self.total - self.samples[0][2] >= self.frames:
+                self._drop()
+        if self.seconds is not None:
+            while self.samples and self.samples[0][0] < now - self.seconds:
+                self._drop()
+
+    def _drop(self):
+        _, value, frames = self.samples.popleft()
+        self.trues -= value * frames
+        self.total -= frames
+
+    def full(self, now):
+        if self.frames is not None:
+            return self.total >= self.frames
+        return now - self.started >= self.seconds
+
+    def ratio(self):
+        return self.trues / self.total if self.total else 0.0
+
+
+class RiskRule:
+    """One declarative rule from the rules file, with camera thresholds resolved.
+
+    A rule is checked per subject: the scene, every classified track, or
+    every woman. It turns on once its conditions held in at least on_ratio
+    of the samples in its window, and off only when that drops to
+    off_ratio or below.
+    """
+
+    OPS = {
+        ">": lambda a, b: a > b,
+        ">=": lambda a, b: a >= b,
+        "<": lambda a, b: a < b,
+        "<=": lambda a, b: a <= b,
+        "==": lambda a, b: a == b,
+        "!=": lambda a, b: a != b,
+    }
+
+    def __init__(self, spec, thresholds):
+        def resolve(value):
+            # Strings name a per-camera threshold from cameras.json
+            return thresholds[value] if isinstance(value, str) and value in thresholds else value
+
+        self.name = spec["name"]
+        self.level = spec.get("level", "WARNING")
+        self.message = spec.get("message", self.name)
+        self.log = spec.get("log")
+        self.label = spec.get("label")
+        self.scope = spec.get("scope", "scene")
+        self.sos = bool(spec.get("sos", False))
+        self.conditions = []
+        for cond in spec.get("when", []):
+            if cond["op"] not in self.OPS:
+                raise ValueError(f"rule {self.name}: unknown operator {cond['op']!r}")
+            self.conditions.append((cond["metric"], self.OPS[cond["op"]], resolve(cond["value"])))
+        window = spec.get("window", {})
+        self.window_seconds = resolve(window["seconds"]) if "seconds" in window else None
+        self.window_frames = int(resolve(window.get("frames", 1))) if self.window_seconds is None else None
+        self.on_ratio = spec.get("on_ratio", 1.0)
+        self.off_ratio = spec.get("off_ratio", 0.0)
+        if self.scope not in ("scene", "track", "woman"):
+            raise ValueError(f"rule {self.name}: unknown scope {self.scope!r}")
+        if self.level not in RISK_LEVELS:
+            raise ValueError(f"rule {self.name}: unknown level {self.level!r}")
+
+    def matches(self, scene, subject):
+        for metric, op, value in self.conditions:
+            if metric.startswith("scene."):
+                actual = scene.get(metric[6:])
+            else:
+                actual = subject.get(metric)
+            if actual is None or not op(actual, value):
+                return False
+        return True
+
+    def new_window(self, now):
+        return RuleWindow(self.window_seconds, self.window_frames, now)
+
+
+class RuleBook:
+    """Rule specs from RULES_FILE (or DEFAULT_RULES), reloaded when the file changes.
+
+    Checking the mtime is throttled to once per RULES_RELOAD_SECONDS, so
+    editing the file takes effect within a second without restarting any
+    capture loop. A file that fails to parse leaves the previous rules active.
+    """
+
+    def __init__(self, path=RULES_FILE):
+        self.path = path
+        self.specs = DEFAULT_RULES
+        self.version = 0
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def refresh(self, force=False):
+        now = time.time()
+        with self._lock:
+            if not force and now - self._checked < RULES_RELOAD_SECONDS:
+                return self.version
+            self._checked = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return self.version
+            self._mtime = mtime
+            if mtime is None:
+                specs = DEFAULT_RULES
+            else:
+                try:
+                    with open(self.path) as f:
+                        specs = json.load(f)
+                    # Validate before swapping in
+                    thresholds = CameraConfig("default").to_dict()["thresholds"]
+                    for spec in specs:
+                        RiskRule(spec, thresholds)
+                except Exception as e:
+                    print(f"[ERROR] Could not load rules from {self.path}, keeping previous rules: {e}")
+                    return self.version
+                print(f"[INFO] Loaded {len(specs)} risk rule(s) from {self.path}")
+            self.specs = specs
+            self.version += 1
+            return self.version
+
+
+rule_book = None
+rule_book_lock = threading.Lock()
+
+
+def get_rule_book():
+    global rule_book
+    with rule_book_lock:
+        if rule_book is None:
+            rule_book = RuleBook()
+        return rule_book
+
+
+class RuleEngine:
+    """Per-camera evaluation of the shared RuleBook.
+
+    Each frame every rule is checked once per subject in its scope, so the
+    cost is O(rules x tracks). Windows of tracks that disappeared are dropped.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.rules = []
+        self.windows = {}
+        self._version = None
+
+    def _sync(self, now):
+        version = get_rule_book().refresh()
+        if version == self._version:
+            return
+        thresholds = self.config.to_dict()["thresholds"]
+        self.rules = [RiskRule(spec, thresholds) for spec in get_rule_book().specs]
+        # Keep the history of rules that still exist under the same name
+        names = {rule.name for rule in self.rules}
+        self.windows = {key: w for key, w in self.windows.items() if key[0] in names}
+        self._version = version
+
+    def evaluate(self, scene, tracks, now=None, step=1):
+        """scene: dict of scene metrics; tracks: {track id: metric dict}; step: video frames since the last call.
+
+        Returns (active rules ordered by priority, rules that just turned on,
+        {track id: [labels]}), each rule paired with its subject (None for scene).
+        """
+        now = time.time() if now is None else now
+        self._sync(now)
+        active, started, labels = [], [], collections.defaultdict(list)
+        live = set()
+        for rule in self.rules:
+            if rule.scope == "scene":
+                subjects = [(None, {})]
+            elif rule.scope == "woman":
+                subjects = [(tid, m) for tid, m in tracks.items() if m.get("gender") == "Female"]
+            else:
+                subjects = list(tracks.items())
+            for subject, metrics in subjects:
+                key = (rule.name, subject)
+                live.add(key)
+                window = self.windows.get(key)
+                if window is None:
+                    window = self.windows[key] = rule.new_window(now)
+                window.add(now, rule.matches(scene, metrics), step)
+                ratio = window.ratio()
+                if not window.active and window.full(now) and ratio >= rule.on_ratio:
+                    window.active = True
+                    started.append((rule, subject))
+                elif window.active and ratio <= rule.off_ratio:
+                    window.active = False
+                if window.active:
+                    active.append((rule, subject))
+                    if rule.label and subject is not None:
+                        labels[subject].append(rule.label)
+        for key in [k for k in self.windows if k not in live]:
+            del self.windows[key]
+        active.sort(key=lambda item: -RISK_LEVELS[item[0].level])
+        return active, started, labels
+
+    def stats(self):
+        return {
+            "rules": [rule.name for rule in self.rules],
+            "active": sorted({key[0] for key, w in self.windows.items() if w.active}),
+            "windows": len(self.windows),
+        }
+
+class MotionGate:
+    """Cheap background-subtraction gate in front of face detection.
+
+    A downscaled MOG2 model estimates how much of the frame is moving. When
+    the scene is static the engine reuses the last boxes instead of running
+    the detector, but a full pass is still forced every
+    MOTION_GATE_IDLE_TIMEOUT seconds so someone standing still is not missed.
+    Callers pass their own clock, so batch runs measure that timeout in video time.
+    """
+
+    def __init__(self):
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(history=MOTION_GATE_HISTORY, detectShadows=False)
+        self.frames_gated = 0
+        self.frames_analyzed = 0
+        self.foreground_ratio = 0.0
+        self.resumed = False  # True on the first analysed frame after a gated stretch
+        self._last_full_pass = 0.0
+        self._gating = False
+
+    def should_analyze(self, frame, now=None):
+        small = cv2.resize(frame, MOTION_GATE_SIZE, interpolation=cv2.INTER_AREA)
+        mask = self.subtractor.apply(small)
+        self.foreground_ratio = cv2.countNonZero(mask) / float(mask.size)
+
+        now = time.time() if now is None else now
+        if self.foreground_ratio < MOTION_GATE_THRESHOLD and now - self._last_full_pass < MOTION_GATE_IDLE_TIMEOUT:
+            self.frames_gated += 1
+            self._gating = True
+            self.resumed = False
+            return False
+
+        self.resumed = self._gating
+        self._gating = False
+        self._last_full_pass = now
+        self.frames_analyzed += 1
+        return True
+
+    def stats(self):
+        return {
+            "frames_gated": self.frames_gated,
+            "frames_analyzed": self.frames_analyzed,
+            "foreground_ratio": round(self.foreground_ratio, 4),
+        }
+
+
+class CadencedFaceDetector:
+    """Runs the SSD face detector every N frames and propagates boxes in between.
+
+    Between detections each box is moved by the median sparse Lucas-Kanade
+    flow of keypoints found inside it on a downscaled grey frame. A fresh
+    detection is forced early when boxes move faster than
+    DETECT_MOTION_THRESHOLD or lose their keypoints.
+    """
+
+    def __init__(self, every_n=None):
+        self.every_n = max(1, every_n or DETECT_EVERY_N_FRAMES)
+        self.detections_run = 0
+        self.frames_propagated = 0
+        self.bboxes = []
+        self._prev_gray = None
+        self._points = None  # Nx1x2 float32 keypoints in downscaled coordinates
+        self._owners = None  # index into self.bboxes for every keypoint
+        self._frames_since_detect = 0
+        self._force_detect = True
+
+    def force_detection(self):
+        self._force_detect = True
+
+    def detect(self, detect_fn, frame, step=1):
+        """Face boxes for frame; detect_fn(frame) runs the real detector, e.g. via the inference scheduler.
+
+        step is the number of video frames since the previous call, so the
+        cadence and the motion threshold keep their meaning when frames are skipped.
+        """
+        small = cv2.resize(frame, None, fx=FLOW_SCALE, fy=FLOW_SCALE, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        if (self._force_detect or self._prev_gray is None
+                or self._frames_since_detect + step >= self.every_n):
+            bboxes = detect_fn(frame)
+            self._reset(gray, bboxes)
+            self.detections_run += 1
+            return bboxes
+
+        bboxes = self._propagate(gray, frame.shape, step)
+        self.frames_propagated += 1
+        return bboxes
+
+    def _reset(self, gray, bboxes):
+        points = []
+        owners = []
+        for i, (x1, y1, x2, y2) in enumerate(bboxes):
+            sx1, sy1 = int(x1 * FLOW_SCALE), int(y1 * FLOW_SCALE)
+            sx2, sy2 = int(x2 * FLOW_SCALE), int(y2 * FLOW_SCALE)
+            if sx2 - sx1 < 2 or sy2 - sy1 < 2:
+                continue
+            corners = cv2.goodFeaturesToTrack(gray[sy1:sy2, sx1:sx2], maxCorners=FLOW_POINTS_PER_BOX,
+                                              qualityLevel=0.01, minDistance=3)
+            if corners is None:
+                # Flat face patch: fall back to a coarse grid so the box can still move
+                xs = np.linspace(1, sx2 - sx1 - 2, 3)
+                ys = np.linspace(1, sy2 - sy1 - 2, 3)
+                corners = np.array([[[x, y]] for y in ys for x in xs], dtype=np.float32)
+            corners = corners + np.array([sx1, sy1], dtype=np.float32)
+            points.append(corners)
+            owners.extend([i] * len(corners))
+
+        self.bboxes = [list(b) for b in bboxes]
+        self._prev_gray = gray
+        self._points = np.concatenate(points).astype(np.float32) if points else None
+        self._owners = np.array(owners, dtype=np.int32)
+        self._frames_since_detect = 0
+        self._force_detect = False
+
+    def _propagate(self, gray, frame_shape, step=1):
+        self._frames_since_detect += step
+        if self._points is None or not self.bboxes:
+            # Nothing to follow; wait for the next scheduled detection
+            self._prev_gray = gray
+            return []
+
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, self._points, None,
+                                                          winSize=(15, 15), maxLevel=2)
+        good = status.reshape(-1) == 1
+        motion = (next_points - self._points).reshape(-1, 2) / FLOW_SCALE
+
+        frame_h, frame_w = frame_shape[:2]
+        bboxes = []
+        max_shift = 0.0
+        for i, (x1, y1, x2, y2) in enumerate(self.bboxes):
+            box_good = good & (self._owners == i)
+            if box_good.sum() < 2:
+                # Lost the face: keep the last box but re-detect on the next frame
+                self._force_detect = True
+                bboxes.append([x1, y1, x2, y2])
+                continue
+            dx, dy = np.median(motion[box_good], axis=0)
+            max_shift = max(max_shift, math.hypot(dx, dy))
+            dx, dy = int(round(dx)), int(round(dy))
+            bboxes.append([max(0, x1 + dx), max(0, y1 + dy), min(frame_w, x2 + dx), min(frame_h, y2 + dy)])
+
+        if max_shift / step > DETECT_MOTION_THRESHOLD:
+            self._force_detect = True
+
+        self.bboxes = bboxes
+        self._prev_gray = gray
+        self._points = next_points[good].reshape(-1, 1, 2)
+        self._owners = self._owners[good]
+        return [list(b) for b in bboxes]
+
+    def stats(self):
+        return {
+            "every_n": self.every_n,
+            "detections_run": self.detections_run,
+            "frames_propagated": self.frames_propagated,
+        }
+
+
+def merge_tile_boxes(boxes, overlap=ZONE_MERGE_OVERLAP):
+    """Keep one box per face seen by several overlapping tiles, preferring the largest.
+
+    Overlap is measured against the smaller box, so a face cut in half at
+    a tile border is folded into the whole face from the next tile.
+    """
+    if len(boxes) < 2:
+        return boxes
+    b = np.array(boxes, dtype=np.float32)
+    areas = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    kept = []
+    for i in np.argsort(-areas, kind="stable"):
+        if kept:
+            k = b[kept]
+            iw = np.clip(np.minimum(k[:, 2], b[i, 2]) - np.maximum(k[:, 0], b[i, 0]), 0, None)
+            ih = np.clip(np.minimum(k[:, 3], b[i, 3]) - np.maximum(k[:, 1], b[i, 1]), 0, None)
+            smaller = np.maximum(np.minimum(areas[kept], areas[i]), 1.0)
+            if (iw * ih / smaller).max() >= overlap:
+                continue
+        kept.append(i)
+    return [boxes[i] for i in sorted(kept)]
+
+
+def tile_starts(origin, length, size, step):
+    if length <= size:
+        return [origin]
+    starts = list(range(origin, origin + length - size, step))
+    return starts + [origin + length - size]
+
+
+class DetectionZones:
+    """Per-camera polygon zones deciding where, and how finely, faces are searched for.
+
+    Without zones the whole frame goes to the detector as before. With
+    zones, each include zone's bounding box is searched at zone scale plus
+    in overlapping tiles, so distant faces reach the SSD at a higher
+    effective resolution. Tiles lying in exclude zones or outside every
+    include zone are never run, and faces centred there are dropped. Only
+    exclude zones means the rest of the frame is included.
+
+    Detector cost is close to proportional to the number of crops it runs
+    on, so the cost of each candidate tile size is predicted from the
+    measured pass time; the finest tiling that fits the budget is used,
+    starting from the zone-scale pass alone.
+    """
+
+    def __init__(self, zones, budget_ms=DETECT_BUDGET_MS, shape=ANALYSIS_FRAME_SHAPE[:2]):
+        self.zones = zones
+        self.budget_ms = budget_ms
+        self.tile_size = None
+        self.pass_ms = 0.0
+        self.passes = 0
+        self.faces_excluded = 0
+        self.tiles_skipped = 0
+        self._since_change = 0
+        self._build(shape)
+
+    def _build(self, shape):
+        height, width = shape
+        include = [z["points"] for z in self.zones if z["type"] == "include"]
+        exclude = [z["points"] for z in self.zones if z["type"] == "exclude"]
+        mask = np.zeros((height, width), np.uint8) if include else np.full((height, width), 255, np.uint8)
+        if include:
+            cv2.fillPoly(mask, include, 255)
+        if exclude:
+            cv2.fillPoly(mask, exclude, 0)
+        self._shape = shape
+        self._mask = mask
+        self._integral = cv2.integral(mask // 255)
+        self._regions = []
+        for points in include or [np.array([[0, 0], [width - 1, height - 1]], dtype=np.int32)]:
+            x, y, w, h = cv2.boundingRect(points)
+            x, y = max(0, x), max(0, y)
+            w, h = min(width, x + w) - x, min(height, y + h) - y
+            if w > 0 and h > 0:
+                self._regions.append((x, y, w, h))
+        max_tile = max([max(w, h) for _, _, w, h in self._regions] + [ZONE_TILE_MIN])
+        self._tile_sizes = []
+        size = ZONE_TILE_MIN
+        while size < max_tile:
+            self._tile_sizes.append(size)
+            size = int(size * ZONE_TILE_STEP)
+        self._tile_sizes.append(max_tile)
+        if self.tile_size not in self._tile_sizes:
+            self.tile_size = max_tile
+        self._tiles, self.tiles_skipped = self._layout(self.tile_size)
+
+    def _layout(self, size):
+        """(tiles, skipped): size x size tiles covering the regions, minus those (almost) outside the zones."""
+        tiles = []
+        skipped = 0
+        step = max(1, int(size * (1.0 - ZONE_TILE_OVERLAP)))
+        for x, y, w, h in self._regions:
+            if size >= max(w, h):
+                continue  # the zone-scale pass already sees this region at tile resolution
+            for ty in tile_starts(y, h, size, step):
+                for tx in tile_starts(x, w, size, step):
+                    tw, th = min(size, w), min(size, h)
+                    inside = (self._integral[ty + th, tx + tw] - self._integral[ty, tx + tw]
+                              - self._integral[ty + th, tx] + self._integral[ty, tx])
+                    if inside < ZONE_TILE_MIN_COVERAGE * tw * th:
+                        skipped += 1
+                        continue
+                    tiles.append((tx, ty, tw, th))
+        return tiles, skipped
+
+    def detect(self, detect_fn, frame):
+        """Face boxes in frame coordinates; detect_fn(image) runs the detector on one crop."""
+        if not self.zones:
+            return detect_fn(frame)
+        if frame.shape[:2] != self._shape:
+            self._build(frame.shape[:2])
+        started = time.perf_counter()
+        boxes = []
+        for x, y, w, h in self._regions + self._tiles:
+            for x1, y1, x2, y2 in detect_fn(frame[y:y + h, x:x + w]):
+                boxes.append([x1 + x, y1 + y, x2 + x, y2 + y])
+        bboxes = []
+        for box in merge_tile_boxes(boxes):
+            cx = min((box[0] + box[2]) // 2, self._shape[1] - 1)
+            cy = min((box[1] + box[3]) // 2, self._shape[0] - 1)
+            if self._mask[cy, cx]:
+                bboxes.append(box)
+            else:
+                self.faces_excluded += 1
+        self._adapt((time.perf_counter() - started) * 1000.0)
+        return bboxes
+
+    def _adapt(self, elapsed_ms):
+        self.passes += 1
+        self._since_change += 1
+        self.pass_ms = elapsed_ms if self.passes == 1 else 0.8 * self.pass_ms + 0.2 * elapsed_ms
+        if self._since_change < ZONE_ADAPT_PASSES:
+            return
+        self._since_change = 0
+        per_crop_ms = self.pass_ms / (len(self._regions) + len(self._tiles))
+        layout = None
+        for size in self._tile_sizes:
+            layout = self._layout(size)
+            if per_crop_ms * (len(self._regions) + len(layout[0])) <= self.budget_ms:
+                break
+        if size != self.tile_size:
+            self.tile_size = size
+            self._tiles, self.tiles_skipped = layout
+            self.passes = 0  # restart the average on the new layout
+
+    def stats(self):
+        return {
+            "zones": len(self.zones),
+            "tile_size": self.tile_size,
+            "tiles": len(self._tiles),
+            "tiles_skipped": self.tiles_skipped,
+            "pass_ms": round(self.pass_ms, 1),
+            "budget_ms": self.budget_ms,
+            "faces_excluded": self.faces_excluded,
+        }
+
+
+def box_iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+class Track:
+    """A face followed across frames, with a smoothed gender vote."""
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.centroid = ((box[0] + box[2]) // 2, (box[1] + box[3]) // 2)
+        self.prev_centroid = None
+        self.step = 1  # video frames between prev_centroid and centroid
+        self.misses = 0
+        self.female_prob = None  # Smoothed P(Female); None until first classification
+        self.last_classified = -1
+
+    def update(self, box, step=1):
+        self.prev_centroid = self.centroid if self.misses == 0 else None
+        self.step = step
+        self.box = box
+        self.centroid = ((box[0] + box[2]) // 2, (box[1] + box[3]) // 2)
+        self.misses = 0
+
+    @property
+    def speed(self):
+        """Movement in px per video frame."""
+        if self.prev_centroid is None:
+            return 0
+        return calculate_distance(self.centroid, self.prev_centroid) / self.step
+
+    @property
+    def gender(self):
+        if self.female_prob is None:
+            return None
+        return 'Female' if self.female_prob >= 0.5 else 'Male'
+
+    @property
+    def gender_conf(self):
+        if self.female_prob is None:
+            return 0.0
+        return max(self.female_prob, 1.0 - self.female_prob)
+
+
+class FaceTracker:
+    """Assigns stable IDs to detect_face_boxes() boxes by IoU, falling back to centroid distance.
+
+    Gender is cached per track and only re-classified for new tracks, tracks
+    whose smoothed vote is still uncertain, or every GENDER_RECLASSIFY_EVERY
+    frames, so genderNet no longer runs on every face of every frame.
+    """
+
+    def __init__(self):
+        self.tracks = {}
+        self.frame_index = 0
+        self.faces_seen = 0
+        self.faces_classified = 0
+        self._next_id = 1
+
+    def update(self, bboxes, step=1):
+        """Match this frame's boxes to tracks; returns the Track for each box.
+
+        step is the number of video frames since the previous update; misses
+        and the reclassification interval are counted in video frames.
+        """
+        self.frame_index += step
+        assigned = [None] * len(bboxes)
+        free_tracks = set(self.tracks)
+
+        # Greedy association: best IoU pairs first, then nearest centroids
+        pairs = []
+        for i, box in enumerate(bboxes):
+            for tid in free_tracks:
+                iou = box_iou(box, self.tracks[tid].box)
+                if iou >= TRACK_IOU_THRESHOLD:
+                    pairs.append((iou, i, tid))
+        for _, i, tid in sorted(pairs, reverse=True):
+            if assigned[i] is None and tid in free_tracks:
+                assigned[i] = self.tracks[tid]
+                free_tracks.discard(tid)
+
+        pairs = []
+        for i, box in enumerate(bboxes):
+            if assigned[i] is not None:
+                continue
+            centroid = ((box[0] + box[2]) // 2, (box[1] + box[3]) // 2)
+            for tid in free_tracks:
+                dist = calculate_distance(centroid, self.tracks[tid].centroid)
+                if dist <= TRACK_MAX_CENTROID_DISTANCE * step:
+                    pairs.append((dist, i, tid))
+        for _, i, tid in sorted(pairs):
+            if assigned[i] is None and tid in free_tracks:
+                assigned[i] = self.tracks[tid]
+                free_tracks.discard(tid)
+
+        for i, box in enumerate(bboxes):
+            if assigned[i] is None:
+                track = Track(self._next_id, box)
+                self._next_id += 1
+                self.tracks[track.id] = track
+                assigned[i] = track
+            else:
+                assigned[i].update(box, step)
+
+        for tid in free_tracks:
+            track = self.tracks[tid]
+            track.misses += step
+            if track.misses > TRACK_MAX_MISSES:
+                del self.tracks[tid]
+
+        self.faces_seen += len(bboxes)
+        return assigned
+
+    def needs_classification(self, track):
+        if track.female_prob is None:
+            return True
+        if track.gender_conf < GENDER_RECLASSIFY_CONF:
+            return True
+        return self.frame_index - track.last_classified >= GENDER_RECLASSIFY_EVERY
+
+    def add_gender_vote(self, track, gender, confidence):
+        female_prob = confidence if gender == 'Female' else 1.0 - confidence
+        if track.female_prob is None:
+            track.female_prob = female_prob
+        else:
+            track.female_prob = (1.0 - GENDER_VOTE_ALPHA) * track.female_prob + GENDER_VOTE_ALPHA * female_prob
+        track.last_classified = self.frame_index
+        self.faces_classified += 1
+
+    def stats(self):
+        return {
+            "active_tracks": len(self.tracks),
+            "faces_seen": self.faces_seen,
+            "faces_classified": self.faces_classified,
+        }
+
+
+# SOS Notifications
+class SOSDeliveryError(Exception):
+    """A transport could not deliver a message; retryable=False means retrying will not help."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class TwilioTransport:
+    """Sends SMS through the Twilio REST API over one persistent HTTP session."""
+
+    name = "Twilio"
+
+    def __init__(self):
+        if requests is None:
+            raise RuntimeError("'requests' library not available; cannot send SOS.")
+        self.url = f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
+        self.session = requests.Session()
+        self.session.auth = (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+
+    def send(self, body):
+        if not (TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_FROM_NUMBER and SOS_TO_NUMBER):
+            raise SOSDeliveryError("Twilio credentials not configured", retryable=False)
+        data = {
+            'From': TWILIO_FROM_NUMBER,
+            'To': SOS_TO_NUMBER,
+            'Body': body
+        }
+        try:
+            resp = self.session.post(self.url, data=data, timeout=10)
+        except requests.RequestException as e:
+            raise SOSDeliveryError(str(e))
+        if not 200 <= resp.status_code < 300:
+            # Rate limiting and server errors are worth retrying; other client errors are not
+            retryable = resp.status_code == 429 or resp.status_code >= 500
+            raise SOSDeliveryError(f"{resp.status_code} {resp.text}", retryable=retryable)
+
+
+class HttpTransport:
+    """POSTs {"to", "body"} as JSON to SOS_HTTP_URL, e.g. a local stub server in tests."""
+
+    name = "HTTP"
+
+    def __init__(self, url=None):
+        if requests is None:
+            raise RuntimeError("'requests' library not available; cannot send SOS.")
+        self.url = url or SOS_HTTP_URL
+        self.session = requests.Session()
+
+    def send(self, body):
+        try:
+            resp = self.session.post(self.url, json={"to": SOS_TO_NUMBER, "body": body}, timeout=10)
+        except requests.RequestException as e:
+            raise SOSDeliveryError(str(e))
+        if not 200 <= resp.status_code < 300:
+            raise SOSDeliveryError(f"{resp.status_code} {resp.text}",
+                                   retryable=resp.status_code == 429 or resp.status_code >= 500)
+
+
+SOS_TRANSPORTS = {
+    "twilio": TwilioTransport,
+    "http": HttpTransport,
+}
+
+
+class SOSNotifier:
+    """Single dispatcher thread for all SOS messages.
+
+    notify() never blocks. The first alert from a camera is sent at once;
+    further alerts within SOS_THROTTLE_SECONDS are counted and sent as one
+    summary when the window ends. Every message is written to SOS_OUTBOX_DIR
+    before sending and deleted only after the transport accepts it, so
+    undelivered messages are retried with exponential backoff, including
+    after a restart. After SOS_MAX_ATTEMPTS, or a permanent error, a message
+    is moved to the dead-letter file instead.
+    """
+
+    DEAD_LETTER_FILE = "dead_letter.jsonl"
+
+    def __init__(self, transport=None, outbox_dir=SOS_OUTBOX_DIR):
+        self.transport = transport
+        self.outbox_dir = outbox_dir
+        os.makedirs(outbox_dir, exist_ok=True)
+        self._cond = threading.Condition()
+        self._cameras = {}
+        self._outbox = {}
+        self.metrics = {"sent": 0, "retries": 0, "failed": 0, "coalesced": 0}
+        for name in sorted(os.listdir(outbox_dir)):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(outbox_dir, name)) as f:
+                        message = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"[ERROR] Unreadable SOS outbox entry {name}: {e}")
+                    continue
+                message["next_attempt"] = 0
+                self._outbox[message["id"]] = message
+        if self._outbox:
+            print(f"[INFO] {len(self._outbox)} undelivered SOS message(s) found in {outbox_dir}")
+        self._thread = threading.Thread(target=self._run, name="sos-notifier", daemon=True)
+        self._thread.start()
+
+    def notify(self, cam_id, location, reason, detail=""):
+        """Queue an SOS for one camera alert, subject to the per-camera rate limit."""
+        now = time.time()
+        with self._cond:
+            camera = self._cameras.setdefault(cam_id, {"last_sent": 0.0, "pending": collections.Counter(),
+                                                       "first_pending": None, "location": location})
+            camera["location"] = location
+            if now - camera["last_sent"] >= SOS_THROTTLE_SECONDS and not camera["pending"]:
+                stamp = datetime.datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S')
+                body = f"SOS: {reason} at {location} on {stamp}. {detail}".strip()
+                camera["last_sent"] = now
+                self._enqueue(cam_id, body, reason)
+            else:
+                if not camera["pending"]:
+                    camera["first_pending"] = now
+                camera["pending"][reason] += 1
+                self.metrics["coalesced"] += 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return dict(self.metrics, outbox=len(self._outbox),
+                        transport=getattr(self.transport, "name", None))
+
+    def _enqueue(self, cam_id, body, reason):
+        message = {
+            "id": f"{time.time():.6f}_{path_safe(cam_id)}",
+            "camera": cam_id,
+            "reason": reason,
+            "body": body,
+            "attempts": 0,
+            "next_attempt": 0,
+        }
+        try:
+            self._persist(message)
+        except OSError as e:
+            print(f"[ERROR] Could not persist SOS message, sending from memory only: {e}")
+        self._outbox[message["id"]] = message
+
+    def _persist(self, message):
+        path = os.path.join(self.outbox_dir, message["id"] + ".json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(message, f)
+        os.replace(path + ".tmp", path)
+
+    def _flush_bursts(self, now):
+        for cam_id, camera in self._cameras.items():
+            if camera["pending"] and now - camera["last_sent"] >= SOS_THROTTLE_SECONDS:
+                total = sum(camera["pending"].values())
+                reasons = ", ".join(f"{reason} x{n}" for reason, n in camera["pending"].most_common())
+                since = datetime.datetime.fromtimestamp(camera["first_pending"]).strftime('%H:%M:%S')
+                until = datetime.datetime.fromtimestamp(now).strftime('%H:%M:%S')
+                body = f"SOS: {total} more alert(s) at {camera['location']} between {since} and {until}: {reasons}."
+                camera["pending"].clear()
+                camera["last_sent"] = now
+                self._enqueue(cam_id, body, "Repeated alerts")
+
+    def _next_wakeup(self, now):
+        times = [m["next_attempt"] for m in self._outbox.values()]
+        times += [c["last_sent"] + SOS_THROTTLE_SECONDS for c in self._cameras.values() if c["pending"]]
+        return max(0.0, min(times) - now) if times else None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                now = time.time()
+                self._flush_bursts(now)
+                due = [m for m in self._outbox.values() if m["next_attempt"] <= now]
+                if not due:
+                    self._cond.wait(timeout=self._next_wakeup(now))
+                    continue
+            for message in sorted(due, key=lambda m: m["id"]):
+                self._deliver(message)
+
+    def _deliver(self, message):
+        message["attempts"] += 1
+        try:
+            if self.transport is None:
+                raise SOSDeliveryError("no SOS transport available", retryable=False)
+            self.transport.send(message["body"])
+        except SOSDeliveryError as e:
+            self._failed(message, e, e.retryable)
+            return
+        except Exception as e:
+            # A transport bug gets the same capped backoff as a network error
+            self._failed(message, f"SOS transport error: {e}", True)
+            return
+
+        with self._cond:
+            self._outbox.pop(message["id"], None)
+            self.metrics["sent"] += 1
+        self._remove(message)
+        print(f"[INFO] SOS sent via {self.transport.name} to {SOS_TO_NUMBER}")
+        self._log(message, "INFO", f"{message['reason']} SOS SMS sent via {self.transport.name}")
+
+    def _failed(self, message, error, retryable):
+        retry = retryable and message["attempts"] < SOS_MAX_ATTEMPTS
+        with self._cond:
+            if retry:
+                delay = min(SOS_RETRY_BASE_SECONDS * 2 ** (message["attempts"] - 1), SOS_RETRY_MAX_SECONDS)
+                message["next_attempt"] = time.time() + delay
+                self.metrics["retries"] += 1
+            else:
+                self._outbox.pop(message["id"], None)
+                self.metrics["failed"] += 1
+        if retry:
+            print(f"[WARNING] SOS send failed (attempt {message['attempts']}), retrying in {delay:.0f}s: {error}")
+            try:
+                # The attempt count survives a restart, so the cap does too
+                self._persist(message)
+            except OSError:
+                pass
+            return
+        print(f"[ERROR] SOS send failed after {message['attempts']} attempt(s), giving up: {error}")
+        self._dead_letter(message, error)
+        self._log(message, "WARNING", f"{message['reason']} SOS SMS failed")
+
+    def _dead_letter(self, message, error):
+        """Append the message to the dead-letter file for inspection and take it out of the outbox."""
+        record = dict(message, error=str(error), failed_at=time.time())
+        record.pop("next_attempt", None)
+        try:
+            with open(os.path.join(self.outbox_dir, self.DEAD_LETTER_FILE), "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"[ERROR] Could not write SOS dead letter, leaving it in the outbox: {e}")
+            return
+        self._remove(message)
+
+    def _remove(self, message):
+        try:
+            os.remove(os.path.join(self.outbox_dir, message["id"] + ".json"))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _log(message, level, text):
+        engine = camera_engines.get(message["camera"])
+        if engine is not None:
+            log_alert_to_state(level, text, engine)
+
+
+sos_notifier = None
+sos_notifier_lock = threading.Lock()
+
+
+def get_sos_notifier():
+    global sos_notifier
+    with sos_notifier_lock:
+        if sos_notifier is None:
+            try:
+                transport = SOS_TRANSPORTS[SOS_TRANSPORT]()
+            except Exception as e:
+                print(f"[WARN] SOS transport '{SOS_TRANSPORT}' unavailable: {e}")
+                transport = None
+            sos_notifier = SOSNotifier(transport)
+        return sos_notifier
+
+
+# Audit Log
+class AuditLogWriter:
+    """Background group-commit writer for the CSV audit trail.
+
+    log_alert_to_state() only appends to an in-memory queue. This thread
+    writes queued rows in batches once AUDIT_BATCH_SIZE rows are waiting or
+    AUDIT_FLUSH_INTERVAL has passed, fsyncs according to AUDIT_FSYNC
+    (CRITICAL rows are flushed and synced straight away under the default
+    "critical" policy), and rotates the file by size and by day. The same
+    batch is inserted into the incident store.
+    """
+
+    HEADER = ["Timestamp", "Level", "Message", "Location"]
+
+    def __init__(self, path=CSV_LOG_FILE):
+        self.path = path
+        self._cond = threading.Condition()
+        self._rows = collections.deque()
+        self._urgent = False
+        self._closed = False
+        self._file = None
+        self._writer = None
+        self._file_date = None
+        self.metrics = {
+            "queued": 0,
+            "written": 0,
+            "batches": 0,
+            "fsyncs": 0,
+            "dropped": 0,
+            "rotations": 0,
+            "max_depth": 0,
+            "last_flush_ms": 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, row, level, camera=None):
+        """Queue one CSV row; never blocks the caller."""
+        with self._cond:
+            # Back-pressure: when the disk cannot keep up, shed routine rows but never CRITICAL ones
+            if len(self._rows) >= AUDIT_QUEUE_MAX and level != "CRITICAL":
+                self.metrics["dropped"] += 1
+                return
+            self._rows.append((row, level, camera, time.time()))
+            self.metrics["queued"] += 1
+            self.metrics["max_depth"] = max(self.metrics["max_depth"], len(self._rows))
+            if level == "CRITICAL" or len(self._rows) >= AUDIT_BATCH_SIZE:
+                self._urgent = level == "CRITICAL" or self._urgent
+                self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return dict(self.metrics, depth=len(self._rows))
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or self._urgent or len(self._rows) >= AUDIT_BATCH_SIZE,
+                    timeout=AUDIT_FLUSH_INTERVAL)
+                batch = list(self._rows)
+                self._rows.clear()
+                urgent = self._urgent
+                self._urgent = False
+                closed = self._closed
+            if batch:
+                try:
+                    self._flush(batch, urgent)
+                except Exception as e:
+                    print(f"[ERROR] Logging to CSV failed: {e}")
+            if closed:
+                if self._file is not None:
+                    self._file.close()
+                return
+
+    def _flush(self, batch, urgent):
+        started = time.perf_counter()
+        self._rotate_if_needed()
+        self._writer.writerows(row for row, _, _, _ in batch)
+        self._file.flush()
+        if AUDIT_FSYNC == "always" or (AUDIT_FSYNC == "critical" and urgent):
+            os.fsync(self._file.fileno())
+            self.metrics["fsyncs"] += 1
+        self.metrics["written"] += len(batch)
+        self.metrics["batches"] += 1
+        try:
+            get_incident_store().insert_many(
+                (ts, level, camera, row[3], row[2]) for row, level, camera, ts in batch)
+        except Exception as e:
+            print(f"[ERROR] Writing incidents to {INCIDENT_DB_FILE} failed: {e}")
+        self.metrics["last_flush_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+
+    def _rotate_if_needed(self):
+        today = datetime.date.today()
+        if self._file is not None:
+            too_big = AUDIT_ROTATE_BYTES and self._file.tell() >= AUDIT_ROTATE_BYTES
+            if not too_big and today == self._file_date:
+                return
+            self._file.close()
+            self._file = None
+            self._archive()
+        elif os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            # A log left behind by an earlier day is rotated before today's rows go in
+            if datetime.date.fromtimestamp(os.path.getmtime(self.path)) != today:
+                self._archive()
+
+        # Ensure CSV Log exists
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, mode='a', newline='')
+        self._writer = csv.writer(self._file)
+        self._file_date = today
+        if new_file:
+            self._writer.writerow(self.HEADER)
+
+    def _archive(self):
+        # Archives are named after the last write so an old file keeps its own day
+        stamp = datetime.datetime.fromtimestamp(os.path.getmtime(self.path)).strftime("%Y%m%d_%H%M%S")
+        base, ext = os.path.splitext(self.path)
+        target = f"{base}.{stamp}{ext}"
+        n = 1
+        while os.path.exists(target):
+            # Two rotations in one second get numbered rather than overwriting the first archive
+            target = f"{base}.{stamp}_{n}{ext}"
+            n += 1
+        os.replace(self.path, target)
+        self.metrics["rotations"] += 1
+
+
+audit_log = None
+audit_log_lock = threading.Lock()
+
+
+def get_audit_log():
+    global audit_log
+    with audit_log_lock:
+        if audit_log is None:
+            audit_log = AuditLogWriter()
+        return audit_log
+
+# Incident Store
+class IncidentStore:
+    """SQLite (WAL) copy of the audit trail that the reports API can query.
+
+    Rows are inserted by the audit log writer thread in the same batches as
+    the CSV, so the video pipeline never touches the database. Each thread
+    gets its own connection; WAL lets API readers run alongside the writer.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS incidents (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            level TEXT NOT NULL,
+            camera TEXT,
+            location TEXT,
+            message TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_incidents_ts ON incidents (ts);
+        CREATE INDEX IF NOT EXISTS idx_incidents_level_ts ON incidents (level, ts);
+        CREATE INDEX IF NOT EXISTS idx_incidents_camera_ts ON incidents (camera, ts);
+        CREATE INDEX IF NOT EXISTS idx_incidents_location_ts ON incidents (location, ts);
+        CREATE TABLE IF NOT EXISTS csv_imports (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            imported_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path=INCIDENT_DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def insert_many(self, rows):
+        """rows: iterable of (ts, level, camera, location, message)."""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO incidents (ts, level, camera, location, message) VALUES (?, ?, ?, ?, ?)", rows)
+
+    def query(self, start=None, end=None, levels=None, camera=None, location=None, cursor=None, limit=50):
+        """Newest first. cursor is the (ts, id) of the last row of the previous page."""
+        where, params = self._filters(start, end, levels, camera, location)
+        if cursor is not None:
+            where.append("(ts < ? OR (ts = ? AND id < ?))")
+            params += [cursor[0], cursor[0], cursor[1]]
+        sql = "SELECT id, ts, level, camera, location, message FROM incidents"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        rows = self._connect().execute(sql, params + [limit + 1]).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['ts']!r}:{rows[-1]['id']}"
+        return [self._row_to_dict(r) for r in rows], next_cursor
+
+    def hourly_counts(self, start=None, end=None, levels=None, camera=None, location=None):
+        where, params = self._filters(start, end, levels, camera, location)
+        # Local hours, like the labels; UTC hour buckets split them in half-hour offset zones
+        sql = "SELECT strftime('%Y-%m-%d %H:00', ts, 'unixepoch', 'localtime') AS hour, level, COUNT(*) AS n FROM incidents"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY hour, level ORDER BY hour"
+        buckets = collections.OrderedDict()
+        for hour, level, n in self._connect().execute(sql, params):
+            bucket = buckets.setdefault(hour, {"hour": hour, "total": 0})
+            bucket[level] = n
+            bucket["total"] += n
+        return list(buckets.values())
+
+    def import_csv(self, path):
+        """Import a security_events.csv file; returns rows added.
+
+        csv_imports records how many bytes of each file were imported, so a
+        file that has grown only adds its new rows (a file that shrank was
+        replaced and is read from the start). Rows the audit writer already
+        stored (same second, level, message and location) are skipped, so
+        the live log can be imported as well.
+        """
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        conn = self._connect()
+        done = conn.execute("SELECT size, rows FROM csv_imports WHERE path = ?", (path,)).fetchone()
+        offset, imported = (done["size"], done["rows"]) if done is not None and done["size"] <= size else (0, 0)
+        if offset == size:
+            print(f"[INFO] {path} was already imported, skipping.")
+            return 0
+
+        def lines(f):
+            nonlocal offset
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a row still being written is picked up by the next import
+                offset += len(line)
+                yield line.decode("utf-8", errors="replace")
+
+        total = skipped = 0
+        exists = ("SELECT 1 FROM incidents WHERE ts >= ? AND ts < ? AND level = ? AND message = ? "
+                  "AND location IS ? LIMIT 1")
+        with open(path, "rb") as f, conn:
+            f.seek(offset)
+            reader = csv.reader(lines(f))
+            batch = []
+            for row in reader:
+                if len(row) < 3 or row[0] == "Timestamp":
+                    continue
+                try:
+                    ts = datetime.datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S").timestamp()
+                except ValueError:
+                    continue
+                location = row[3] if len(row) > 3 else None
+                if conn.execute(exists, (ts, ts + 1, row[1], row[2], location)).fetchone() is not None:
+                    skipped += 1
+                    continue
+                batch.append((ts, row[1], None, location, row[2]))
+                if len(batch) >= 10000:
+                    conn.executemany(
+                        "INSERT INTO incidents (ts, level, camera, location, message) VALUES (?, ?, ?, ?, ?)", batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                conn.executemany(
+                    "INSERT INTO incidents (ts, level, camera, location, message) VALUES (?, ?, ?, ?, ?)", batch)
+                total += len(batch)
+            conn.execute("INSERT OR REPLACE INTO csv_imports (path, size, rows, imported_at) VALUES (?, ?, ?, ?)",
+                         (path, offset, imported + total, time.time()))
+        print(f"[INFO] Imported {total} incidents from {path}"
+              + (f" ({skipped} already in the store)" if skipped else ""))
+        return total
+
+    @staticmethod
+    def _filters(start, end, levels, camera, location):
+        where, params = [], []
+        if start is not None:
+            where.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("ts < ?")
+            params.append(end)
+        if levels:
+            where.append(f"level IN ({', '.join('?' * len(levels))})")
+            params += list(levels)
+        if camera:
+            where.append("camera = ?")
+            params.append(camera)
+        if location:
+            where.append("location = ?")
+            params.append(location)
+        return where, params
+
+    @staticmethod
+    def _row_to_dict(row):
+        when = datetime.datetime.fromtimestamp(row["ts"])
+        return {
+            "id": row["id"],
+            "timestamp": when.strftime("%Y-%m-%d %H:%M:%S"),
+            "time": when.strftime("%H:%M:%S"),
+            "level": row["level"],
+            "camera": row["camera"],
+            "location": row["location"],
+            "msg": row["message"],
+        }
+
+
+incident_store = None
+incident_store_lock = threading.Lock()
+
+
+def get_incident_store():
+    global incident_store
+    with incident_store_lock:
+        if incident_store is None:
+            incident_store = IncidentStore()
+        return incident_store
+
+
+# Shared Model Pool
+# Cameras do not own models. Every detection and gender request goes through
+# one scheduler that serves cameras round-robin from a small pool of
+# faceNet/genderNet pairs, so a busy camera cannot starve the others.
+class InferenceRequest:
+    def __init__(self, cam_id, kind, payload):
+        self.cam_id = cam_id
+        self.kind = kind  # "detect", "gender", "sos" or "analyze" (a whole frame, process backend)
+        self.payload = payload
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        # Process backend, under the pool's lock: frame handed to a worker / caller gave up first
+        self.sent = False
+        self.cancelled = False
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"{self.kind} request from {self.cam_id} got no answer in {timeout}s")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class InferenceScheduler:
+    """Fair round-robin dispatch of inference requests onto a pool of model instances.
+
+    Pending gender requests from other cameras are folded into the same
+    genderNet forward pass, so crowded multi-camera scenes cost one batch.
+    """
+
+    def __init__(self, pool_size=MODEL_POOL_SIZE):
+        self._cond = threading.Condition()
+        self._queues = collections.OrderedDict()  # cam_id -> deque of InferenceRequest
+        self.served = collections.Counter()
+        self.pool_size = max(1, pool_size)
+        self._workers = []
+        for n in range(self.pool_size):
+            nets = (faceNet, genderNet) if n == 0 else load_models()
+            worker = threading.Thread(target=self._worker, args=nets, name=f"inference-{n}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def detect_faces(self, cam_id, frame):
+        return self._submit(cam_id, "detect", frame)
+
+    def classify_genders(self, cam_id, frame, bboxes):
+        results = [None] * len(bboxes)
+        faces, indices = crop_faces(frame, bboxes)
+        if faces:
+            for i, prediction in zip(indices, self._submit(cam_id, "gender", faces)):
+                results[i] = prediction
+        return results
+
+    def detect_sos(self, cam_id, frame, bboxes):
+        # Cheap enough to run on the calling camera's own thread
+        return detect_sos_gestures(frame, bboxes)
+
+    def _submit(self, cam_id, kind, payload):
+        request = InferenceRequest(cam_id, kind, payload)
+        with self._cond:
+            self._queues.setdefault(cam_id, collections.deque()).append(request)
+            self._cond.notify()
+        return request.wait()
+
+    def _next_batch(self):
+        # Take the first camera with work, then rotate it to the back of the line
+        for cam_id, queue in self._queues.items():
+            if queue:
+                break
+        else:
+            return None
+        self._queues.move_to_end(cam_id)
+        batch = [queue.popleft()]
+        if batch[0].kind == "gender":
+            for other in self._queues.values():
+                while other and other[0].kind == "gender":
+                    batch.append(other.popleft())
+        return batch
+
+    def _worker(self, face_net, gender_net):
+        while True:
+            with self._cond:
+                batch = self._next_batch()
+                while batch is None:
+                    self._cond.wait()
+                    batch = self._next_batch()
+            try:
+                if batch[0].kind == "detect":
+                    batch[0].result = detect_face_boxes(face_net, batch[0].payload)
+                else:
+                    faces = [face for request in batch for face in request.payload]
+                    predictions = predict_genders(gender_net, faces)
+                    offset = 0
+                    for request in batch:
+                        request.result = predictions[offset:offset + len(request.payload)]
+                        offset += len(request.payload)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            for request in batch:
+                self.served[request.cam_id] += 1
+                request.done.set()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "backend": "thread",
+                "pool_size": self.pool_size,
+                "pending": {cam_id: len(queue) for cam_id, queue in self._queues.items()},
+                "served": dict(self.served),
+            }
+
+
+class LocalInference:
+    """Model calls made directly on this process's faceNet/genderNet; used inside pipeline workers."""
+
+    def detect_faces(self, cam_id, frame):
+        return detect_face_boxes(faceNet, frame)
+
+    def classify_genders(self, cam_id, frame, bboxes):
+        return classify_genders(genderNet, frame, bboxes)
+
+    def detect_sos(self, cam_id, frame, bboxes):
+        return detect_sos_gestures(frame, bboxes)
+
+
+class ProcessPipelinePool:
+    """Runs each camera's whole per-frame analysis in a worker process.
+
+    Every camera is pinned to one worker, the one with the fewest cameras
+    when it first submits a frame. That worker keeps the camera's motion
+    gate, tracker, proximity history and rule windows, and runs detection,
+    the per-face loop, tracking and the rules outside this process's GIL.
+    The web process only captures, draws the returned Overlay, encodes and
+    serves. Frames in a shared FrameRing are read in place; any other frame
+    is copied once into the worker's own shared-memory slot.
+
+    A worker takes one frame at a time from its cameras, oldest request
+    first. A camera has at most one frame in flight, so its cameras are
+    served in turn, as InferenceScheduler does for model calls. Each worker's
+    dispatcher thread waits on the result pipe and the Process.sentinel
+    together. A worker that exits, or stays silent for
+    INFERENCE_TIMEOUT_SECONDS, fails the frame it held and is respawned under
+    the same index. Its cameras start again with fresh tracking state. A
+    frame whose caller timed out before it was sent is dropped; one already
+    sent is waited for, so no worker reads a ring slot that was released.
+    """
+
+    def __init__(self, workers=INFERENCE_WORKERS):
+        self._ctx = multiprocessing.get_context("spawn")
+        self.workers = max(1, workers)
+        self.served = collections.Counter()
+        self.respawns = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._assigned = {}  # cam_id -> worker index
+        self._queues = [collections.OrderedDict() for _ in range(self.workers)]  # cam_id -> waiting request
+        self._attached = [set() for _ in range(self.workers)]  # cameras each worker holds an analyzer for
+        self._ready = [False] * self.workers  # models loaded
+        self._slots = [shared_memory.SharedMemory(create=True, size=MAX_FRAME_BYTES) for _ in range(self.workers)]
+        self._connections = [None] * self.workers
+        self._processes = [None] * self.workers
+        for n in range(self.workers):
+            self._spawn(n)
+            threading.Thread(target=self._dispatch, args=(n,), name=f"pipeline-dispatch-{n}", daemon=True).start()
+        atexit.register(self.close)
+
+    def _spawn(self, n):
+        connection, child = self._ctx.Pipe()
+        process = self._ctx.Process(target=pipeline_worker_main, args=(self._slots[n].name, child),
+                                    name=f"pipeline-worker-{n}", daemon=True)
+        process.start()
+        child.close()  # only the worker holds that end, so its death reads as EOF here
+        self._connections[n], self._processes[n] = connection, process
+        self._attached[n] = set()
+        self._ready[n] = False
+
+    def analyze(self, analyzer, frame, context):
+        """Detect and assess frame on the worker that holds analyzer's camera.
+
+        Returns PinnedCameraAnalyzer.run's reply for the parent to finish the frame with.
+        """
+        if frame.nbytes > MAX_FRAME_BYTES or frame.dtype != np.uint8:
+            raise ValueError(f"frame {frame.shape} does not fit a shared-memory slot")
+        request = InferenceRequest(analyzer.cam_id, "analyze", (analyzer, frame, context))
+        with self._cond:
+            worker = self._assigned.get(analyzer.cam_id)
+            if worker is None:
+                load = collections.Counter(self._assigned.values())
+                worker = self._assigned[analyzer.cam_id] = min(range(self.workers), key=lambda n: load[n])
+            self._queues[worker][analyzer.cam_id] = request
+            self._cond.notify_all()
+        try:
+            return request.wait(INFERENCE_TIMEOUT_SECONDS)
+        except TimeoutError:
+            # The caller releases the frame's ring slot once this returns, so the worker must
+            # not be told to read it afterwards: drop or cancel the request if it was not sent
+            with self._cond:
+                if self._queues[worker].get(analyzer.cam_id) is request:
+                    del self._queues[worker][analyzer.cam_id]
+                request.cancelled = True
+                sent = request.sent
+            if sent:
+                # Already in the worker's hands; the dispatcher answers or kills it within its own timeout
+                request.done.wait()
+            raise
+
+    def _dispatch(self, n):
+        while True:
+            with self._cond:
+                while not self._closed and not self._queues[n]:
+                    self._cond.wait()
+                if self._closed:
+                    break
+                cam_id, request = self._queues[n].popitem(last=False)
+            if not self._processes[n].is_alive():
+                self._restart(n, "exited")
+            connection, process = self._connections[n], self._processes[n]
+            analyzer, frame, context = request.payload
+            reply, reason = None, "exited"
+            try:
+                if not self._ready[n]:
+                    # Model loading is not held to the timeout; the sentinel still catches a crash
+                    if connection not in multiprocessing.connection.wait([connection, process.sentinel]):
+                        raise EOFError
+                    connection.recv()
+                    self._ready[n] = True
+                if cam_id not in self._attached[n]:
+                    connection.send(("attach", cam_id, analyzer.config, analyzer.frames_assessed))
+                    self._attached[n].add(cam_id)
+                with self._cond:
+                    request.sent = not request.cancelled
+                if not request.sent:
+                    request.done.set()
+                    continue  # the caller timed out and may have released the frame
+                location = locate_shared_frame(frame)
+                if location is None:
+                    np.ndarray(frame.shape, dtype=np.uint8, buffer=self._slots[n].buf)[...] = frame
+                connection.send(("analyze", cam_id, frame.shape, location, context))
+                ready = multiprocessing.connection.wait([connection, process.sentinel], INFERENCE_TIMEOUT_SECONDS)
+                if connection in ready:
+                    reply = connection.recv()
+                elif not ready:
+                    reason = f"did not answer within {INFERENCE_TIMEOUT_SECONDS}s"
+            except (EOFError, OSError):
+                pass
+            if reply is None:
+                self._restart(n, reason)
+                request.error = RuntimeError(f"pipeline worker {n} {reason}")
+            else:
+                request.result, error = reply
+                if error is not None:
+                    request.error = RuntimeError(error)
+            self.served[cam_id] += 1
+            request.done.set()
+        try:
+            self._connections[n].send(None)
+        except OSError:
+            pass
+
+    def _restart(self, n, reason):
+        process = self._processes[n]
+        if process.is_alive():
+            process.kill()
+        process.join(5)
+        print(f"[ERROR] Pipeline worker {n} {reason} (exit code {process.exitcode}); restarting it, "
+              f"its cameras lose their tracking state")
+        self._connections[n].close()
+        self._spawn(n)
+        self.respawns += 1
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        for process in self._processes:
+            process.join(5)
+            if process.is_alive():
+                process.kill()
+        for slot in self._slots:
+            try:
+                slot.close()
+                slot.unlink()
+            except FileNotFoundError:
+                pass
+        self._slots = []
+
+    def stats(self):
+        with self._cond:
+            cameras = collections.defaultdict(list)
+            for cam_id, worker in self._assigned.items():
+                cameras[worker].append(cam_id)
+            return {
+                "backend": "process",
+                "workers": self.workers,
+                "alive": sum(p.is_alive() for p in self._processes),
+                "respawns": self.respawns,
+                "cameras": {n: cameras[n] for n in range(self.workers)},
+                "pending": {n: len(waiting) for n, waiting in enumerate(self._queues)},
+                "served": dict(self.served),
+            }
+
+
+def pipeline_worker_main(slot_name, connection):
+    """Entry point of a ProcessPipelinePool worker: camera analyzers on this process's own models."""
+    global inference_scheduler, IS_NIGHT_SIMULATION
+    cv2.setNumThreads(1)  # One core per worker; the pool provides the parallelism
+    inference_scheduler = LocalInference()
+    get_model_loader().wait()  # failures surface as per-frame errors
+    connection.send("ready")
+    slot = shared_memory.SharedMemory(name=slot_name)
+    rings = {}  # attached FrameRing segments by name
+    analyzers = {}  # cam_id -> PinnedCameraAnalyzer
+    try:
+        while True:
+            try:
+                task = connection.recv()
+            except EOFError:
+                break  # the web process is gone
+            if task is None:
+                break
+            if task[0] == "attach":
+                _, cam_id, config, frames_assessed = task
+                analyzers[cam_id] = PinnedCameraAnalyzer(config, frames_assessed)
+                continue
+            _, cam_id, shape, location, context = task
+            if location is None:
+                frame = np.ndarray(shape, dtype=np.uint8, buffer=slot.buf)
+            else:
+                ring_name, offset = location
+                if ring_name not in rings:
+                    rings[ring_name] = shared_memory.SharedMemory(name=ring_name)
+                frame = np.ndarray(shape, dtype=np.uint8, buffer=rings[ring_name].buf, offset=offset)
+            try:
+                IS_NIGHT_SIMULATION = context["night"]
+                connection.send((analyzers[cam_id].run(frame, context), None))
+            except Exception as e:
+                connection.send((None, f"{type(e).__name__}: {e}"))
+    finally:
+        frame = None
+        for segment in [slot] + list(rings.values()):
+            try:
+                segment.close()
+            except BufferError:
+                pass
+
+
+inference_scheduler = None
+inference_scheduler_lock = threading.Lock()
+
+
+def get_inference_scheduler():
+    """The shared model pool of this process; pipeline workers install a LocalInference instead."""
+    global inference_scheduler
+    with inference_scheduler_lock:
+        if inference_scheduler is None:
+            inference_scheduler = InferenceScheduler()
+        return inference_scheduler
+
+
+pipeline_pool = None
+pipeline_pool_lock = threading.Lock()
+
+
+def get_pipeline_pool():
+    """Worker processes for camera analysis when INFERENCE_BACKEND is "process"."""
+    global pipeline_pool
+    with pipeline_pool_lock:
+        if pipeline_pool is None:
+            pipeline_pool = ProcessPipelinePool()
+        return pipeline_pool
+
+
+# Camera Configuration
+def parse_zones(entries):
+    """Detection zones from cameras.json: polygons in 1280x720 analysis-frame pixels."""
+    zones = []
+    for n, entry in enumerate(entries or []):
+        name = entry.get("name", f"zone{n}")
+        kind = entry.get("type", "include")
+        if kind not in ("include", "exclude"):
+            raise ValueError(f"zone {name}: type must be include or exclude, not {kind!r}")
+        points = np.array(entry["points"], dtype=np.int32).reshape(-1, 2)
+        if len(points) < 3:
+            raise ValueError(f"zone {name}: a polygon needs at least 3 points")
+        zones.append({"name": name, "type": kind, "points": points})
+    return zones
+
+
+class CameraConfig:
+    """Source, location, risk thresholds and detection zones for one camera."""
+
+    def __init__(self, cam_id, source=0, location=CAMERA_LOCATION_NAME,
+                 proximity_threshold=PROXIMITY_THRESHOLD, risk_male_count=RISK_MALE_COUNT,
+                 panic_speed_threshold=PANIC_SPEED_THRESHOLD, sos_frame_threshold=SOS_FRAME_THRESHOLD,
+                 zones=None, detect_budget_ms=DETECT_BUDGET_MS):
+        self.id = cam_id
+        # USB indices may arrive as strings from JSON or the environment
+        self.source = int(source) if str(source).isdigit() else source
+        self.location = location
+        self.proximity_threshold = proximity_threshold
+        self.risk_male_count = risk_male_count
+        self.panic_speed_threshold = panic_speed_threshold
+        self.sos_frame_threshold = sos_frame_threshold
+        self.zones = zones or []
+        self.detect_budget_ms = detect_budget_ms
+
+    @classmethod
+    def from_dict(cls, entry):
+        thresholds = entry.get("thresholds", {})
+        return cls(
+            entry["id"],
+            source=entry.get("source", 0),
+            location=entry.get("location", CAMERA_LOCATION_NAME),
+            proximity_threshold=thresholds.get("proximity", PROXIMITY_THRESHOLD),
+            risk_male_count=thresholds.get("risk_male_count", RISK_MALE_COUNT),
+            panic_speed_threshold=thresholds.get("panic_speed", PANIC_SPEED_THRESHOLD),
+            sos_frame_threshold=thresholds.get("sos_frames", SOS_FRAME_THRESHOLD),
+            zones=parse_zones(entry.get("zones")),
+            detect_budget_ms=entry.get("detect_budget_ms", DETECT_BUDGET_MS),
+        )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "source": self.source if isinstance(self.source, int) else "stream",
+            "location": self.location,
+            "thresholds": {
+                "proximity": self.proximity_threshold,
+                "risk_male_count": self.risk_male_count,
+                "panic_speed": self.panic_speed_threshold,
+                "sos_frames": self.sos_frame_threshold,
+            },
+            "zones": [{"name": z["name"], "type": z["type"], "points": z["points"].tolist()} for z in self.zones],
+            "detect_budget_ms": self.detect_budget_ms,
+        }
+
+
+def load_camera_configs():
+    """Cameras from CAMERAS_CONFIG_FILE, or one camera from the README environment variables."""
+    if os.path.exists(CAMERAS_CONFIG_FILE):
+        with open(CAMERAS_CONFIG_FILE) as f:
+            entries = json.load(f)
+        print(f"[INFO] Loaded {len(entries)} camera(s) from {CAMERAS_CONFIG_FILE}")
+        return [CameraConfig.from_dict(entry) for entry in entries]
+
+    source = os.getenv("USB_CAMERA_INDEX", "0")
+    droidcam_url = os.getenv("DROIDCAM_URL")
+    if droidcam_url and os.getenv("CAMERA_PRIORITY", "").lower() == "droid":
+        source = droidcam_url
+    return [CameraConfig("cam0", source=source)]
+
+
+# Camera Sources
+def open_video_source(source):
+    """Opened cv2.VideoCapture for a USB index, URL or file, or None; streams get open/read timeouts."""
+    if isinstance(source, str) and "://" in source:
+        cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, CAMERA_STREAM_TIMEOUT_MS,
+                                                        cv2.CAP_PROP_READ_TIMEOUT_MSEC, CAMERA_STREAM_TIMEOUT_MS])
+    else:
+        cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        cap.release()
+        return None
+
+    # Optimize camera settings for best quality
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
+    cap.set(cv2.CAP_PROP_FPS, 30)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Minimize buffer for low latency
+    return cap
+
+
+def probe_camera_indices(indices=CAMERA_PROBE_INDICES, timeout=CAMERA_PROBE_TIMEOUT):
+    """Lowest USB index that opens and delivers a frame, or None.
+
+    Every index is tried at once in its own short-lived process, so a driver
+    that blocks on a missing device costs at most timeout seconds in total,
+    and a probe that is still stuck is killed, which releases its capture
+    handle before the chosen index is reopened.
+    """
+    probes = {index: subprocess.Popen([sys.executable, "-c", CAMERA_PROBE_SCRIPT, str(index)],
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+              for index in indices}
+    deadline = time.time() + timeout
+    found = []
+    for index, proc in probes.items():
+        try:
+            if proc.wait(max(0.0, deadline - time.time())) == 0:
+                found.append(index)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            try:
+                proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                print(f"[WARNING] Camera probe for index {index} did not exit")
+    return min(found) if found else None
+
+
+def fit_frame(img, slot_frame):
+    """Copy a decoded frame into a ring slot, resizing it when the sizes differ."""
+    if img.shape == slot_frame.shape:
+        np.copyto(slot_frame, img)
+    else:
+        cv2.resize(img, (slot_frame.shape[1], slot_frame.shape[0]), dst=slot_frame, interpolation=cv2.INTER_LINEAR)
+
+
+class CameraReader:
+    """Dedicated capture thread for one source that only ever holds the newest frame.
+
+    Each frame is retrieved straight into a slot leased from the camera's
+    FrameRing (sources whose frames are another size are resized into it).
+    The pipeline takes over the newest slot when it is ready for one; a
+    slot it never took is released and counted as dropped, so a slow
+    pipeline never builds up camera lag and a stalled camera never blocks
+    the pipeline. A failed open or read reconnects to the same source with
+    exponential backoff, without giving up. Video files are paced at their
+    own frame rate and looped.
+    """
+
+    def __init__(self, source, name, ring):
+        self.source = source
+        self.name = name
+        self.ring = ring
+        self.state = "connecting"
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+        self.fps = 0.0
+        self.resolution = None
+        self.last_error = None
+        self.decode_ms = 0.0
+        self._cond = threading.Condition()
+        self._front = None  # (slot, frame) lease of the newest frame, until take() hands it over
+        self._back = None  # decode buffer for a source whose frames do not fit a slot as they are
+        self._last_frame_time = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-reader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def take(self, timeout):
+        """The newest frame as a (slot, frame) ring lease the caller must release; (None, None) if none arrives in time."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._front is not None or self._stop.is_set(), timeout)
+            front, self._front = self._front, None
+        return front if front is not None else (None, None)
+
+    def _open(self, first):
+        cap = open_video_source(self.source)
+        if cap is None and first and isinstance(self.source, int):
+            print(f"[WARNING] [{self.name}] Camera {self.source} not available, probing other indices...")
+            index = probe_camera_indices()
+            if index is not None:
+                print(f"[SUCCESS] [{self.name}] Camera opened at index {index}")
+                # Reconnects go back to the index that actually worked
+                self.source = index
+                cap = open_video_source(index)
+        return cap
+
+    def _run(self):
+        delay = CAMERA_RECONNECT_BASE_SECONDS
+        first = True
+        retrying = False
+        while not self._stop.is_set():
+            cap = self._open(first)
+            if retrying:
+                self.reconnects += 1
+            retrying = True
+            if cap is None:
+                self.last_error = "cannot open source"
+                if first:
+                    print(f"[CRITICAL] [{self.name}] No camera found; retrying in the background")
+                first = False
+                self.state = "reconnecting"
+                self._stop.wait(delay)
+                delay = min(delay * 2, CAMERA_RECONNECT_MAX_SECONDS)
+                continue
+            if first:
+                print(f"[INFO] [{self.name}] Camera Resolution: "
+                      f"{int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}")
+            first = False
+            is_file = isinstance(self.source, str) and os.path.isfile(self.source)
+            self._back = None
+            interval = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 25.0) if is_file else 0.0
+            next_due = time.perf_counter()
+            frames = 0
+            try:
+                while not self._stop.is_set():
+                    if not self._read(cap):
+                        break
+                    frames += 1
+                    self.state = "live"
+                    delay = CAMERA_RECONNECT_BASE_SECONDS
+                    if interval:
+                        next_due = max(next_due + interval, time.perf_counter() - interval)
+                        self._stop.wait(max(0.0, next_due - time.perf_counter()))
+            finally:
+                cap.release()
+            if self._stop.is_set():
+                continue
+            if is_file and frames:
+                retrying = False  # a file reached its end: play it again straight away
+                continue
+            # A live source that dropped, or a file that opens but yields no frames, backs off like a failed open
+            self.last_error = "no frames in file" if is_file else "frame read failed"
+            self.state = "reconnecting"
+            print(f"[ERROR] [{self.name}] Camera disconnected or frame read failed; reconnecting in {delay:.1f}s")
+            self._stop.wait(delay)
+            delay = min(delay * 2, CAMERA_RECONNECT_MAX_SECONDS)
+
+    def _read(self, cap):
+        if not cap.grab():
+            return False
+        now = time.time()
+        started = time.perf_counter()
+        slot, frame = self.ring.acquire()
+        if slot is None:
+            # Every slot is in flight: decode over the newest frame nobody has taken yet
+            with self._cond:
+                if self._front is not None:
+                    (slot, frame), self._front = self._front, None
+                    self.frames_dropped += 1
+        if slot is None:
+            # Nothing to decode into; the grabbed frame is skipped but the camera is fine
+            with self._cond:
+                self.frames_dropped += 1
+            return True
+        success, img = cap.retrieve(frame if self._back is None else self._back)
+        if not success or img is None:
+            self.ring.release(slot)
+            return False
+        if img.ctypes.data != frame.ctypes.data:
+            # The source's frames are another size: keep its buffer for next time and resize into the slot
+            self._back = img
+            fit_frame(img, frame)
+        self.decode_ms = 0.9 * self.decode_ms + 0.1 * (time.perf_counter() - started) * 1000.0
+        with self._cond:
+            if self._front is not None:
+                self.ring.release(self._front[0])
+                self.frames_dropped += 1
+            self._front = (slot, frame)
+            self._cond.notify_all()
+        if self._last_frame_time is not None:
+            elapsed = now - self._last_frame_time
+            if elapsed > 0:
+                self.fps = 0.9 * self.fps + 0.1 / elapsed if self.fps else 1.0 / elapsed
+        self._last_frame_time = now
+        self.frames_read += 1
+        self.resolution = [img.shape[1], img.shape[0]]
+        return True
+
+    def stats(self):
+        last = self._last_frame_time
+        return {
+            "state": self.state,
+            "source": self.source if isinstance(self.source, int) else "stream",
+            "fps": round(self.fps, 1),
+            "frames_read": self.frames_read,
+            "dropped": self.frames_dropped,
+            "reconnects": self.reconnects,
+            "resolution": self.resolution,
+            "last_frame_age": round(time.time() - last, 1) if last is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+# Shared Camera Engine
+# One capture + analysis loop runs per camera in the background and publishes
+# its latest annotated frame to a broadcaster. /video_feed clients only
+# subscribe to it, so viewer count never adds capture handles or inference.
+camera_configs = None
+camera_engines = {}
+shared_frame_rings = []
+camera_engines_lock = threading.Lock()
+
+
+def resize_for_analysis(frame):
+    # Adaptive resolution - maintain 16:9, optimize for display
+    height, width = frame.shape[:2]
+    target_width = 1280
+    target_height = int(target_width * 9 / 16)
+
+    # Only process if resolution changed significantly
+    if (width != target_width or height != target_height):
+        frame = cv2.resize(frame, (target_width, target_height), interpolation=cv2.INTER_LINEAR)
+    return frame
+
+
+MJPEG_PART_HEADER = b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n'
+
+
+def encode_mjpeg_part(img, quality=90):
+    ret, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    # join() reads the encoder's buffer directly instead of copying it out with tobytes() first
+    return b''.join((MJPEG_PART_HEADER, buffer, b'\r\n'))
+
+
+def mjpeg_part_jpeg(part):
+    """The JPEG inside an MJPEG part, as a view rather than a copy."""
+    return memoryview(part)[len(MJPEG_PART_HEADER):-2]
+
+
+class FrameRing:
+    """Fixed pool of preallocated analysis-size frame slots with explicit lifetimes.
+
+    Capture writes straight into a free slot and every later stage reads it
+    by reference; the slot returns to the pool when its last holder calls
+    release(). With shared=True the slots live in multiprocessing shared
+    memory, so inference worker processes can read them without a copy.
+    """
+
+    def __init__(self, slots=FRAME_RING_SLOTS, shape=ANALYSIS_FRAME_SHAPE, shared=False):
+        self.shape = shape
+        self.slots = slots
+        self.exhausted = 0
+        self._lock = threading.Lock()
+        self._refs = [0] * slots
+        self._free = collections.deque(range(slots))
+        self._shm = None
+        size = slots * int(np.prod(shape))
+        if shared:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._frames = np.ndarray((slots,) + shape, dtype=np.uint8, buffer=self._shm.buf)
+            shared_frame_rings.append(self)
+            atexit.register(self.close)
+        else:
+            self._frames = np.empty((slots,) + shape, dtype=np.uint8)
+
+    def acquire(self):
+        """Reserve a free slot for writing; returns (slot, frame view) or (None, None) if all are busy."""
+        with self._lock:
+            if not self._free:
+                self.exhausted += 1
+                return None, None
+            slot = self._free.popleft()
+            self._refs[slot] = 1
+            return slot, self._frames[slot]
+
+    def retain(self, slot):
+        with self._lock:
+            self._refs[slot] += 1
+
+    def release(self, slot):
+        with self._lock:
+            self._refs[slot] -= 1
+            if self._refs[slot] == 0:
+                self._free.append(slot)
+
+    def locate(self, frame):
+        """(shared memory name, byte offset) of a whole slot, or None if frame is not one of ours."""
+        if self._shm is None or frame.shape != self.shape:
+            return None
+        offset = frame.ctypes.data - self._frames.ctypes.data
+        if 0 <= offset < self._frames.nbytes and offset % frame.nbytes == 0:
+            return self._shm.name, offset
+        return None
+
+    def close(self):
+        if self._shm is not None:
+            self._frames = None
+            try:
+                self._shm.close()
+                self._shm.unlink()
+            except (FileNotFoundError, BufferError):
+                pass
+            self._shm = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "free": len(self._free),
+                "exhausted": self.exhausted,
+                "shared": self._shm is not None,
+            }
+
+
+def locate_shared_frame(frame):
+    for ring in shared_frame_rings:
+        location = ring.locate(frame)
+        if location is not None:
+            return location
+    return None
+
+
+class Overlay:
+    """Drawing commands recorded during analysis and applied to the frame at encode time.
+
+    Deferring the drawing means analysis never needs its own annotated copy
+    of the frame: the raw slot is read while analysing and drawn on last.
+    """
+
+    def __init__(self):
+        self.ops = []
+
+    def rectangle(self, *args):
+        self.ops.append((cv2.rectangle, args))
+
+    def putText(self, *args):
+        self.ops.append((cv2.putText, args))
+
+    def line(self, *args):
+        self.ops.append((cv2.line, args))
+
+    def apply(self, img):
+        for draw, args in self.ops:
+            draw(img, *args)
+        return img
+
+
+class StateEventFeed:
+    """Delta events for one camera's dashboard state, numbered by a monotonic sequence.
+
+    Recent events are kept in a ring so a client that reconnects with its
+    last seen sequence number can catch up without a full snapshot.
+    """
+
+    def __init__(self, history=STATE_FEED_HISTORY):
+        self._cond = threading.Condition()
+        self._events = collections.deque(maxlen=history)
+        self.seq = 0
+
+    def publish(self, event_type, data):
+        with self._cond:
+            self.seq += 1
+            self._events.append((self.seq, event_type, data))
+            self._cond.notify_all()
+
+    def since(self, last_seq):
+        """Events after last_seq, or None if they have already fallen out of the ring."""
+        with self._cond:
+            if last_seq > self.seq:
+                return None  # Sequence from a previous server run
+            if self._events and last_seq < self._events[0][0] - 1:
+                return None
+            if not self._events and last_seq < self.seq:
+                return None
+            return [event for event in self._events if event[0] > last_seq]
+
+    def wait(self, last_seq, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > last_seq, timeout=timeout)
+            return self.seq
+
+
+class FrameBroadcaster:
+    """Latest-value fan-out of encoded frames to any number of subscribers.
+
+    Publishers overwrite the current frame; subscribers block until a frame
+    newer than the one they last saw arrives. A slow subscriber simply skips
+    the frames it missed instead of holding the publisher back.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._frame_bytes = None
+        self._result = None
+        self.subscribers = 0
+
+    def publish(self, frame_bytes, result=None):
+        with self._cond:
+            self._seq += 1
+            self._frame_bytes = frame_bytes
+            self._result = result
+            self._cond.notify_all()
+
+    def latest(self):
+        with self._cond:
+            return self._seq, self._frame_bytes, self._result
+
+    def wait_for(self, last_seq, timeout=1.0):
+        """Return (seq, frame_bytes, result) once seq > last_seq, or the current value on timeout."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > last_seq, timeout=timeout)
+            return self._seq, self._frame_bytes, self._result
+
+    def subscribe(self):
+        """Generator of MJPEG parts; one per published frame the client keeps up with."""
+        with self._cond:
+            self.subscribers += 1
+        last_seq = 0
+        try:
+            while True:
+                seq, frame_bytes, _ = self.wait_for(last_seq)
+                if seq == last_seq or frame_bytes is None:
+                    continue
+                last_seq = seq
+                yield frame_bytes
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+
+class DropOldestQueue:
+    """Bounded FIFO between pipeline stages.
+
+    put() never blocks: when the queue is full the oldest item is discarded,
+    so a slow downstream stage works on recent frames instead of a backlog.
+    """
+
+    def __init__(self, maxsize=2, on_drop=None):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.on_drop = on_drop  # called with each discarded item, e.g. to free its frame slot
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        dropped = None
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+
+    def get(self, timeout=0.5):
+        """Return the oldest item, or None if nothing arrived within timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout=timeout):
+                return None
+            return self._items.popleft()
+
+    def __len__(self):
+        return len(self._items)
+
+
+# Evidence
+class EvidenceWriterPool:
+    """Fixed set of threads that write evidence files from a bounded queue.
+
+    submit() never blocks: when the disks fall behind, new jobs are dropped
+    and counted rather than stalling the camera that produced them.
+    """
+
+    def __init__(self, workers=EVIDENCE_WORKERS, queue_size=EVIDENCE_QUEUE_SIZE):
+        self._jobs = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self.metrics = {"queued": 0, "written": 0, "dropped": 0, "failed": 0, "max_depth": 0}
+        self._threads = [threading.Thread(target=self._run, name=f"evidence-writer-{i}", daemon=True)
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+        atexit.register(self.close)
+
+    def submit(self, fn, *args):
+        try:
+            self._jobs.put_nowait((fn, args))
+        except queue.Full:
+            with self._lock:
+                self.metrics["dropped"] += 1
+            return False
+        with self._lock:
+            self.metrics["queued"] += 1
+            self.metrics["max_depth"] = max(self.metrics["max_depth"], self._jobs.qsize())
+        return True
+
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics, depth=self._jobs.qsize(), workers=len(self._threads))
+
+    def close(self, timeout=10):
+        """Let queued evidence finish writing at exit."""
+        deadline = time.time() + timeout
+        for _ in self._threads:
+            try:
+                self._jobs.put(None, timeout=max(0.0, deadline - time.time()))
+            except queue.Full:
+                break
+        for t in self._threads:
+            t.join(timeout=max(0.0, deadline - time.time()))
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            fn, args = job
+            try:
+                fn(*args)
+                key = "written"
+            except Exception as e:
+                print(f"[ERROR] Evidence write failed: {e}")
+                key = "failed"
+            with self._lock:
+                self.metrics[key] += 1
+
+
+evidence_pool = None
+evidence_pool_lock = threading.Lock()
+
+
+def get_evidence_pool():
+    global evidence_pool
+    with evidence_pool_lock:
+        if evidence_pool is None:
+            evidence_pool = EvidenceWriterPool()
+        return evidence_pool
+
+
+def write_evidence_clip(path, frames):
+    """Write (timestamp, jpeg) frames as an MJPG AVI at their observed frame rate."""
+    if not frames:
+        return False
+    duration = frames[-1][0] - frames[0][0]
+    fps = min(max((len(frames) - 1) / duration, 1.0), 30.0) if duration > 0 else 10.0
+    writer = None
+    try:
+        for _, jpeg in frames:
+            img = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                continue
+            if writer is None:
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (img.shape[1], img.shape[0]))
+            writer.write(img)
+    finally:
+        if writer is not None:
+            writer.release()
+    return writer is not None
+
+
+def perceptual_hash(jpeg):
+    """64-bit difference hash; near-identical frames differ in only a few bits."""
+    img = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EvidenceStore:
+    """Content-addressed evidence files plus a JSON manifest of incidents.
+
+    Files are named <incident>_<sha256 prefix>.<ext>. A keyframe that is
+    byte-identical to, or within EVIDENCE_PHASH_DISTANCE bits (dHash) of, a
+    recent keyframe from the same camera is not written again; the incident
+    just references the existing file. At startup, after every write and
+    every EVIDENCE_SWEEP_INTERVAL seconds, incidents older than
+    EVIDENCE_RETENTION_DAYS and then the oldest ones over EVIDENCE_QUOTA_MB
+    are evicted. Flagged incidents (under review) are
+    never evicted. The manifest is rewritten at most once every
+    EVIDENCE_MANIFEST_INTERVAL seconds; files a crash left out of it are
+    adopted on the next start. Called from the evidence writer pool threads.
+    """
+
+    PHASH_WINDOW = 50
+
+    def __init__(self, directory=EVIDENCE_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.deduplicated = 0
+        self.manifest_writes = 0
+        self.incidents = collections.OrderedDict()
+        self._dirty = False
+        self._flush_timer = None
+        # Recent keyframes per camera for near-duplicate checks: (phash, file entry)
+        self._recent = collections.defaultdict(lambda: collections.deque(maxlen=self.PHASH_WINDOW))
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._schedule_sweep()
+        atexit.register(self.flush)
+
+    def _load(self):
+        loaded = False
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path) as f:
+                    data = json.load(f)
+                self.incidents = collections.OrderedDict(data.get("incidents", {}))
+                loaded = True
+            except (OSError, ValueError) as e:
+                print(f"[ERROR] Could not read {self.manifest_path}, rebuilding it: {e}")
+
+        # Adopt files the manifest does not list (saved before the store existed, or after
+        # its last write before a crash) so the quota covers them
+        known = {entry["name"] for incident in self.incidents.values() for entry in incident["files"]}
+        adopted = 0
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name in known or name.startswith("manifest.json") or not os.path.isfile(path):
+                continue
+            stem = os.path.splitext(name)[0]
+            incident = self.incidents.setdefault(stem, {
+                "camera": None, "created": os.path.getmtime(path), "flagged": False, "files": []})
+            incident["files"].append({"name": name, "kind": "legacy", "sha256": None,
+                                      "size": os.path.getsize(path)})
+            adopted += 1
+        self.incidents = collections.OrderedDict(
+            sorted(self.incidents.items(), key=lambda item: item[1]["created"]))
+        for incident in self.incidents.values():
+            for entry in incident["files"]:
+                if entry.get("phash") is not None:
+                    self._recent[incident["camera"]].append((entry["phash"], entry))
+        # Evidence that aged out or went over quota while the app was down goes now
+        if self._enforce() or adopted or not loaded:
+            self._save()
+
+    def _schedule_sweep(self):
+        timer = threading.Timer(EVIDENCE_SWEEP_INTERVAL, self._sweep)
+        timer.daemon = True
+        timer.start()
+
+    def _sweep(self):
+        """Apply retention and quota on a timer, so a quiet period still ages evidence out."""
+        try:
+            with self._lock:
+                if self._enforce():
+                    self._save_later()
+        except Exception as e:
+            print(f"[ERROR] Evidence retention sweep failed: {e}")
+        self._schedule_sweep()
+
+    def _save(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"incidents": self.incidents}, f)
+        os.replace(tmp, self.manifest_path)
+        self.manifest_writes += 1
+        self._dirty = False
+
+    def _save_later(self):
+        """Called under the lock: coalesce manifest rewrites into one per interval."""
+        self._dirty = True
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(EVIDENCE_MANIFEST_INTERVAL, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """Write pending manifest changes now."""
+        with self._lock:
+            self._flush_timer = None
+            if self._dirty:
+                self._save()
+
+    def _incident(self, incident_id, camera):
+        return self.incidents.setdefault(incident_id, {
+            "camera": camera, "created": time.time(), "flagged": False, "files": []})
+
+    def add_keyframe(self, incident_id, camera, jpeg):
+        sha = hashlib.sha256(jpeg).hexdigest()
+        phash = perceptual_hash(jpeg)
+        with self._lock:
+            # Lookup, existence check and the new reference share one critical section:
+            # once the duplicate is listed, evicting the original hands the file over to it
+            match = None
+            for recent_hash, entry in self._recent[camera]:
+                if entry["sha256"] == sha or (
+                        phash is not None and bin(recent_hash ^ phash).count("1") <= EVIDENCE_PHASH_DISTANCE):
+                    match = entry
+                    break
+            if match is not None and os.path.exists(os.path.join(self.directory, match["name"])):
+                self._incident(incident_id, camera)["files"].append(dict(match, duplicate=True))
+                self.deduplicated += 1
+                self._enforce()
+                self._save_later()
+                return
+
+        name = f"{incident_id}_{sha[:16]}.jpg"
+        with open(os.path.join(self.directory, name), "wb") as f:
+            f.write(jpeg)
+        entry = {"name": name, "kind": "keyframe", "sha256": sha, "phash": phash, "size": len(jpeg)}
+        with self._lock:
+            self._incident(incident_id, camera)["files"].append(entry)
+            self._recent[camera].append((phash, entry))
+            self._enforce()
+            self._save_later()
+
+    def add_clip(self, incident_id, camera, frames):
+        tmp = os.path.join(self.directory, f".{incident_id}.tmp.avi")
+        if not write_evidence_clip(tmp, frames):
+            return
+        sha = file_sha256(tmp)
+        name = f"{incident_id}_{sha[:16]}.avi"
+        os.replace(tmp, os.path.join(self.directory, name))
+        entry = {"name": name, "kind": "clip", "sha256": sha, "size": os.path.getsize(os.path.join(self.directory, name))}
+        with self._lock:
+            self._incident(incident_id, camera)["files"].append(entry)
+            self._enforce()
+            self._save_later()
+
+    def set_flagged(self, incident_id, flagged):
+        """Mark an incident as under review (never evicted) or release it; False if unknown."""
+        with self._lock:
+            incident = self.incidents.get(incident_id)
+            if incident is None:
+                return False
+            incident["flagged"] = bool(flagged)
+            self._save()
+            return True
+
+    def list(self):
+        with self._lock:
+            return [dict(incident, id=incident_id, bytes=self._incident_bytes(incident))
+                    for incident_id, incident in reversed(self.incidents.items())]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "incidents": len(self.incidents),
+                "flagged": sum(1 for i in self.incidents.values() if i["flagged"]),
+                "bytes": self._total_bytes(),
+                "quota_bytes": EVIDENCE_QUOTA_MB * 1024 * 1024,
+                "evicted": self.evicted,
+                "deduplicated": self.deduplicated,
+                "manifest_writes": self.manifest_writes,
+            }
+
+    @staticmethod
+    def _incident_bytes(incident):
+        return sum(f["size"] for f in incident["files"] if not f.get("duplicate"))
+
+    def _total_bytes(self):
+        return sum(self._incident_bytes(i) for i in self.incidents.values())
+
+    def _enforce(self):
+        """Called under the lock: evict by age, then by quota; returns how many incidents went."""
+        cutoff = time.time() - EVIDENCE_RETENTION_DAYS * 86400
+        quota = EVIDENCE_QUOTA_MB * 1024 * 1024
+        total = self._total_bytes()
+        evicted = 0
+        # Oldest first; manifest order is creation order
+        for incident_id in list(self.incidents):
+            incident = self.incidents[incident_id]
+            if incident["flagged"]:
+                continue
+            if incident["created"] >= cutoff and total <= quota:
+                break
+            total -= self._evict(incident_id)
+            evicted += 1
+        return evicted
+
+    def _evict(self, incident_id):
+        incident = self.incidents.pop(incident_id)
+        freed = 0
+        for entry in incident["files"]:
+            if entry.get("duplicate"):
+                continue
+            heir = next((f for i in self.incidents.values() for f in i["files"] if f["name"] == entry["name"]), None)
+            if heir is not None:
+                # A newer incident was deduplicated onto this file and now owns it
+                heir.pop("duplicate", None)
+                continue
+            try:
+                os.remove(os.path.join(self.directory, entry["name"]))
+            except FileNotFoundError:
+                pass
+            freed += entry["size"]
+            for recent in self._recent.values():
+                for item in [r for r in recent if r[1] is entry]:
+                    recent.remove(item)
+        self.evicted += 1
+        return freed
+
+
+evidence_store = None
+evidence_store_lock = threading.Lock()
+
+
+def get_evidence_store():
+    global evidence_store
+    with evidence_store_lock:
+        if evidence_store is None:
+            evidence_store = EvidenceStore()
+        return evidence_store
+
+
+class EvidenceRecorder:
+    """Per-camera pre-roll buffer and incident clip capture.
+
+    Every streamed frame's JPEG (a view into the full-tier MJPEG part, so
+    nothing is copied or re-encoded) is kept for EVIDENCE_PREROLL_SECONDS.
+    trigger() starts an incident at a frame number; that frame (or the first
+    one after it to reach the encoder) becomes the keyframe, and frames keep
+    being collected for EVIDENCE_POSTROLL_SECONDS, after which pre-roll +
+    post-roll are handed to the writer pool as one clip. Both end up in the
+    EvidenceStore under the incident id.
+    """
+
+    def __init__(self, cam_id):
+        self.cam_id = cam_id
+        self._lock = threading.Lock()
+        self._preroll = collections.deque()
+        self._pending = None
+        self._incident = None
+        self.incidents = 0
+
+    @property
+    def recording(self):
+        return self._pending is not None or self._incident is not None
+
+    def trigger(self, frame_index):
+        """Start an incident unless one is already being recorded; returns its id or None."""
+        with self._lock:
+            if self.recording:
+                return None
+            stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+            incident_id = f"evidence_{path_safe(self.cam_id)}_{stamp}"
+            self._pending = (frame_index, incident_id)
+            self.incidents += 1
+            return incident_id
+
+    def add_frame(self, jpeg, frame_index, now=None):
+        now = time.time() if now is None else now
+        clip = None
+        with self._lock:
+            self._preroll.append((now, jpeg))
+            while self._preroll and self._preroll[0][0] < now - EVIDENCE_PREROLL_SECONDS:
+                self._preroll.popleft()
+
+            if self._pending is not None and frame_index >= self._pending[0]:
+                incident_id = self._pending[1]
+                self._pending = None
+                get_evidence_pool().submit(get_evidence_store().add_keyframe, incident_id, self.cam_id, jpeg)
+                self._incident = {"id": incident_id, "frames": list(self._preroll), "until": now + EVIDENCE_POSTROLL_SECONDS}
+            elif self._incident is not None:
+                self._incident["frames"].append((now, jpeg))
+                if now >= self._incident["until"]:
+                    clip, self._incident = self._incident, None
+        if clip is not None:
+            get_evidence_pool().submit(get_evidence_store().add_clip, clip["id"], self.cam_id, clip["frames"])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "incidents": self.incidents,
+                "recording": self.recording,
+                "preroll_frames": len(self._preroll),
+            }
+
+
+class CameraAnalyzer:
+    """Per-camera analysis state and the detect/assess steps, without capture or output.
+
+    Subclasses decide where alerts, SOS requests, evidence and the frame
+    verdict go: the dashboard (CameraEngine), a CSV (BatchAnalyzer) or back
+    to the parent process (PinnedCameraAnalyzer).
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.cam_id = config.id
+        self.manual_alert_active = False
+        self._manual_alert_since = None
+        self.frames_assessed = 0
+        self.frame_step = 1  # video frames since the previous analysed one; batch --stride raises it
+
+        # Per-camera analysis state (previously locals of generate_frames)
+        self.motion_gate = MotionGate()
+        self.face_detector = CadencedFaceDetector()
+        self.zones = DetectionZones(config.zones, config.detect_budget_ms)
+        self.tracker = FaceTracker()
+        self.proximity = ProximityAnalyzer()
+        self.rules = RuleEngine(config)
+
+    def clock(self):
+        """Time for rule windows and distance trends; batch analysis uses video time instead."""
+        return time.time()
+
+    def log_alert(self, level, message):
+        pass
+
+    def send_sos(self, reason, detail=""):
+        pass
+
+    def save_evidence(self):
+        return None
+
+    def update_state(self, status, message, men_count, women_count):
+        pass
+
+    def analysis_stats(self):
+        return {
+            "tracker": self.tracker.stats(),
+            "detector": self.face_detector.stats(),
+            "zones": self.zones.stats(),
+            "motion_gate": self.motion_gate.stats(),
+            "rules": self.rules.stats(),
+        }
+
+    def detect(self, frame):
+        """Face boxes for one frame, skipping the detector when the scene is static."""
+        if MOTION_GATE_ENABLED:
+            if not self.motion_gate.should_analyze(frame, self.clock()):
+                return [list(b) for b in self.face_detector.bboxes]
+            if self.motion_gate.resumed:
+                self.face_detector.force_detection()
+        return self.face_detector.detect(self._detect_faces, frame, self.frame_step)
+
+    def _detect_faces(self, frame):
+        scheduler = get_inference_scheduler()
+        return self.zones.detect(lambda image: scheduler.detect_faces(self.cam_id, image), frame)
+
+    def analyze(self, frame):
+        """Run the detect and assess stages inline on one frame.
+
+        Returns the annotated frame (drawn in place after resizing) and a
+        dict with the analysis result.
+        """
+        frame = resize_for_analysis(frame)
+        bboxes = self.detect(frame)
+        overlay, result = self.assess(frame, bboxes)
+        return overlay.apply(frame), result
+
+    def assess(self, frame, bboxes):
+        """Classify detected faces and apply the risk rules to one frame.
+
+        The frame is only read; annotations are returned as an Overlay.
+        """
+        config = self.config
+        overlay = Overlay()
+        self.frames_assessed += 1
+        now = self.clock()
+
+        women = []  # (track id, centroid)
+        men_centroids = []
+        boxes = {}
+        track_metrics = {}
+
+        # Only new, uncertain or stale tracks go through genderNet
+        tracks = self.tracker.update(bboxes, self.frame_step)
+        pending = [i for i, track in enumerate(tracks) if self.tracker.needs_classification(track)]
+        if pending:
+            genders = get_inference_scheduler().classify_genders(self.cam_id, frame, [bboxes[i] for i in pending])
+            for i, prediction in zip(pending, genders):
+                if prediction is not None:
+                    self.tracker.add_gender_vote(tracks[i], *prediction)
+
+        female = [i for i, track in enumerate(tracks) if track.gender == 'Female']
+        sos_flags = dict(zip(female, get_inference_scheduler().detect_sos(self.cam_id, frame, [bboxes[i] for i in female])))
+
+        for i, (box, track) in enumerate(zip(bboxes, tracks)):
+            gender = track.gender
+            if gender is None: continue
+            x1, y1, x2, y2 = box
+            centroid = track.centroid
+            boxes[track.id] = box
+            track_metrics[track.id] = {"gender": gender, "speed": track.speed, "sos_gesture": bool(sos_flags.get(i))}
+
+            color = (200, 200, 200) # Neutral Gray default
+            if gender == 'Female':
+                color = (255, 105, 180) # Pink for visibility in UI
+                women.append((track.id, centroid))
+
+                # SOS
+                if sos_flags.get(i):
+                    overlay.rectangle((x1, y1-200), (x2, y1), (0, 255, 255), 1)
+            else:
+                color = (235, 206, 135) # Light Blue
+                men_centroids.append(centroid)
+
+            # Draw clean bounding boxes with better quality
+            overlay.rectangle((x1, y1), (x2, y2), color, 3)
+            overlay.putText(f"{gender} #{track.id}", (x1, y1-10), cv2.FONT_HERSHEY_DUPLEX, 0.8, color, 2)
+
+        # Scenarios
+        num_men = len(men_centroids)
+        num_women = len(women)
+
+        # All woman/man distances in one vectorized pass; metrics also feed the distance trends
+        close_pairs, proximity = self.proximity.update(women, men_centroids, config.proximity_threshold, now)
+        for metrics in proximity:
+            track_metrics[metrics["track"]].update(metrics)
+        if num_women >= 1 and num_men >= config.risk_male_count:
+            for w, m in close_pairs:
+                overlay.line(women[w][1], men_centroids[m], (0, 0, 255), 2)
+
+        # Declarative rules (DEFAULT_RULES or RULES_FILE) decide the status
+        scene = {
+            "num_women": num_women,
+            "num_men": num_men,
+            "night": IS_NIGHT_SIMULATION,
+            "close_pairs": len(close_pairs),
+        }
+        active, started, labels = self.rules.evaluate(scene, track_metrics, now, self.frame_step)
+        frame_status = "SAFE"
+        frame_msg = "All Systems Nominal"
+        if active:
+            frame_status, frame_msg = active[0][0].level, active[0][0].message
+        for rule, subject in started:
+            if rule.log:
+                self.log_alert("INFO" if rule.level == "SAFE" else rule.level, rule.log)
+            # Automatic SOS when the pattern starts (not on every frame it lasts)
+            if rule.sos:
+                self.send_sos(rule.message, f"Counts: {num_women} women, {num_men} men.")
+        for track_id, texts in labels.items():
+            x1, y1 = boxes[track_id][:2]
+            for k, text in enumerate(texts):
+                overlay.putText(text, (x1, y1 - 50 - 30 * k), cv2.FONT_HERSHEY_DUPLEX, 1.0, (0, 0, 255), 3)
+
+        # Manual Alert Override
+        if self.manual_alert_active:
+            frame_status = "CRITICAL"
+            frame_msg = "MANUAL OVERRIDE: ALARM"
+            overlay.putText("MANUAL ALARM", (400, 300), cv2.FONT_HERSHEY_DUPLEX, 2.0, (0, 0, 255), 4)
+
+            # Auto-reset manual alert after MANUAL_ALERT_SECONDS to prevent stuck state
+            if self._manual_alert_since is None:
+                self._manual_alert_since = now
+            elif now - self._manual_alert_since >= MANUAL_ALERT_SECONDS:
+                self.manual_alert_active = False
+                self._manual_alert_since = None
+
+        result = {
+            "frame": self.frames_assessed,
+            "status": frame_status,
+            "message": frame_msg,
+            "men_count": num_men,
+            "women_count": num_women,
+            "faces": len(bboxes),
+            "proximity": proximity,
+            "rules": [rule.name for rule, _ in active],
+        }
+        self.finish_frame(overlay, result)
+        return overlay, result
+
+    def finish_frame(self, overlay, result):
+        """Evidence capture and the dashboard state update for one assessed frame."""
+        # --- EVIDENCE CAPTURE (Auto-Save) ---
+        # A new incident saves this (annotated) frame plus a pre-roll/post-roll clip via the writer pool
+        if result["status"] == "CRITICAL":
+            evidence = self.save_evidence()
+            if evidence is not None:
+                self.log_alert("INFO", f"Evidence Saved: {evidence}")
+                overlay.rectangle((0,0), (1280,720), (0,255,255), 10)
+                result["message"] = "DISPATCHING ALERT... EVID SAVED"
+
+        # Update State
+        self.update_state(result["status"], result["message"], result["men_count"], result["women_count"])
+
+
+class CameraEngine(CameraAnalyzer):
+    """Background capture-and-analysis pipeline for a single camera source.
+
+    Capture, face detection, classification/risk scoring and JPEG encoding
+    each run on their own thread, connected by DropOldestQueue instances.
+    OpenCV releases the GIL inside its calls, so throughput approaches the
+    slowest stage rather than the sum of all of them. With
+    INFERENCE_BACKEND=process, detection and assessment run together in the
+    camera's ProcessPipelinePool worker instead.
+    """
+
+    STAGES = ("capture", "detect", "assess", "encode")
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.state = new_dashboard_state()
+        self.events = StateEventFeed()
+        self.log_lock = threading.Lock()
+        # One broadcaster per quality tier; each tier is encoded once per frame for all its viewers
+        self.broadcasters = {tier: FrameBroadcaster() for tier in STREAM_TIERS}
+        self._tier_buffers = {}
+        self._remote_stats = None  # analysis_stats() reported by the pipeline worker
+        self.frames_processed = 0
+        self.analysis_fps = 0.0
+        self._fps_window_start = time.time()
+        self._fps_window_frames = 0
+        self._threads = []
+        self._stop = threading.Event()
+
+        # Frames travel through the stages as ring slots; dropping one frees its slot
+        self.ring = FrameRing(shared=FRAME_RING_SHARED)
+        self.reader = CameraReader(config.source, self.cam_id, self.ring)
+        self._no_signal = None
+        release_slot = lambda item: self.ring.release(item[0])
+        self.detect_queue = DropOldestQueue(PIPELINE_QUEUE_SIZE, on_drop=release_slot)
+        self.assess_queue = DropOldestQueue(PIPELINE_QUEUE_SIZE, on_drop=release_slot)
+        self.encode_queue = DropOldestQueue(PIPELINE_QUEUE_SIZE, on_drop=release_slot)
+        self.stage_ms = {stage: 0.0 for stage in self.STAGES}
+        self.evidence = EvidenceRecorder(self.cam_id)
+
+    def start(self):
+        if any(t.is_alive() for t in self._threads):
+            return
+        self._stop.clear()
+        self.reader.start()
+        if INFERENCE_BACKEND == "process":
+            # The pipeline worker detects and assesses in one go; "detect" times the whole round trip
+            analysis = [threading.Thread(target=self._stage_loop, args=("detect", self.detect_queue, self._remote_stage),
+                                         name=f"{self.cam_id}-analyze", daemon=True)]
+        else:
+            analysis = [
+                threading.Thread(target=self._stage_loop, args=("detect", self.detect_queue, self._detect_stage),
+                                 name=f"{self.cam_id}-detect", daemon=True),
+                threading.Thread(target=self._stage_loop, args=("assess", self.assess_queue, self._assess_stage),
+                                 name=f"{self.cam_id}-assess", daemon=True),
+            ]
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name=f"{self.cam_id}-capture", daemon=True),
+            *analysis,
+            threading.Thread(target=self._stage_loop, args=("encode", self.encode_queue, self._encode_stage),
+                             name=f"{self.cam_id}-encode", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+        self.reader.stop()
+
+    def pipeline_stats(self):
+        return {
+            "stage_ms": {k: round(v, 2) for k, v in self.stage_ms.items()},
+            "queue_depth": {
+                "detect": len(self.detect_queue),
+                "assess": len(self.assess_queue),
+                "encode": len(self.encode_queue),
+            },
+            "dropped": {
+                "detect": self.detect_queue.dropped,
+                "assess": self.assess_queue.dropped,
+                "encode": self.encode_queue.dropped,
+            },
+            "ring": self.ring.stats(),
+        }
+
+    def _record_stage_time(self, stage, started):
+        # Exponential moving average keeps the number readable on the dashboard
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        self.stage_ms[stage] = 0.9 * self.stage_ms[stage] + 0.1 * elapsed_ms
+
+    def _publish_no_signal(self):
+        """Keep viewers' streams moving with a placeholder while the camera is down."""
+        text = "NO CAMERA DETECTED" if self.reader.frames_read == 0 else "CAMERA RECONNECTING"
+        if self._no_signal is None or self._no_signal[0] != text:
+            error_img = np.zeros((720, 1280, 3), dtype=np.uint8)
+            (width, _), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_DUPLEX, 2, 3)
+            cv2.putText(error_img, text, ((1280 - width) // 2, 300), cv2.FONT_HERSHEY_DUPLEX, 2, (0, 0, 255), 3)
+            self._no_signal = (text, {tier: self.encode_tier(error_img, tier) for tier in STREAM_TIERS})
+        for tier, broadcaster in self.broadcasters.items():
+            broadcaster.publish(self._no_signal[1][tier])
+
+    def _capture_loop(self):
+        while not self._stop.is_set():
+            # The reader decoded the frame into a ring slot already; the lease passes on from here
+            slot, frame = self.reader.take(CAMERA_STALL_SECONDS)
+            if slot is None:
+                if not self._stop.is_set():
+                    self._publish_no_signal()
+                continue
+            self.stage_ms["capture"] = self.reader.decode_ms
+            self.detect_queue.put((slot, frame))
+
+    def _stage_loop(self, stage, inbox, handler):
+        while not self._stop.is_set():
+            item = inbox.get()
+            if item is None:
+                continue
+            started = time.perf_counter()
+            try:
+                handler(item)
+            except Exception as e:
+                print(f"[ERROR] [{self.cam_id}] {stage} stage failed: {e}")
+                self.ring.release(item[0])
+            self._record_stage_time(stage, started)
+
+    def _detect_stage(self, item):
+        slot, frame = item
+        bboxes = self.detect(frame)
+        self.assess_queue.put((slot, frame, bboxes))
+
+    def _assess_stage(self, item):
+        slot, frame, bboxes = item
+        overlay, result = self.assess(frame, bboxes)
+        self.encode_queue.put((slot, frame, overlay, result))
+
+    def _remote_stage(self, item):
+        slot, frame = item
+        manual = (self.manual_alert_active, self._manual_alert_since)
+        context = {"manual_alert": manual, "night": IS_NIGHT_SIMULATION}
+        ops, result, effects, manual_after, self._remote_stats = get_pipeline_pool().analyze(self, frame, context)
+        # Replay what the worker's analyzer recorded, then finish the frame here where evidence and state live
+        self.frames_assessed = result["frame"]
+        if (self.manual_alert_active, self._manual_alert_since) == manual:  # not pressed again meanwhile
+            self.manual_alert_active, self._manual_alert_since = manual_after
+        for effect, *args in effects:
+            if effect == "log":
+                self.log_alert(*args)
+            else:
+                self.send_sos(*args)
+        overlay = Overlay()
+        overlay.ops = ops
+        self.finish_frame(overlay, result)
+        self.encode_queue.put((slot, frame, overlay, result))
+
+    def _encode_stage(self, item):
+        slot, frame, overlay, result = item
+        # Analysis is finished with this slot, so annotations go straight onto it
+        overlay.apply(frame)
+        for tier, broadcaster in self.broadcasters.items():
+            # Tiers nobody is watching cost nothing; full is always kept current for stats and evidence
+            if broadcaster.subscribers or tier == "full":
+                part = self.encode_tier(frame, tier)
+                broadcaster.publish(part, result)
+                if tier == "full":
+                    self.evidence.add_frame(mjpeg_part_jpeg(part), result["frame"], self.clock())
+        self.ring.release(slot)
+
+        self.frames_processed += 1
+        now = time.time()
+        self._fps_window_frames += 1
+        elapsed = now - self._fps_window_start
+        if elapsed >= 1.0:
+            self.analysis_fps = self._fps_window_frames / elapsed
+            self._fps_window_start, self._fps_window_frames = now, 0
+
+    def update_state(self, status, message, men_count, women_count):
+        """Store the latest frame verdict and push only what changed to /api/events listeners."""
+        state = self.state
+        if status != state["status"] or message != state["message"]:
+            state["status"] = status
+            state["message"] = message
+            self.events.publish("status", {"status": status, "message": message})
+        if men_count != state["men_count"] or women_count != state["women_count"]:
+            state["men_count"] = men_count
+            state["women_count"] = women_count
+            self.events.publish("counts", {"men_count": men_count, "women_count": women_count})
+
+    def encode_tier(self, frame, tier):
+        """MJPEG part for frame at a STREAM_TIERS size/quality; resizes into a reused buffer."""
+        size, quality = STREAM_TIERS[tier]
+        if size is not None and (frame.shape[1], frame.shape[0]) != size:
+            buffer = self._tier_buffers.get(tier)
+            if buffer is None:
+                buffer = self._tier_buffers[tier] = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            cv2.resize(frame, size, dst=buffer, interpolation=cv2.INTER_AREA)
+            frame = buffer
+        return encode_mjpeg_part(frame, quality)
+
+    def analysis_stats(self):
+        return self._remote_stats or super().analysis_stats()
+
+    def log_alert(self, level, message):
+        log_alert_to_state(level, message, self)
+
+    def send_sos(self, reason, detail=""):
+        get_sos_notifier().notify(self.cam_id, self.config.location, reason, detail)
+
+    def save_evidence(self):
+        """Start an evidence incident for the current frame; returns its id, or None if one is running."""
+        return self.evidence.trigger(self.frames_assessed)
+
+
+class PinnedCameraAnalyzer(CameraAnalyzer):
+    """A camera's analysis state inside its ProcessPipelinePool worker.
+
+    Alerts and SOS requests are recorded instead of sent. They go back to
+    the web process with the frame's drawing ops and result, where the
+    camera's CameraEngine replays them, captures evidence and updates the
+    dashboard.
+    """
+
+    def __init__(self, config, frames_assessed=0):
+        super().__init__(config)
+        self.frames_assessed = frames_assessed  # continue the parent's numbering after a respawn
+        self.effects = []
+
+    def log_alert(self, level, message):
+        self.effects.append(("log", level, message))
+
+    def send_sos(self, reason, detail=""):
+        self.effects.append(("sos", reason, detail))
+
+    def finish_frame(self, overlay, result):
+        pass  # the parent owns evidence and dashboard state
+
+    def run(self, frame, context):
+        """Detect and assess one frame; returns (drawing ops, result, effects, manual alert state, stats)."""
+        self.manual_alert_active, self._manual_alert_since = context["manual_alert"]
+        self.effects = []
+        overlay, result = self.assess(frame, self.detect(frame))
+        return (overlay.ops, result, self.effects, (self.manual_alert_active, self._manual_alert_since),
+                self.analysis_stats())
+
+
+def get_camera_configs():
+    """Configured cameras by id, in config order; loaded once."""
+    global camera_configs
+    with camera_engines_lock:
+        if camera_configs is None:
+            camera_configs = collections.OrderedDict((c.id, c) for c in load_camera_configs())
+        return camera_configs
+
+
+def get_camera_engine(cam_id=None):
+    """Return the running engine for cam_id (default: first camera), starting it on first use.
+
+    Returns None for ids that are not configured.
+    """
+    configs = get_camera_configs()
+    if cam_id is None:
+        cam_id = next(iter(configs))
+    config = configs.get(cam_id)
+    if config is None:
+        return None
+    with camera_engines_lock:
+        engine = camera_engines.get(cam_id)
+        if engine is None:
+            engine = CameraEngine(config)
+            camera_engines[cam_id] = engine
+        # Pipelines need warm models; until then viewers just wait for the first frame
+        if get_model_loader().ready:
+            engine.start()
+        return engine
+
+
+def start_all_cameras():
+    for cam_id in get_camera_configs():
+        get_camera_engine(cam_id)
+
+
+def start_cameras_when_ready():
+    """Background startup: wait for the models, open the evidence store, then start every camera."""
+    if not get_model_loader().wait():
+        print("[CRITICAL] Models failed to load; camera pipelines not started (see /readyz)")
+        return
+    get_evidence_store()
+    start_all_cameras()
+
+
+# Video Gen
+def generate_frames(cam_id=None, tier="full"):
+    """MJPEG stream for one viewer; frames come from the shared camera engine."""
+    engine = get_camera_engine(cam_id)
+    yield from engine.broadcasters[tier].subscribe()
+
+# Routes
+@app.route('/')
+def index():
+    return render_template_string(HTML_TEMPLATE)
+
+@app.route('/video_feed')
+@app.route('/video_feed/<cam_id>')
+def video_feed(cam_id=None):
+    if cam_id is not None and cam_id not in get_camera_configs():
+        abort(404)
+    tier = request.args.get("tier", "full")
+    if tier not in STREAM_TIERS:
+        abort(400)
+    try:
+        return Response(generate_frames(cam_id, tier), mimetype='multipart/x-mixed-replace; boundary=frame')
+    except Exception as e:
+        print(f"[ERROR] Video feed error: {e}")
+        # Return error frame
+        return Response(generate_error_frame(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+def generate_error_frame():
+    """Generate a placeholder frame when camera unavailable"""
+    # Create a simple error image
+    error_img = np.zeros((720, 1280, 3), dtype=np.uint8)
+    cv2.putText(error_img, "CAMERA NOT AVAILABLE", (350, 200), cv2.FONT_HERSHEY_DUPLEX, 2, (0, 0, 255), 3)
+    cv2.putText(error_img, "Troubleshooting:", (100, 350), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    cv2.putText(error_img, "1. Ensure camera is connected", (120, 400), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (200, 200, 200), 1)
+    cv2.putText(error_img, "2. Check no other app is using camera", (120, 450), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (200, 200, 200), 1)
+    cv2.putText(error_img, "3. Run as Administrator if needed", (120, 500), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (200, 200, 200), 1)
+    cv2.putText(error_img, "4. Restart the application", (120, 550), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (200, 200, 200), 1)
+    
+    while True:
+        ret, buffer = cv2.imencode('.jpg', error_img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        frame_bytes = buffer.tobytes()
+        yield (b'--frame\r\n'
+               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        time.sleep(1)  # Update once per second
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the server is up, whether or not the models are loaded yet."""
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 once both models are loaded and warm, 503 (with per-model status) before."""
+    loader = get_model_loader()
+    cameras = {cam_id: engine.reader.state for cam_id, engine in list(camera_engines.items())}
+    body = {"ready": loader.ready, "models": loader.stats(), "cameras": cameras}
+    return jsonify(body), (200 if loader.ready else 503)
+
+def camera_or_404(cam_id):
+    engine = get_camera_engine(cam_id)
+    if engine is None:
+        abort(404)
+    return engine
+
+@app.route('/api/cameras')
+def list_cameras():
+    cameras = []
+    for cam_id, config in get_camera_configs().items():
+        engine = camera_engines.get(cam_id)
+        camera = config.to_dict()
+        camera["status"] = engine.state["status"] if engine is not None else "OFFLINE"
+        camera["health"] = engine.reader.stats() if engine is not None else None
+        cameras.append(camera)
+    backend = pipeline_pool if INFERENCE_BACKEND == "process" else inference_scheduler
+    inference = backend.stats() if backend is not None else None
+    return jsonify({"cameras": cameras, "inference": inference})
+
+@app.route('/api/stats')
+@app.route('/api/stats/<cam_id>')
+def get_stats(cam_id=None):
+    engine = camera_or_404(cam_id)
+    stats = dict(engine.state)
+    stats["camera"] = engine.cam_id
+    stats["location"] = engine.config.location
+    stats["engine"] = {
+        "frames_processed": engine.frames_processed,
+        "analysis_fps": round(engine.analysis_fps, 1),
+        "source": engine.reader.stats(),
+        "viewers": {tier: b.subscribers for tier, b in engine.broadcasters.items()},
+        "pipeline": engine.pipeline_stats(),
+        **engine.analysis_stats(),
+        "evidence": engine.evidence.stats(),
+    }
+    stats["audit_log"] = get_audit_log().stats()
+    stats["evidence_writer"] = get_evidence_pool().stats()
+    stats["evidence_store"] = get_evidence_store().stats()
+    stats["sos"] = get_sos_notifier().stats()
+    stats["models"] = model_stats()
+    return jsonify(stats)
+
+def sse_message(seq, event_type, data):
+    return f"id: {seq}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/events')
+@app.route('/api/events/<cam_id>')
+def stream_events(cam_id=None):
+    """Server-Sent Events push of dashboard deltas (status, counts, log).
+
+    A new client, or one whose Last-Event-ID is too old to replay, first
+    gets a full "snapshot" event; after that only changes are sent.
+    """
+    engine = camera_or_404(cam_id)
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("since")
+    last_seq = int(last_id) if last_id and last_id.isdigit() else None
+
+    def generate():
+        seq = last_seq
+        backlog = engine.events.since(seq) if seq is not None else None
+        if backlog is None:
+            seq = engine.events.seq
+            snapshot = dict(engine.state, camera=engine.cam_id, location=engine.config.location)
+            yield "retry: 2000\n" + sse_message(seq, "snapshot", snapshot)
+            backlog = engine.events.since(seq) or []
+        while True:
+            for event_seq, event_type, data in backlog:
+                yield sse_message(event_seq, event_type, data)
+                seq = event_seq
+            if engine.events.wait(seq, timeout=SSE_HEARTBEAT_SECONDS) == seq:
+                yield ": keep-alive\n\n"
+            backlog = engine.events.since(seq)
+            if backlog is None:
+                # Fell too far behind the ring; start over from a snapshot
+                seq = engine.events.seq
+                yield sse_message(seq, "snapshot", dict(engine.state, camera=engine.cam_id, location=engine.config.location))
+                backlog = []
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(generate(), mimetype="text/event-stream", headers=headers)
+
+def parse_time_arg(name):
+    """Query-string time: epoch seconds or an ISO date/datetime. 400 on anything else."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        abort(400)
+
+def incident_filters():
+    levels = [l.strip().upper() for l in request.args.get("level", "").split(",") if l.strip()]
+    return {
+        "start": parse_time_arg("start"),
+        "end": parse_time_arg("end"),
+        "levels": levels or None,
+        "camera": request.args.get("camera") or None,
+        "location": request.args.get("location") or None,
+    }
+
+@app.route('/api/incidents')
+def list_incidents():
+    """Full incident history, newest first, with keyset (cursor) pagination."""
+    filters = incident_filters()
+    cursor = None
+    if request.args.get("cursor"):
+        try:
+            ts, row_id = request.args["cursor"].split(":")
+            cursor = (float(ts), int(row_id))
+        except ValueError:
+            abort(400)
+    try:
+        limit = min(max(int(request.args.get("limit", 50)), 1), INCIDENT_PAGE_MAX)
+    except ValueError:
+        abort(400)
+    incidents, next_cursor = get_incident_store().query(cursor=cursor, limit=limit, **filters)
+    return jsonify({"incidents": incidents, "next_cursor": next_cursor})
+
+@app.route('/api/incidents/hourly')
+def incident_hourly_counts():
+    return jsonify({"hours": get_incident_store().hourly_counts(**incident_filters())})
+
+@app.route('/api/evidence')
+def list_evidence():
+    store = get_evidence_store()
+    return jsonify({"incidents": store.list(), "usage": store.stats()})
+
+@app.route('/api/evidence/<incident_id>/flag', methods=['POST'])
+def flag_evidence(incident_id):
+    """Flag an incident for review (kept regardless of quota/age); {"flagged": false} releases it."""
+    flagged = (request.get_json(silent=True) or {}).get("flagged", True)
+    if not get_evidence_store().set_flagged(incident_id, flagged):
+        abort(404)
+    return jsonify({"id": incident_id, "flagged": bool(flagged)})
+
+@app.route('/api/toggle_mode', methods=['POST'])
+def toggle_mode():
+    global IS_NIGHT_SIMULATION
+    IS_NIGHT_SIMULATION = not IS_NIGHT_SIMULATION
+    return jsonify({"is_night": IS_NIGHT_SIMULATION})
+
+@app.route('/api/trigger_manual', methods=['POST'])
+@app.route('/api/trigger_manual/<cam_id>', methods=['POST'])
+def trigger_manual(cam_id=None):
+    engine = camera_or_404(cam_id)
+    engine.manual_alert_active = True
+    engine._manual_alert_since = None  # a repeated press restarts the timer
+    get_sos_notifier().notify(engine.cam_id, engine.config.location, "Manual alert")
+    return jsonify({"status": "triggered"})
+
+# Batch Analysis
+VIDEO_EXTENSIONS = (".avi", ".mp4", ".mkv", ".mov", ".m4v", ".mpg", ".mpeg", ".wmv")
+
+
+class BatchAnalyzer(CameraAnalyzer):
+    """Runs the live pipeline's detect/assess stages over a recorded file.
+
+    Rule windows use the video's own clock, and speeds and frame windows
+    count video frames rather than analysed ones, so results match what the
+    live system would have raised at any stride. Alerts are collected as security_events.csv
+    rows instead of going to the dashboard; no SOS or evidence is produced.
+    """
+
+    def __init__(self, path, stride=1, start=0.0, end=None):
+        name = os.path.basename(path)
+        super().__init__(CameraConfig(os.path.splitext(name)[0], source=path, location=name))
+        self.path = path
+        self.stride = max(1, stride)
+        self.start = start
+        self.end = end
+        self.rows = []
+        self.video_time = 0.0
+        # Wall-clock estimate: the file was last written when the recording ended
+        self.recorded_at = os.path.getmtime(path)
+
+    def clock(self):
+        return self.video_time
+
+    def log_alert(self, level, message):
+        when = datetime.datetime.fromtimestamp(self.recorded_at + self.video_time)
+        self.rows.append([when.strftime("%Y-%m-%d %H:%M:%S"), level, message,
+                          f"{self.config.location}@{self.video_time:.1f}s"])
+
+    def run(self):
+        cap = cv2.VideoCapture(self.path)
+        if not cap.isOpened():
+            raise IOError(f"cannot open {self.path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        total = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        if total > 0:
+            self.recorded_at -= total / fps
+        if self.start:
+            cap.set(cv2.CAP_PROP_POS_MSEC, self.start * 1000.0)
+
+        decoded = analyzed = 0
+        last_analyzed = None
+        started = time.perf_counter()
+        try:
+            while True:
+                success, frame = cap.read()
+                if not success:
+                    break
+                decoded += 1
+                self.video_time = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                if self.end is not None and self.video_time > self.end:
+                    break
+                self.frame_step = decoded - last_analyzed if last_analyzed is not None else 1
+                last_analyzed = decoded
+                self.analyze(frame)
+                analyzed += 1
+                # Skipped frames are grabbed but never decoded
+                for _ in range(self.stride - 1):
+                    if not cap.grab():
+                        break
+                    decoded += 1
+        finally:
+            cap.release()
+        elapsed = time.perf_counter() - started
+        return {
+            "file": self.path,
+            "frames_read": decoded,
+            "frames_analyzed": analyzed,
+            "video_seconds": round(decoded / fps, 2),
+            "seconds": round(elapsed, 2),
+            "analysis_fps": round(analyzed / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def batch_analyze_file(path, stride, start, end):
+    """Worker entry point: (stats, rows) for one file, or an error in stats."""
+    get_model_loader().wait()
+    try:
+        analyzer = BatchAnalyzer(path, stride, start, end)
+        return analyzer.run(), analyzer.rows
+    except Exception as e:
+        return {"file": path, "error": f"{type(e).__name__}: {e}"}, []
+
+
+def find_videos(paths):
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                videos += [os.path.join(root, n) for n in sorted(names) if n.lower().endswith(VIDEO_EXTENSIONS)]
+        else:
+            videos.append(path)
+    return videos
+
+
+def run_batch(paths, output, workers=None, stride=1, start=0.0, end=None):
+    """Analyse recorded files in parallel processes and write their incidents to output.
+
+    Returns True when every file was processed.
+    """
+    videos = find_videos(paths)
+    if not videos:
+        print("[ERROR] No video files found.")
+        return False
+    workers = max(1, min(workers or os.cpu_count() or 1, len(videos)))
+    print(f"[INFO] Analysing {len(videos)} file(s) with {workers} worker(s), every {stride} frame(s)")
+
+    started = time.perf_counter()
+    jobs = [(path, stride, start, end) for path in videos]
+    if workers == 1:
+        results = [batch_analyze_file(*job) for job in jobs]
+    else:
+        # Each worker loads its own models; one model pair per process is enough
+        os.environ["MODEL_POOL_SIZE"] = "1"
+        os.environ["INFERENCE_BACKEND"] = "thread"
+        with multiprocessing.get_context("spawn").Pool(workers, initializer=cv2.setNumThreads, initargs=(1,)) as pool:
+            results = pool.starmap(batch_analyze_file, jobs)
+    elapsed = time.perf_counter() - started
+
+    ok = True
+    with open(output, mode='w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(AuditLogWriter.HEADER)
+        for stats, rows in results:
+            writer.writerows(rows)
+
+    frames = 0
+    video_seconds = 0.0
+    for stats, rows in results:
+        if "error" in stats:
+            ok = False
+            print(f"[ERROR] {stats['file']}: {stats['error']}")
+            continue
+        frames += stats["frames_analyzed"]
+        video_seconds += stats["video_seconds"]
+        print(f"[INFO] {stats['file']}: {stats['frames_analyzed']} frames analysed in {stats['seconds']}s "
+              f"({stats['analysis_fps']} fps), {len(rows)} incident(s)")
+    print(f"[INFO] Total: {frames} frames in {elapsed:.1f}s = {frames / elapsed:.1f} fps, "
+          f"{video_seconds / elapsed:.1f}x real time. Incidents written to {output}")
+    return ok
+
+
+# Model Export
+# --export-gender-onnx converts the Caffe gender_net into GENDER_ONNX_MODEL for the
+# onnx gender engines. Layers come from the prototxt; weights are read from the
+# .caffemodel with a small protobuf decoder, so Caffe itself is not needed.
+def read_prototxt(path):
+    """A Caffe text-format prototxt as nested dicts mapping every key to the list of its values."""
+    with open(path) as f:
+        text = "\n".join(line.split("#", 1)[0] for line in f)
+    tokens = iter(re.findall(r'"[^"]*"|[{}]|[^\s{}:"]+', text))
+
+    def message():
+        fields = collections.defaultdict(list)
+        for key in tokens:
+            if key == "}":
+                break
+            value = next(tokens)
+            if value == "{":
+                value = message()
+            elif value.startswith('"'):
+                value = value[1:-1]
+            else:
+                for cast in (int, float):
+                    try:
+                        value = cast(value)
+                        break
+                    except ValueError:
+                        pass
+            fields[key].append(value)
+        return fields
+
+    return message()
+
+
+def proto_varint(buf, pos):
+    value = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def proto_fields(buf):
+    """(field number, wire type, value) for each field of one serialized protobuf message."""
+    pos = 0
+    while pos < len(buf):
+        key, pos = proto_varint(buf, pos)
+        wire = key & 7
+        if wire == 0:
+            value, pos = proto_varint(buf, pos)
+        elif wire in (1, 2, 5):
+            if wire == 2:
+                size, pos = proto_varint(buf, pos)
+            else:
+                size = 8 if wire == 1 else 4
+            value = buf[pos:pos + size]
+            pos += size
+        else:
+            raise ValueError(f"unsupported protobuf wire type {wire}")
+        yield key >> 3, wire, value
+
+
+def caffe_blob(buf):
+    """One BlobProto as a float32 array, shaped by its BlobShape or the legacy num/channels/height/width."""
+    legacy = {}
+    shape = []
+    data = []
+    for field, wire, value in proto_fields(buf):
+        if field == 5:
+            data.append(np.frombuffer(value, dtype="<f4"))  # packed, or one float per field
+        elif field in (1, 2, 3, 4) and wire == 0:
+            legacy[field] = value
+        elif field == 7:
+            for dim_field, dim_wire, dim in proto_fields(value):
+                if dim_field != 1:
+                    continue
+                if dim_wire == 0:
+                    shape.append(dim)
+                    continue
+                pos = 0
+                while pos < len(dim):
+                    size, pos = proto_varint(dim, pos)
+                    shape.append(size)
+    if not shape:
+        shape = [legacy.get(field, 1) for field in (1, 2, 3, 4)]
+    return np.concatenate(data).reshape(shape) if data else np.zeros(shape, np.float32)
+
+
+def read_caffe_blobs(path):
+    """{layer name: [weight arrays]} from a binary .caffemodel in the V1 or current layer format."""
+    with open(path, "rb") as f:
+        net = memoryview(f.read())
+    blobs = {}
+    for field, _, layer in proto_fields(net):
+        if field not in (2, 100):  # NetParameter.layers (V1) / NetParameter.layer
+            continue
+        name_field, blob_field = (4, 6) if field == 2 else (1, 7)
+        name = None
+        weights = []
+        for layer_field, _, value in proto_fields(layer):
+            if layer_field == name_field:
+                name = bytes(value).decode()
+            elif layer_field == blob_field:
+                weights.append(caffe_blob(value))
+        if weights:
+            blobs[name] = weights
+    return blobs
+
+
+def export_gender_onnx(prototxt=genderProto, caffemodel=genderModel, output=GENDER_ONNX_MODEL):
+    """Write the Caffe gender_net as an ONNX model with a dynamic batch dimension."""
+    try:
+        import onnx
+        from onnx import helper, numpy_helper
+    except ImportError:
+        print("[ERROR] The onnx package is required to export the gender model (pip install onnx)")
+        return False
+    try:
+        net = read_prototxt(prototxt)
+        weights = read_caffe_blobs(caffemodel)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Cannot read {prototxt} / {caffemodel}: {e}")
+        return False
+
+    def param(message, key, default):
+        return message.get(key, [default])[0]
+
+    input_name = param(net, "input", "data")
+    dims = net.get("input_dim") or param(net, "input_shape", {}).get("dim")
+    nodes = []
+    initializers = []
+    tensors = {input_name: input_name}  # Caffe blob name -> ONNX tensor currently holding it
+    last = input_name
+    classes = None
+
+    def add_weight(name, array):
+        initializers.append(numpy_helper.from_array(np.ascontiguousarray(array, dtype=np.float32), name))
+        return name
+
+    for layer in net.get("layers", []) + net.get("layer", []):
+        kind = str(param(layer, "type", "")).upper().replace("_", "")
+        name = param(layer, "name", "")
+        bottom = tensors.get(param(layer, "bottom", last), last)
+        # Every layer writes its own tensor, so Caffe's in-place ReLU/Dropout need no special case
+        out = name
+        if kind == "INPUT":
+            input_name = last = param(layer, "top", name)
+            dims = param(param(layer, "input_param", {}), "shape", {}).get("dim")
+            tensors[input_name] = input_name
+            continue
+        if kind == "CONVOLUTION":
+            conv = param(layer, "convolution_param", {})
+            kernel, stride, pad = param(conv, "kernel_size", 1), param(conv, "stride", 1), param(conv, "pad", 0)
+            inputs = [bottom, add_weight(f"{name}_W", weights[name][0])]
+            if len(weights[name]) > 1:
+                inputs.append(add_weight(f"{name}_b", weights[name][1].reshape(-1)))
+            nodes.append(helper.make_node("Conv", inputs, [out], kernel_shape=[kernel, kernel],
+                                          strides=[stride, stride], pads=[pad] * 4,
+                                          group=param(conv, "group", 1)))
+        elif kind == "RELU":
+            nodes.append(helper.make_node("Relu", [bottom], [out]))
+        elif kind == "POOLING":
+            pool = param(layer, "pooling_param", {})
+            kernel, stride, pad = param(pool, "kernel_size", 1), param(pool, "stride", 1), param(pool, "pad", 0)
+            op = {"MAX": "MaxPool", "AVE": "AveragePool"}[str(param(pool, "pool", "MAX"))]
+            # Caffe rounds pooled sizes up
+            nodes.append(helper.make_node(op, [bottom], [out], kernel_shape=[kernel, kernel],
+                                          strides=[stride, stride], pads=[pad] * 4, ceil_mode=1))
+        elif kind == "LRN":
+            lrn = param(layer, "lrn_param", {})
+            nodes.append(helper.make_node("LRN", [bottom], [out], size=param(lrn, "local_size", 5),
+                                          alpha=float(param(lrn, "alpha", 1.0)),
+                                          beta=float(param(lrn, "beta", 0.75)),
+                                          bias=float(param(lrn, "k", 1.0))))
+        elif kind == "INNERPRODUCT":
+            outputs = classes = param(param(layer, "inner_product_param", {}), "num_output", 0)
+            inputs = [f"{name}_flat", add_weight(f"{name}_W", weights[name][0].reshape(outputs, -1))]
+            if len(weights[name]) > 1:
+                inputs.append(add_weight(f"{name}_b", weights[name][1].reshape(-1)))
+            nodes.append(helper.make_node("Flatten", [bottom], [inputs[0]], axis=1))
+            nodes.append(helper.make_node("Gemm", inputs, [out], transB=1))
+        elif kind == "DROPOUT":
+            tensors[param(layer, "top", name)] = bottom  # identity at inference
+            continue
+        elif kind == "SOFTMAX":
+            nodes.append(helper.make_node("Softmax", [bottom], [out], axis=1))
+        else:
+            print(f"[ERROR] Layer {name} has unsupported type {param(layer, 'type', '?')}")
+            return False
+        tensors[param(layer, "top", name)] = out
+        last = out
+
+    graph = helper.make_graph(
+        nodes, "gender_net",
+        [helper.make_tensor_value_info(input_name, onnx.TensorProto.FLOAT, ["batch"] + list(dims[1:]))],
+        [helper.make_tensor_value_info(last, onnx.TensorProto.FLOAT, ["batch", classes])],
+        initializers)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], producer_name="GuardianEye")
+    model.ir_version = 7  # readable by onnxruntime 1.8 and later
+    onnx.checker.check_model(model)
+    onnx.save(model, output)
+    print(f"[INFO] Wrote {output} from {caffemodel}; run --gender-parity before GENDER_ENGINE=auto will use it")
+    return True
+
+
+# Model Parity
+def labelled_faces(test_dir):
+    """(path, label) for every face crop under test_dir/Male and test_dir/Female."""
+    samples = []
+    for label in GENDER_LIST:
+        folder = os.path.join(test_dir, label)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(folder, name), label))
+    return samples
+
+def check_gender_parity(test_dir, tolerance=GENDER_PARITY_TOLERANCE, batch_size=32):
+    """Accuracy of every available gender engine on a labelled test set, against the Caffe gender_net.
+
+    Results go to GENDER_PARITY_FILE; "auto" only picks a non-reference
+    gender engine that is recorded there as within tolerance.
+    """
+    samples = labelled_faces(test_dir)
+    if not samples:
+        print(f"[ERROR] No labelled faces found; expected {test_dir}/Male/ and {test_dir}/Female/ images")
+        return False
+    engines = {}
+    for name in MODEL_FILES["gender"]:
+        try:
+            engines[name] = create_engine("gender", name)
+        except Exception as e:
+            print(f"[INFO] Skipping gender engine {name}: {e}")
+    if "opencv" not in engines:
+        print("[ERROR] The reference Caffe gender_net could not be loaded")
+        return False
+
+    labels = []
+    predictions = {name: [] for name in engines}
+    elapsed = collections.Counter()
+    for start in range(0, len(samples), batch_size):
+        faces = []
+        for path, label in samples[start:start + batch_size]:
+            face = cv2.imread(path)
+            if face is None:
+                print(f"[WARNING] Cannot read {path}, skipped")
+                continue
+            faces.append(face)
+            labels.append(label)
+        for name, engine in engines.items():
+            started = time.perf_counter()
+            predictions[name].extend(gender for gender, _ in predict_genders(engine, faces))
+            elapsed[name] += time.perf_counter() - started
+
+    labels = np.array(labels)
+    reference = np.array(predictions["opencv"])
+    reference_accuracy = float(np.mean(reference == labels))
+    record = {"test_set": test_dir, "samples": len(labels), "tolerance": tolerance, "engines": {}}
+    ok = True
+    print(f"{'engine':>10} {'accuracy':>9} {'agreement':>10} {'ms/face':>8} {'passed':>7}")
+    for name, predicted in predictions.items():
+        predicted = np.array(predicted)
+        accuracy = float(np.mean(predicted == labels))
+        agreement = float(np.mean(predicted == reference))
+        passed = accuracy >= reference_accuracy - tolerance
+        ok = ok and passed
+        record["engines"][name] = {
+            "model": MODEL_FILES["gender"][name],
+            "signature": model_signature(MODEL_FILES["gender"][name]),
+            "accuracy": round(accuracy, 4),
+            "agreement": round(agreement, 4),
+            "passed": passed,
+        }
+        ms_per_face = elapsed[name] * 1000.0 / len(labels)
+        print(f"{name:>10} {accuracy:>9.3f} {agreement:>10.3f} {ms_per_face:>8.2f} {'yes' if passed else 'NO':>7}")
+    with open(GENDER_PARITY_FILE, "w") as f:
+        json.dump(record, f, indent=2)
+    print(f"[INFO] Parity results written to {GENDER_PARITY_FILE}")
+    return ok
+
+def quantize_gender_model(calibration_dir, output=GENDER_INT8_MODEL, limit=200):
+    """Write an int8 copy of GENDER_ONNX_MODEL, calibrated on face crops from calibration_dir."""
+    if onnxruntime is None:
+        print("[ERROR] onnxruntime is required to quantize the gender model")
+        return False
+    if not os.path.exists(GENDER_ONNX_MODEL):
+        print(f"[ERROR] {GENDER_ONNX_MODEL} not found; create it first with --export-gender-onnx")
+        return False
+    from onnxruntime import quantization
+
+    samples = labelled_faces(calibration_dir)
+    if not samples:
+        print(f"[ERROR] No calibration faces found; expected {calibration_dir}/Male/ and {calibration_dir}/Female/ images")
+        return False
+    samples = samples[::max(1, len(samples) // limit)][:limit]  # spread over both labels
+    input_name = onnxruntime.InferenceSession(GENDER_ONNX_MODEL, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class FaceCalibration(quantization.CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(path for path, _ in samples)
+
+        def get_next(self):
+            for path in self._paths:
+                face = cv2.imread(path)
+                if face is not None:
+                    return {input_name: gender_blob([face])}
+            return None
+
+    quantization.quantize_static(GENDER_ONNX_MODEL, output, FaceCalibration(),
+                                 quant_format=quantization.QuantFormat.QDQ, per_channel=True,
+                                 activation_type=quantization.QuantType.QUInt8,
+                                 weight_type=quantization.QuantType.QInt8)
+    print(f"[INFO] Wrote {output} from {len(samples)} calibration faces; "
+          f"run --gender-parity before GENDER_ENGINE=auto will use it")
+    return True
+
+
+# Benchmarks
+def benchmark_gender_batching(face_counts=(1, 2, 4, 8, 16, 32), runs=20):
+    """Compare per-face genderNet calls with one batched call per frame."""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, size=(720, 1280, 3), dtype=np.uint8)
+    print(f"{'faces':>6} {'per-face ms':>12} {'batched ms':>11} {'speedup':>8}")
+    for count in face_counts:
+        # Lay synthetic 100x100 faces out on a grid so every crop is valid
+        bboxes = []
+        for n in range(count):
+            x1 = 40 + (n % 10) * 120
+            y1 = 40 + (n // 10) * 150
+            bboxes.append([x1, y1, x1 + 100, y1 + 100])
+
+        started = time.perf_counter()
+        for _ in range(runs):
+            for box in bboxes:
+                genderNet.forward(gender_blob([crop_face(frame, box)]))
+        per_face_ms = (time.perf_counter() - started) * 1000.0 / runs
+
+        started = time.perf_counter()
+        for _ in range(runs):
+            classify_genders(genderNet, frame, bboxes)
+        batched_ms = (time.perf_counter() - started) * 1000.0 / runs
+
+        print(f"{count:>6} {per_face_ms:>12.2f} {batched_ms:>11.2f} {per_face_ms / batched_ms:>7.2f}x")
+
+def benchmark_frame_ring(frames=200, camera_size=(1080, 1920)):
+    """Per-frame allocations and time of the frame path with and without the FrameRing.
+
+    Models are not needed: the face boxes are fixed, so only the memory
+    traffic of capture, crops, annotation and encoding is compared.
+    """
+    import tracemalloc
+
+    rng = np.random.default_rng(0)
+    camera_frame = rng.integers(0, 256, size=camera_size + (3,), dtype=np.uint8)
+    bboxes = [[200, 200, 300, 300], [600, 250, 700, 350], [900, 150, 1000, 250]]
+
+    def legacy_frame():
+        frame = camera_frame.copy()  # cap.read() allocating a new array
+        frame = resize_for_analysis(frame)
+        resultImg = frame.copy()  # annotation copy the original get_faces() made
+        for box in bboxes:
+            crop_face(frame, box).copy()  # crops fed to separate blobs
+            cv2.rectangle(resultImg, tuple(box[:2]), tuple(box[2:]), (255, 105, 180), 3)
+        evidence = frame.copy()  # full-frame copy held by the evidence thread
+        ret, buffer = cv2.imencode('.jpg', resultImg, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        return b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n', evidence
+
+    ring = FrameRing(slots=4)
+    raw = np.empty_like(camera_frame)
+
+    def ring_frame():
+        slot, frame = ring.acquire()
+        np.copyto(raw, camera_frame)  # cap.read() into the reused capture buffer
+        cv2.resize(raw, (frame.shape[1], frame.shape[0]), dst=frame, interpolation=cv2.INTER_LINEAR)
+        overlay = Overlay()
+        faces, _ = crop_faces(frame, bboxes)  # views into the slot
+        for box in bboxes:
+            overlay.rectangle(tuple(box[:2]), tuple(box[2:]), (255, 105, 180), 3)
+        overlay.apply(frame)
+        part = encode_mjpeg_part(frame)
+        ring.release(slot)
+        return part
+
+    print(f"{'path':>8} {'ms/frame':>9} {'peak alloc/frame':>17}")
+    for name, run in (("legacy", legacy_frame), ("ring", ring_frame)):
+        run()  # warm up OpenCV's internal buffers
+        tracemalloc.start()
+        peak_total = 0
+        started = time.perf_counter()
+        for _ in range(frames):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - baseline
+        elapsed_ms = (time.perf_counter() - started) * 1000.0 / frames
+        tracemalloc.stop()
+        print(f"{name:>8} {elapsed_ms:>9.2f} {peak_total / frames / 1e6:>14.2f} MB")
+
+def benchmark_proximity(people_counts=(10, 100, 500), runs=50, radius=PROXIMITY_THRESHOLD):
+    """Harassment-rule proximity: nested calculate_distance loops vs broadcasting vs the grid."""
+    rng = np.random.default_rng(0)
+
+    def nested(women, men):
+        close = 0
+        for w_cen in women:
+            for m_cen in men:
+                if calculate_distance(w_cen, m_cen) < radius:
+                    close += 1
+        return close
+
+    print(f"{'people':>6} {'nested ms':>10} {'matrix ms':>10} {'grid ms':>8} {'metrics ms':>11}")
+    for count in people_counts:
+        points = rng.uniform((0, 0), (1280 * count ** 0.5 / 4, 720 * count ** 0.5 / 4), size=(count, 2))
+        women = [tuple(p) for p in points[: count // 2]]
+        men = [tuple(p) for p in points[count // 2:]]
+        tracked = list(enumerate(women))
+
+        timings = []
+        for run in (lambda: nested(women, men),
+                    lambda: pairs_within_radius(women, men, radius, grid_min_pairs=float("inf")),
+                    lambda: pairs_within_radius(women, men, radius, grid_min_pairs=0),
+                    lambda: ProximityAnalyzer().update(tracked, men, radius)):
+            started = time.perf_counter()
+            for _ in range(runs):
+                run()
+            timings.append((time.perf_counter() - started) * 1000.0 / runs)
+        print(f"{count:>6} {timings[0]:>10.3f} {timings[1]:>10.3f} {timings[2]:>8.3f} {timings[3]:>11.3f}")
+
+def read_bench_frames(source, frames):
+    """Up to frames frames from the start of a video file; empty (with an error) if unreadable."""
+    cap = cv2.VideoCapture(source)
+    clips = []
+    while len(clips) < frames:
+        success, img = cap.read()
+        if not success:
+            break
+        clips.append(img)
+    cap.release()
+    if not clips:
+        print(f"[ERROR] Could not read frames from {source}")
+    return clips
+
+def benchmark_pipeline(source=None, output=None, frame_sizes=((640, 360), (1280, 720), (1920, 1080)),
+                       face_counts=(0, 1, 4, 16), frames=60):
+    """Per-stage latency percentiles, end-to-end FPS and memory of one frame through the pipeline.
+
+    Frames are synthetic unless source names a video file, in which case its
+    first frames are looped (resized to each swept size). Face boxes are laid
+    out on a grid so genderNet and the SOS check see exactly face_counts
+    faces. Stages whose model is not loaded are reported as null.
+    Allocations are counted over the real per-frame path (resize, detect,
+    CameraAnalyzer.assess, overlay, encode) by diffing tracemalloc snapshots
+    taken around each frame. With output set, the results are also written
+    there as JSON.
+    """
+    import platform
+    import tracemalloc
+
+    rng = np.random.default_rng(0)
+    clips = None
+    if source:
+        clips = read_bench_frames(source, frames)
+        if not clips:
+            return
+    have_face = faceNet is not None
+    have_gender = genderNet is not None
+
+    def face_grid(count):
+        boxes = []
+        for n in range(count):
+            x1 = 40 + (n % 8) * 150
+            y1 = 260 + (n // 8) * 220  # leave room above for the SOS hand region
+            boxes.append([x1, y1, x1 + 100, y1 + 100])
+        return boxes
+
+    def run_frame(camera_frame, bboxes, analyzer, rules, timings):
+        def timed(stage, fn, *args):
+            started = time.perf_counter()
+            value = fn(*args)
+            if timings is not None:
+                timings[stage].append((time.perf_counter() - started) * 1000.0)
+            return value
+
+        frame = timed("resize", resize_for_analysis, camera_frame)
+        if have_face:
+            timed("get_faces", detect_face_boxes, faceNet, frame)
+        if have_gender and bboxes:
+            started = time.perf_counter()
+            classify_genders(genderNet, frame, bboxes)
+            if timings is not None:
+                timings["gender_per_face"].append((time.perf_counter() - started) * 1000.0 / len(bboxes))
+        timed("sos_gesture", detect_sos_gestures, frame, bboxes)
+        women = [(n, ((b[0] + b[2]) // 2, (b[1] + b[3]) // 2)) for n, b in enumerate(bboxes) if n % 2 == 0]
+        men = [((b[0] + b[2]) // 2, (b[1] + b[3]) // 2) for n, b in enumerate(bboxes) if n % 2]
+
+        def evaluate():
+            _, proximity = analyzer.update(women, men, PROXIMITY_THRESHOLD)
+            tracks = {n: {"gender": "Female" if n % 2 == 0 else "Male", "speed": 5.0, "sos_gesture": False}
+                      for n in range(len(bboxes))}
+            for metrics in proximity:
+                tracks[metrics["track"]].update(metrics)
+            scene = {"num_women": len(women), "num_men": len(men), "night": False, "close_pairs": 0}
+            return rules.evaluate(scene, tracks)
+
+        timed("rules", evaluate)
+        timed("imencode", encode_mjpeg_part, frame)
+
+    def analyze_frame(camera_frame, bboxes, camera):
+        # What a CameraEngine does with one frame; detections come from the grid so the face count is fixed
+        frame = resize_for_analysis(camera_frame)
+        if have_face:
+            camera.detect(frame)
+        overlay, _ = camera.assess(frame, bboxes if have_gender else [])
+        encode_mjpeg_part(overlay.apply(frame))
+
+    # Ignore the tracer's own bookkeeping in the snapshots
+    trace_filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                     tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+
+    results = []
+    print(f"{'size':>10} {'faces':>5} {'fps':>7} {'p50 ms':>7} {'p99 ms':>7} {'blocks/frame':>12} "
+          f"{'alloc/frame':>12} {'peak/frame':>11}")
+    for width, height in frame_sizes:
+        if clips is None:
+            camera_frames = [rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8) for _ in range(4)]
+        else:
+            camera_frames = [cv2.resize(img, (width, height)) for img in clips]
+        for count in face_counts:
+            bboxes = face_grid(count)
+            analyzer = ProximityAnalyzer()
+            rules = RuleEngine(CameraConfig("bench"))
+            for camera_frame in camera_frames[:2]:
+                run_frame(camera_frame, bboxes, analyzer, rules, None)  # warm-up
+
+            timings = collections.defaultdict(list)
+            totals = []
+            for n in range(frames):
+                started = time.perf_counter()
+                run_frame(camera_frames[n % len(camera_frames)], bboxes, analyzer, rules, timings)
+                totals.append((time.perf_counter() - started) * 1000.0)
+
+            # Memory is measured in a separate pass; tracing would distort the timings
+            camera = CameraAnalyzer(CameraConfig("bench"))
+            for camera_frame in camera_frames[:2]:
+                analyze_frame(camera_frame, bboxes, camera)  # warm-up: tracks get their genders
+            memory_frames = min(frames, 20)
+            blocks_total = bytes_total = peak_total = 0
+            tracemalloc.start()
+            for n in range(memory_frames):
+                before = tracemalloc.take_snapshot().filter_traces(trace_filters)
+                tracemalloc.reset_peak()
+                start = tracemalloc.get_traced_memory()[0]
+                analyze_frame(camera_frames[n % len(camera_frames)], bboxes, camera)
+                peak_total += tracemalloc.get_traced_memory()[1] - start
+                after = tracemalloc.take_snapshot().filter_traces(trace_filters)
+                # Blocks and bytes allocated during the frame that it still holds at its end, per source line
+                for stat in after.compare_to(before, "lineno"):
+                    blocks_total += max(stat.count_diff, 0)
+                    bytes_total += max(stat.size_diff, 0)
+                before = after = None
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            stages = {}
+            for stage in ("resize", "get_faces", "gender_per_face", "sos_gesture", "rules", "imencode"):
+                samples = timings.get(stage)
+                stages[stage] = None if not samples else {
+                    "p50": round(float(np.percentile(samples, 50)), 3),
+                    "p90": round(float(np.percentile(samples, 90)), 3),
+                    "p99": round(float(np.percentile(samples, 99)), 3),
+                    "mean": round(float(np.mean(samples)), 3),
+                }
+            fps = 1000.0 * frames / sum(totals)
+            blocks_per_frame = blocks_total / memory_frames
+            alloc_per_frame = bytes_total / memory_frames
+            peak_per_frame = peak_total / memory_frames
+            results.append({
+                "frame_size": [width, height],
+                "faces": count,
+                "frames": frames,
+                "end_to_end_fps": round(fps, 1),
+                "frame_ms": {"p50": round(float(np.percentile(totals, 50)), 3),
+                             "p99": round(float(np.percentile(totals, 99)), 3)},
+                "stages": stages,
+                "alloc_blocks_per_frame": round(blocks_per_frame, 1),
+                "alloc_bytes_per_frame": int(alloc_per_frame),
+                "transient_peak_bytes_per_frame": int(peak_per_frame),
+                "traced_peak_bytes": int(peak),
+            })
+            print(f"{width:>5}x{height:<4} {count:>5} {fps:>7.1f} {np.percentile(totals, 50):>7.2f} "
+                  f"{np.percentile(totals, 99):>7.2f} {blocks_per_frame:>12.1f} {alloc_per_frame / 1e3:>9.1f} KB "
+                  f"{peak_per_frame / 1e6:>8.2f} MB")
+
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    except ImportError:
+        max_rss = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    report = {
+        "benchmark": "pipeline",
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "source": source or "synthetic",
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+        "models": model_stats(),
+        "max_rss_bytes": max_rss,
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Results written to {output}")
+    return report
+
+
+def benchmark_sos(face_counts=(1, 4, 16), frames=30):
+    """Per-face SOS check (the original ROI-by-ROI code) vs the per-frame mask, with a parity check."""
+    rng = np.random.default_rng(0)
+    kernel_args = (cv2.MORPH_ELLIPSE, (5, 5))
+
+    def legacy(frame, face_box):
+        roi_top, roi_bottom, roi_left, roi_right = sos_roi(face_box, frame.shape)
+        roi = frame[roi_top:roi_bottom, roi_left:roi_right]
+        if roi.size == 0: return False
+        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, np.array([0, 40, 80], dtype=np.uint8), np.array([20, 255, 255], dtype=np.uint8))
+        kernel = cv2.getStructuringElement(*kernel_args)
+        mask = cv2.erode(mask, kernel, iterations=2)
+        mask = cv2.dilate(mask, kernel, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for cnt in contours:
+            if cv2.contourArea(cnt) > SOS_MIN_AREA:
+                x, y, w, h = cv2.boundingRect(cnt)
+                if float(w) / h < 1.5: return True
+        return False
+
+    def scene(count):
+        # Grey-blue noise background, skin-toned faces (every other one distant and small),
+        # and a raised "hand" over every fourth face
+        frame = rng.integers(60, 120, size=(720, 1280, 3), dtype=np.uint8)
+        frame[..., 0] = rng.integers(120, 200, size=(720, 1280), dtype=np.uint8)
+        skin = (90, 140, 210)
+        bboxes = []
+        for n in range(count):
+            size = 90 if n % 2 == 0 else 30
+            x1 = 40 + (n % 8) * 150 + int(rng.integers(0, 30))
+            y1 = 300 + (n // 8) * 200
+            bboxes.append([x1, y1, x1 + size, y1 + size])
+            cv2.ellipse(frame, (x1 + size // 2, y1 + size // 2), (size // 2, size // 2), 0, 0, 360, skin, -1)
+            if n % 4 == 0:
+                cv2.ellipse(frame, (x1 + 20, y1 - 120), (30 + int(rng.integers(0, 20)), 60), 0, 0, 360, skin, -1)
+        return frame, bboxes
+
+    print(f"{'faces':>6} {'per-face ms':>12} {'per-frame ms':>13} {'speedup':>8} {'match':>6}")
+    for count in face_counts:
+        scenes = [scene(count) for _ in range(frames)]
+        started = time.perf_counter()
+        expected = [[legacy(frame, box) for box in bboxes] for frame, bboxes in scenes]
+        legacy_ms = (time.perf_counter() - started) * 1000.0 / frames
+        started = time.perf_counter()
+        actual = [detect_sos_gestures(frame, bboxes, scale=1.0) for frame, bboxes in scenes]
+        batched_ms = (time.perf_counter() - started) * 1000.0 / frames
+        match = "yes" if actual == expected else "NO"
+        print(f"{count:>6} {legacy_ms:>12.2f} {batched_ms:>13.2f} {legacy_ms / batched_ms:>7.2f}x {match:>6}")
+
+def benchmark_engines():
+    """forward() latency of every installed engine, including gender engines not yet parity-checked."""
+    print(f"{'model':>7} {'engine':>10} {'threads':>8} {'median ms':>10}")
+    for role in MODEL_FILES:
+        for name in MODEL_FILES[role]:
+            try:
+                engine = create_engine(role, name)
+            except Exception as e:
+                print(f"{role:>7} {name:>10} {'-':>8} {'n/a':>10}  ({e})")
+                continue
+            print(f"{role:>7} {name:>10} {str(engine.threads or 'default'):>8} {time_engine(engine):>10.2f}")
+
+def benchmark_zones(source=None, frames=60):
+    """Full-frame face detection vs. zone tiling: time per pass and faces found.
+
+    The zone is the lower three quarters of the frame (a camera looking down
+    a corridor, ceiling excluded). Face counts are only meaningful with
+    --bench-input footage; synthetic frames measure the cost alone.
+    """
+    if faceNet is None:
+        print("[ERROR] The face detector is not loaded")
+        return
+    if source:
+        clips = [resize_for_analysis(img) for img in read_bench_frames(source, frames)]
+        if not clips:
+            return
+    else:
+        rng = np.random.default_rng(0)
+        clips = [rng.integers(0, 256, size=ANALYSIS_FRAME_SHAPE, dtype=np.uint8) for _ in range(4)]
+    zones = parse_zones([{"name": "floor", "points": [[0, 180], [1279, 180], [1279, 719], [0, 719]]}])
+    detect = lambda image: detect_face_boxes(faceNet, image)
+    modes = [
+        ("full frame", DetectionZones([])),
+        (f"zone, {ZONE_TILE_MIN}px tiles", DetectionZones(zones, budget_ms=float("inf"))),
+        (f"zone, {DETECT_BUDGET_MS:.0f} ms budget", DetectionZones(zones)),
+    ]
+    print(f"{'mode':>22} {'ms/pass':>8} {'faces/frame':>12} {'tile':>5} {'tiles':>6}")
+    for name, zoning in modes:
+        zoning.detect(detect, clips[0])  # warm-up
+        found = 0
+        started = time.perf_counter()
+        for n in range(frames):
+            found += len(zoning.detect(detect, clips[n % len(clips)]))
+        ms = (time.perf_counter() - started) * 1000.0 / frames
+        tile = zoning.tile_size if zoning.zones else "-"
+        print(f"{name:>22} {ms:>8.1f} {found / frames:>12.2f} {tile:>5} {len(zoning._tiles) if zoning.zones else 0:>6}")
+
+
+def benchmark_workers(source=None, max_workers=None, cameras=None, seconds=5.0):
+    """Frames/sec of the process pipeline backend with 1, 2, 4, ... workers, up to max_workers (one per CPU).
+
+    Each camera submits frames back to back from a shared FrameRing, as a
+    live CameraEngine does; by default there are two cameras per worker at
+    the largest count. Frames are synthetic unless source names a video
+    file, and only footage with faces exercises the per-face work.
+    """
+    if source:
+        clips = [resize_for_analysis(img) for img in read_bench_frames(source, 60)]
+        if not clips:
+            return
+    else:
+        rng = np.random.default_rng(0)
+        clips = [rng.integers(0, 256, size=ANALYSIS_FRAME_SHAPE, dtype=np.uint8) for _ in range(4)]
+    ring = FrameRing(slots=len(clips), shared=True)
+    frames = []
+    for clip in clips:
+        _, frame = ring.acquire()
+        frame[...] = clip
+        frames.append(frame)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    worker_counts = sorted({n for n in (1, 2, 4, 8, 16, 32, 64) if n < max_workers} | {max_workers})
+    cameras = cameras or 2 * worker_counts[-1]
+    context = {"manual_alert": (False, None), "night": False}
+    print(f"{cameras} cameras, {seconds:.0f}s per run")
+    print(f"{'workers':>8} {'fps':>8} {'speedup':>8} {'efficiency':>11}")
+    base_fps = None
+    for workers in worker_counts:
+        pool = ProcessPipelinePool(workers)
+        analyzers = [CameraAnalyzer(CameraConfig(f"bench-{n}")) for n in range(cameras)]
+        try:
+            for analyzer in analyzers:  # warm-up; also waits for every worker's models
+                pool.analyze(analyzer, frames[0], context)
+        except Exception as e:
+            print(f"[ERROR] Pipeline workers failed: {e}")
+            pool.close()
+            return
+        done = [0] * cameras
+        deadline = time.perf_counter() + seconds
+
+        def feed(k):
+            while time.perf_counter() < deadline:
+                pool.analyze(analyzers[k], frames[done[k] % len(frames)], context)
+                done[k] += 1
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=feed, args=(k,)) for k in range(cameras)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        fps = sum(done) / (time.perf_counter() - started)
+        pool.close()
+        base_fps = base_fps or fps
+        print(f"{workers:>8} {fps:>8.1f} {fps / base_fps:>7.2f}x {fps / base_fps / workers:>10.0%}")
+    frames = frame = None  # drop the views so the ring's shared memory can be released
+    ring.close()
+
+BENCHMARKS = {
+    "engines": benchmark_engines,
+    "gender": benchmark_gender_batching,
+    "ring": benchmark_frame_ring,
+    "proximity": benchmark_proximity,
+    "pipeline": benchmark_pipeline,
+    "sos": benchmark_sos,
+    "workers": benchmark_workers,
+    "zones": benchmark_zones,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="GuardianEye surveillance server")
+    parser.add_argument("--bench", choices=sorted(BENCHMARKS), help="run a micro-benchmark instead of the server")
+    parser.add_argument("--bench-input", metavar="VIDEO", help="recorded frames for --bench pipeline/zones/workers instead of synthetic ones")
+    parser.add_argument("--bench-json", metavar="FILE", help="write --bench pipeline results to FILE as JSON")
+    parser.add_argument("--import-csv", nargs="+", metavar="CSV", help="import existing security_events CSV files into the incident store and exit")
+    parser.add_argument("--batch", nargs="+", metavar="PATH", help="analyse recorded video files/directories instead of serving cameras")
+    parser.add_argument("--batch-out", default="batch_events.csv", help="CSV file for incidents found by --batch")
+    parser.add_argument("--workers", type=int, help="parallel processes for --batch, or the most for --bench workers (default: one per CPU)")
+    parser.add_argument("--stride", type=int, default=1, help="analyse every Nth frame in --batch mode")
+    parser.add_argument("--start", type=float, default=0.0, help="seek to this many seconds into each file")
+    parser.add_argument("--end", type=float, help="stop at this many seconds into each file")
+    parser.add_argument("--gender-parity", metavar="DIR", help="compare gender engines on labelled face crops in DIR/Male and DIR/Female")
+    parser.add_argument("--quantize-gender", metavar="DIR", help="build the int8 ONNX gender model, calibrated on face crops in DIR")
+    parser.add_argument("--export-gender-onnx", action="store_true", help=f"convert {genderModel} to {GENDER_ONNX_MODEL} and exit")
+    args = parser.parse_args()
+    # OpenCV's thread count is process-wide, so it is set here once rather than per engine
+    if ENGINE_THREADS["opencv"]:
+        cv2.setNumThreads(ENGINE_THREADS["opencv"])
+    if args.bench:
+        if args.bench in ("gender", "pipeline", "zones"):
+            get_model_loader().wait()
+        if args.bench == "pipeline":
+            benchmark_pipeline(source=args.bench_input, output=args.bench_json)
+        elif args.bench == "zones":
+            benchmark_zones(source=args.bench_input)
+        elif args.bench == "workers":
+            benchmark_workers(source=args.bench_input, max_workers=args.workers)
+        else:
+            BENCHMARKS[args.bench]()
+        sys.exit(0)
+    if args.import_csv:
+        for path in args.import_csv:
+            get_incident_store().import_csv(path)
+        sys.exit(0)
+    if args.export_gender_onnx:
+        sys.exit(0 if export_gender_onnx() else 1)
+    if args.quantize_gender:
+        sys.exit(0 if quantize_gender_model(args.quantize_gender) else 1)
+    if args.gender_parity:
+        sys.exit(0 if check_gender_parity(args.gender_parity) else 1)
+    if args.batch:
+        if not get_model_loader().wait():
+            sys.exit(1)
+        ok = run_batch(args.batch, args.batch_out, args.workers, args.stride, args.start, args.end)
+        sys.exit(0 if ok else 1)
 
-if __name__ == '__main__':
     print("\n" + "="*60)
     print("GUARDIANEYE SYSTEM STARTING")
     print("="*60)
-    print("[INFO] Models loaded successfully." if 'faceNet' in dir() else "[WARNING] Models not loaded yet")
+    print("[INFO] Models loading in the background; cameras start once they are ready (see /readyz)")
     print("[INFO] Flask server starting on http://localhost:5000")
     print("[INFO] Press Ctrl+C to stop")
     print("="*60 + "\n")
+
+    # Serve right away; models load in parallel and cameras start analysing as soon as they are warm
+    get_model_loader().start()
+    threading.Thread(target=start_cameras_when_ready, name="camera-startup", daemon=True).start()
     
     try:
         app.run(debug=False, threaded=True, port=5000, use_reloader=False)
@@ -0,0 +1,140 @@
+"""SOSNotifier delivery behaviour against a stub transport: retries, coalescing and outbox replay."""
+import importlib.util
+import json
+import os
+import pathlib
+import time
+
+import pytest
+
+APP_PATH = pathlib.Path(__file__).resolve().parent.parent / "app2 (1).py"
+
+
+@pytest.fixture(scope="module")
+def app():
+    spec = importlib.util.spec_from_file_location("guardian_app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def fast_retries(app, monkeypatch):
+    monkeypatch.setattr(app, "SOS_RETRY_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(app, "SOS_RETRY_MAX_SECONDS", 0.05)
+    monkeypatch.setattr(app, "SOS_THROTTLE_SECONDS", 60)
+
+
+class StubTransport:
+    """Raises the queued failures in order, then accepts every message."""
+
+    name = "stub"
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.sent = []
+
+    def send(self, body):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append(body)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def outbox_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+
+
+def test_retryable_failures_are_retried_until_sent(app, fast_retries, tmp_path):
+    transport = StubTransport([app.SOSDeliveryError("503"), app.SOSDeliveryError("timeout")])
+    notifier = app.SOSNotifier(transport, outbox_dir=str(tmp_path))
+
+    notifier.notify("cam0", "Gate", "Manual Alert")
+
+    assert wait_for(lambda: notifier.stats()["sent"] == 1)
+    assert notifier.stats()["retries"] == 2
+    assert transport.sent[0].startswith("SOS: Manual Alert at Gate")
+    assert wait_for(lambda: outbox_files(tmp_path) == [])
+
+
+def test_unexpected_errors_are_capped_and_dead_lettered(app, fast_retries, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "SOS_MAX_ATTEMPTS", 3)
+    transport = StubTransport([RuntimeError("boom")] * 10)
+    notifier = app.SOSNotifier(transport, outbox_dir=str(tmp_path))
+
+    notifier.notify("cam0", "Gate", "Manual Alert")
+
+    assert wait_for(lambda: notifier.stats()["failed"] == 1)
+    assert notifier.stats()["retries"] == 2
+    assert wait_for(lambda: outbox_files(tmp_path) == [])
+    with open(tmp_path / app.SOSNotifier.DEAD_LETTER_FILE) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 1
+    assert records[0]["attempts"] == 3
+    assert "boom" in records[0]["error"]
+
+
+def test_permanent_failures_are_not_retried(app, fast_retries, tmp_path):
+    transport = StubTransport([app.SOSDeliveryError("401", retryable=False)])
+    notifier = app.SOSNotifier(transport, outbox_dir=str(tmp_path))
+
+    notifier.notify("cam0", "Gate", "Manual Alert")
+
+    assert wait_for(lambda: notifier.stats()["failed"] == 1)
+    assert notifier.stats()["retries"] == 0
+    assert transport.sent == []
+
+
+def test_alerts_inside_the_throttle_window_are_coalesced(app, fast_retries, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "SOS_THROTTLE_SECONDS", 0.3)
+    transport = StubTransport()
+    notifier = app.SOSNotifier(transport, outbox_dir=str(tmp_path))
+
+    notifier.notify("cam0", "Gate", "Manual Alert")
+    notifier.notify("cam0", "Gate", "Surrounded")
+    notifier.notify("cam0", "Gate", "Surrounded")
+    notifier.notify("cam1", "Lobby", "Manual Alert")
+
+    assert wait_for(lambda: len(transport.sent) == 3)
+    assert notifier.stats()["coalesced"] == 2
+    summary = [body for body in transport.sent if "more alert" in body]
+    assert len(summary) == 1
+    assert "2 more alert(s) at Gate" in summary[0]
+    assert "Surrounded x2" in summary[0]
+
+
+def test_outbox_is_replayed_on_start(app, fast_retries, tmp_path):
+    message = {"id": "1700000000.000000_cam0", "camera": "cam0", "reason": "Manual Alert",
+               "body": "SOS: left over from the last run", "attempts": 1, "next_attempt": 1e12}
+    with open(tmp_path / (message["id"] + ".json"), "w") as f:
+        json.dump(message, f)
+    transport = StubTransport()
+
+    notifier = app.SOSNotifier(transport, outbox_dir=str(tmp_path))
+
+    assert wait_for(lambda: notifier.stats()["sent"] == 1)
+    assert transport.sent == ["SOS: left over from the last run"]
+    assert wait_for(lambda: outbox_files(tmp_path) == [])
+
+
+def test_camera_id_cannot_leave_the_outbox(app, fast_retries, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "SOS_RETRY_BASE_SECONDS", 60)
+    outbox = tmp_path / "outbox"
+    transport = StubTransport([app.SOSDeliveryError("503")])
+    notifier = app.SOSNotifier(transport, outbox_dir=str(outbox))
+
+    notifier.notify("../../escape", "Gate", "Manual Alert")
+
+    assert wait_for(lambda: notifier.stats()["retries"] == 1)
+    files = outbox_files(outbox)
+    assert len(files) == 1
+    assert "/" not in files[0] and ".." not in files[0]
+    assert sorted(os.listdir(tmp_path)) == ["outbox"]